@@ -1,7 +1,15 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import os
+import sys
+
 block_cipher = None
 
+# 打包前从 res/img_src 重新生成模板包 res/templates.pack（该文件不入库），模板图片缺失时直接报错终止打包
+sys.path.insert(0, os.path.join(SPECPATH, 'src'))
+from template_pack import buildTemplatePack
+buildTemplatePack()
+
 a = Analysis(
     ['src/start_ui.py'],
     pathex=['src'],
@@ -13,8 +21,14 @@ a = Analysis(
         ('res/styles.qss', '.'),
         # 包含版本历史文件到根目录
         ('res/version_history.txt', '.'),
-        # 包含图片资源文件夹
-        ('res/img_src', 'img_src'),
+        # 包含预解码的模板包（上面打包前生成）
+        ('res/templates.pack', '.'),
+        # 包含模板元数据
+        ('res/template_meta.yaml', '.'),
+        # 包含布局标定配置
+        ('res/layout.yaml', '.'),
+        # 包含各分辨率的坐标表
+        ('res/coord_profiles.yaml', '.'),
     ],
     hiddenimports=[
         # PyQt5相关模块
@@ -55,6 +69,18 @@ a = Analysis(
         'game_param',
         'window_manager',
         'color_detector', 
+        'color_model',  # 颜色分类查找表
+        'frame_source',  # 帧来源
+        'capture_pipeline',  # 持续采集
+        'template_pack',  # 模板包
+        'match_executor',  # 匹配线程池
+        'region_bus',  # 区域订阅总线
+        'motion_detector',  # 运动检测
+        'coord_reader',  # 坐标读取
+        'state_index',  # 界面状态索引
+        'score_log',  # 匹配分数记录
+        'vision_service',  # 识别进程
+        'layout',  # 布局标定
         'keyboard_simulator',
         'img_match',  # 图像匹配模块
         'auto_return',  # 自动回点模块
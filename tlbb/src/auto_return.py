@@ -6,10 +6,37 @@
 
 from window_manager import WindowManager
 from keyboard_simulator import KeyboardSimulator
-from img_match import ImageMatch
+from img_match import ImageMatch, SceneResult
 import time
-import numpy as np
-from game_param import ImagePath, Bbox, kDefaultKey
+from game_param import ImagePath, Point, Bbox, kDefaultKey, kCoordConfig
+from motion_detector import MotionDetector
+from coord_reader import CoordReader
+from state_index import loadStateIndex
+from layout import kLayout
+
+# 以下坐标均为参考窗口下的坐标，使用前经 kLayout 换算到窗口当前的布局（分组见 layout.yaml）
+# 人物所在区域，用于判断人物是否停止移动（center组）
+kPersonBbox = Bbox(395, 573, 651, 648)
+# 自动寻路按钮（minimap组）
+kAutoFindButton = Point(960, 252)
+# 世界地图上的雪原、苗人洞（center组）
+kWorldMapXueYuan = Point(661, 106)
+kWorldMapMiaoRenDong = Point(756, 712)
+# 自动寻路对话框内 x输入框、y输入框、移动按钮相对对话框左上角的偏移（只按缩放换算）
+kAutoFindXInput = Point(44, 10)
+kAutoFindYInput = Point(75, 10)
+kAutoFindMoveButton = Point(113, 10)
+
+# 场景分类用的模板：场景名 -> 场景标签图片
+kSceneTemplates = {
+    "地府": ImagePath.auto_return.di_fu,
+    "雪原": ImagePath.auto_return.xue_yuan,
+    "四象": ImagePath.auto_return.si_xiang,
+    "苗人洞": ImagePath.auto_return.miao_ren_dong,
+}
+# 没有识别出场景时（切换场景的过场、画面被遮挡）的重试次数和间隔，与原来逐个模板查找时的重试一致
+kSceneRetries = 3
+kSceneRetryInterval = 0.5
 
 class AutoReturn:
     def __init__(self, hwnd:int):
@@ -17,6 +44,10 @@ class AutoReturn:
         self.window_manager = WindowManager()
         self.image_match = ImageMatch(self.hwnd)
         self.keyboard_simulator = KeyboardSimulator()
+        self.motion_detector = MotionDetector(kPersonBbox)
+        self.coord_reader = CoordReader()
+        # 离线生成的状态索引，没有时只用模板匹配
+        self.state_index = loadStateIndex()
     
     def _getWindowCenter(self):
         """动态获取窗口中心坐标"""
@@ -64,39 +95,48 @@ class AutoReturn:
         time.sleep(7)
         return True
     
-    def _isPersonStop(self, max_wait_time=180, threshold=5.0):
-        """判断人物是否停止"""
-        bbox = Bbox(395, 573, 651, 648)
-        start_time = time.time()
-
+    def _isPersonStop(self, max_wait_time=180, threshold=None):
+        """判断人物是否停止：持续采样人物所在区域，连续多个低运动样本即判定静止；threshold 只对本次判断生效"""
+        self.motion_detector.bbox = kLayout.bbox(self.hwnd, "center", kPersonBbox)
         print(f"开始持续监测人物是否静止，最长等待{max_wait_time}秒...")
-
-        while time.time() - start_time < max_wait_time:
-            images = []
-
-            for i in range(3):
-                screenshot = self.window_manager.saveBboxImage(self.hwnd, bbox)
-                img_array = np.array(screenshot)
-                images.append(img_array)
-
-                if i < 2:
-                    time.sleep(2)
-
-            diff1 = np.mean(np.abs(images[0].astype(float) - images[1].astype(float)))
-            diff2 = np.mean(np.abs(images[1].astype(float) - images[2].astype(float)))
-            avg_diff = (diff1 + diff2) / 2
-
-            print(f"人物移动检测 - 平均像素差异值: {avg_diff:.2f}")
-
-            if avg_diff < threshold:
-                print(f"人物已静止（差异值 {avg_diff:.2f} < 阈值 {threshold}）")
-                return True
-
-            print(f"人物仍在移动（差异值 {avg_diff:.2f} >= 阈值 {threshold}），继续监测...")
-
+        start_time = time.time()
+        if self.motion_detector.waitUntilStopped(self.hwnd, max_wait_time, threshold):
+            print(f"人物已静止（用时 {time.time() - start_time:.1f} 秒，最近差异值 {self.motion_detector.diffs[-1]:.2f}）")
+            return True
         print(f"等待超时（{max_wait_time}秒），人物可能仍在移动")
         return False
     
+    def _waitArrival(self, x:str, y:str, max_wait_time=100):
+        """等待人物到达目标坐标：能读取游戏坐标时到达即返回、坐标长时间不变视为卡住；
+        读不到坐标时退回运动检测"""
+        if not self.coord_reader.isAvailable():
+            return self._isPersonStop(max_wait_time=max_wait_time)
+        target_x, target_y = int(x), int(y)
+        print(f"开始监测人物坐标，目标({target_x}, {target_y})，最长等待{max_wait_time}秒...")
+        start_time = time.time()
+        last_pos, last_change, failures = None, start_time, 0
+        while time.time() - start_time < max_wait_time:
+            pos = self.coord_reader.read(self.hwnd)
+            now = time.time()
+            if pos is None:
+                failures += 1
+                if failures >= 5:
+                    print("连续无法识别人物坐标，改为运动检测")
+                    return self._isPersonStop(max_wait_time=max(1.0, max_wait_time - (now - start_time)))
+            else:
+                failures = 0
+                if abs(pos[0] - target_x) <= kCoordConfig.tolerance and abs(pos[1] - target_y) <= kCoordConfig.tolerance:
+                    print(f"人物已到达坐标{pos}（用时 {now - start_time:.1f} 秒）")
+                    return True
+                if pos != last_pos:
+                    last_pos, last_change = pos, now
+                elif now - last_change > kCoordConfig.stuck_timeout:
+                    print(f"人物坐标{pos}已{kCoordConfig.stuck_timeout:.0f}秒没有变化，可能被卡住")
+                    return False
+            time.sleep(kCoordConfig.sample_interval)
+        print(f"等待超时（{max_wait_time}秒），人物未到达目标坐标，最后坐标{last_pos}")
+        return False
+    
     def _typeNumber(self, number:str):
         """输入数字"""
         # 按数字前按三下删除
@@ -112,7 +152,7 @@ class AutoReturn:
         """从地府去大理"""
         print("当前人物在地府，开始逃离地府去大理....")
         # 点击自动寻路
-        self.keyboard_simulator.mouseClick(960, 252, self.hwnd)
+        self._clickLayoutPoint("minimap", kAutoFindButton)
         time.sleep(1)
         
         # 双击孟婆
@@ -135,33 +175,17 @@ class AutoReturn:
         
         return True
     
-    def _isInHell(self):
-        """判断是否在地府"""
-        bbox = self.image_match.getImageBbox(ImagePath.auto_return.di_fu, is_print=False)
-        if bbox is not None:
-            return True
-        return False
-    
-    def _isInXueYuan(self):
-        """判断是否在雪原"""
-        bbox = self.image_match.getImageBbox(ImagePath.auto_return.xue_yuan, is_print=False)
-        if bbox is not None:
-            return True
-        return False
-    
-    def _isInSiXiang(self):
-        """判断是否在四象天门阵"""
-        bbox = self.image_match.getImageBbox(ImagePath.auto_return.si_xiang, is_print=False)
-        if bbox is not None:
-            return True
-        return False
-
-    def _isInMiaoRenDong(self):
-        """判断是否在苗人洞"""
-        bbox = self.image_match.getImageBbox(ImagePath.auto_return.miao_ren_dong, is_print=False)
-        if bbox is not None:
-            return True
-        return False
+    def classifyScene(self) -> SceneResult:
+        """在同一帧上判断当前所在场景：先查状态索引，不明确时一次匹配所有场景模板
+        没有识别出任何场景时隔 kSceneRetryInterval 秒重试，最多 kSceneRetries 次"""
+        for attempt in range(kSceneRetries):
+            result = self.image_match.classifyScene(kSceneTemplates, self.state_index)
+            if result.scene is not None or attempt == kSceneRetries - 1:
+                break
+            time.sleep(kSceneRetryInterval)
+        scores = ", ".join(f"{scene}={score:.2f}" for scene, score in result.scores.items())
+        print(f"当前场景: {result.scene or '未知'}（{scores}）")
+        return result
     
     def _clickChuQiao(self):
         """点击出窍"""
@@ -190,18 +214,27 @@ class AutoReturn:
             return True
         return False
     
+    def _clickLayoutPoint(self, group: str, point: Point):
+        """点击参考窗口下的固定坐标（按窗口当前的布局换算）"""
+        pos = kLayout.point(self.hwnd, group, point)
+        self.keyboard_simulator.mouseClick(pos.x, pos.y, self.hwnd)
+    
+    def _dialogPoint(self, bbox: Bbox, offset: Point):
+        """对话框内控件的坐标：对话框左上角 + 按缩放比例换算后的偏移"""
+        dx, dy = kLayout.offset(self.hwnd, "center", offset.x, offset.y)
+        return bbox.left + dx, bbox.top + dy
+    
     def locateAutoReturn(self, x:str, y:str):
         # 获取自动寻路对话框
         print(f"开始局部寻路到坐标: ({x}, {y})")
-        self.keyboard_simulator.mouseClick(960, 252, self.hwnd)
+        self._clickLayoutPoint("minimap", kAutoFindButton)
         time.sleep(1)
         bbox = self.image_match.getImageBbox(ImagePath.auto_return.auto_find)
         if bbox is not None:
-            # 计算两个坐标框的坐标，和移动按钮
-            y1 = y2 = y3 = (int)(bbox.top + 10)
-            x1 = (int)(bbox.left + 44)
-            x2 = (int)(bbox.left + 75)
-            x3 = (int)(bbox.left + 113)
+            # 计算两个坐标框的坐标，和移动按钮（偏移按窗口的缩放比例换算）
+            x1, y1 = self._dialogPoint(bbox, kAutoFindXInput)
+            x2, y2 = self._dialogPoint(bbox, kAutoFindYInput)
+            x3, y3 = self._dialogPoint(bbox, kAutoFindMoveButton)
             print(f"自动寻路对话框坐标: x输入框({x1}, {y1}), y输入框({x2}, {y2}), 移动按钮({x3}, {y3})")
             # 输入x坐标
             self.keyboard_simulator.mouseClick(x1, y1, self.hwnd)
@@ -226,8 +259,9 @@ class AutoReturn:
         if is_return_immediately:
             if self._clickChuQiao():
                 print("点击出窍成功")
-        # 如果在地府，那么执行回点流程，否则不做其他动作
-        if self._isInHell():
+        # 一次场景分类决定本轮分支：如果在地府，那么执行回点流程，否则不做其他动作
+        scene = self.classifyScene().scene
+        if scene == "地府":
             self._escapeHell()
             # 上马
             self._getUpHorse()
@@ -235,7 +269,7 @@ class AutoReturn:
             self.keyboard_simulator.pressKey("m", self.hwnd)
             time.sleep(1)
             # 点击雪原
-            self.keyboard_simulator.mouseClick(661, 106, self.hwnd)
+            self._clickLayoutPoint("center", kWorldMapXueYuan)
             time.sleep(1)
             # 点击屏幕中心
             center_x, center_y = self._getWindowCenter()
@@ -252,8 +286,8 @@ class AutoReturn:
             self._isPersonStop(max_wait_time=300)
             # 局部寻路到指定坐标
             self.locateAutoReturn(x, y)
-            # 等待人物静止
-            self._isPersonStop(max_wait_time=100)
+            # 等待人物到达目标坐标
+            self._waitArrival(x, y, max_wait_time=100)
             # 按键盘esc
             self.keyboard_simulator.pressKey("esc", self.hwnd)
             time.sleep(1)
@@ -268,14 +302,14 @@ class AutoReturn:
             time.sleep(1)
         else:
             print("当前人物不在地府")
-            if self._isInXueYuan():
+            if scene == "雪原":
                 print("当前人物在雪原, 不做任何动作")
             else:
                 print("当前人物不在雪原")
                 
     def toSiXiang(self):
         """去四象天门阵"""
-        if self._isInSiXiang():
+        if self.classifyScene().scene == "四象":
             print("当前人物在四象天门阵.....")
             if self._clickHuiYi():
                 print("点击回营成功")
@@ -293,8 +327,9 @@ class AutoReturn:
         if is_return_immediately:
             if self._clickChuQiao():
                 print("点击出窍成功")
-        # 如果在地府，那么执行回点流程，否则不做其他动作
-        if self._isInHell():
+        # 一次场景分类决定本轮分支：如果在地府，那么执行回点流程，否则不做其他动作
+        scene = self.classifyScene().scene
+        if scene == "地府":
             self._escapeHell()
             # 上马
             self._getUpHorse()
@@ -302,7 +337,7 @@ class AutoReturn:
             self.keyboard_simulator.pressKey("m", self.hwnd)
             time.sleep(1)
             # 点击苗人洞
-            self.keyboard_simulator.mouseClick(756, 712, self.hwnd)
+            self._clickLayoutPoint("center", kWorldMapMiaoRenDong)
             time.sleep(1)
             # 点击屏幕中心
             center_x, center_y = self._getWindowCenter()
@@ -319,8 +354,8 @@ class AutoReturn:
             self._isPersonStop(max_wait_time=300)
             # 局部寻路到指定坐标
             self.locateAutoReturn(x, y)
-            # 等待人物静止
-            self._isPersonStop(max_wait_time=100)
+            # 等待人物到达目标坐标
+            self._waitArrival(x, y, max_wait_time=100)
             # 按键盘esc
             self.keyboard_simulator.pressKey("esc", self.hwnd)
             time.sleep(1)
@@ -335,7 +370,7 @@ class AutoReturn:
             time.sleep(1)
         else:
             print("当前人物不在地府")
-            if self._isInMiaoRenDong():
+            if scene == "苗人洞":
                 print("当前人物在苗人洞，不做任何动作")
             else:
                 print("当前人物不在苗人洞")
@@ -0,0 +1,352 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 持续采集：每个绑定的窗口一个采集线程，按固定帧率截图到"最新帧"槽位
+       检测器不再各自同步截图，而是共享同一帧，截图开销与检测项数量无关
+       共享采集模式下所有窗口共用一个采集线程，每个周期只截一次屏，截图次数与多开数量无关
+"""
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Set, Tuple
+from game_param import Bbox, kCaptureConfig
+from frame_source import Frame, FrameSource, createFrameSource
+
+class CaptureThread(threading.Thread):
+    """单个窗口的采集线程"""
+
+    def __init__(self, hwnd: int, source: FrameSource, fps: int):
+        super().__init__(daemon=True)
+        self.hwnd = hwnd
+        self.source = source
+        self.fps = max(1, fps)
+        self.running = True
+        self._condition = threading.Condition()
+        self._latest: Optional[Frame] = None
+        self._seq = 0
+
+    def run(self):
+        interval = 1.0 / self.fps
+        last_error = None
+        while self.running:
+            start_time = time.time()
+            try:
+                frame = self.source.grabFrame(self.hwnd)
+                if self._seq == 0:
+                    # 第一帧确定窗口尺寸后，按尺寸预分配帧缓冲区
+                    self.source.frame_pool.preallocate(frame.image.shape)
+                with self._condition:
+                    self._seq += 1
+                    frame.seq = self._seq
+                    old_frame = self._latest
+                    self._latest = frame
+                    self._condition.notify_all()
+                # 槽位持有的租约随之释放，没有其他使用者时缓冲区回到池中
+                if old_frame is not None:
+                    old_frame.release()
+                last_error = None
+            except Exception as e:
+                # 连续失败只打印一次，避免刷屏
+                if last_error is None:
+                    print(f"[采集线程] 窗口 {self.hwnd} 截图失败: {e}")
+                last_error = e
+            time.sleep(max(0.0, interval - (time.time() - start_time)))
+
+        with self._condition:
+            old_frame = self._latest
+            self._latest = None
+        if old_frame is not None:
+            old_frame.release()
+
+    def latestFrame(self, max_age: Optional[float] = None, timeout: float = 1.0) -> Optional[Frame]:
+        """获取最新帧并为调用者增加一个租约（用完需 release）；
+        帧比max_age旧时等待新帧，超时返回已有的帧（可能为None）"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while self.running:
+                frame = self._latest
+                if frame is not None and (max_age is None or frame.age() <= max_age):
+                    return frame.lease()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._latest.lease() if self._latest is not None else None
+
+    def stop(self):
+        self.running = False
+
+
+# 最小化窗口的 GetWindowRect 位置，共享采集时跳过
+kMinimizedPos = -32000
+
+class _SharedBuffer:
+    """共享采集的整块截图缓冲区：各窗口的帧都是它的切片视图，作为这些帧的缓冲区池，
+    所有切片帧都释放后才把整块缓冲区还给帧来源的缓冲区池"""
+
+    def __init__(self, buffer: np.ndarray, pool, count: int):
+        self.buffer = buffer
+        self._pool = pool
+        self._count = count
+        self._lock = threading.Lock()
+
+    def release(self, view: np.ndarray):
+        with self._lock:
+            self._count -= 1
+            if self._count > 0:
+                return
+        self._pool.release(self.buffer)
+
+
+class SharedCaptureThread(threading.Thread):
+    """共享采集线程：每个周期截取所有窗口外接矩形的屏幕区域一次，按窗口位置切成零拷贝的帧
+    截的是屏幕上的像素，窗口之间互相遮挡时被遮住的部分会截到其他窗口
+    """
+
+    def __init__(self, source: FrameSource, fps: int):
+        super().__init__(daemon=True)
+        self.source = source
+        self.fps = max(1, fps)
+        self.running = True
+        self._hwnds: Set[int] = set()
+        self._condition = threading.Condition()
+        self._latest: Dict[int, Frame] = {}
+        # 上一周期因最小化或取不到位置而没有截图的窗口，这些窗口由调用方退化为同步截图
+        self._skipped: Set[int] = set()
+        self._seq = 0
+        self._union: Optional[Tuple[int, int, int, int]] = None
+
+    def add(self, hwnd: int):
+        with self._condition:
+            self._hwnds.add(hwnd)
+
+    def remove(self, hwnd: int) -> bool:
+        """移除窗口并释放其最新帧，返回是否还有其他窗口"""
+        with self._condition:
+            self._hwnds.discard(hwnd)
+            self._skipped.discard(hwnd)
+            old_frame = self._latest.pop(hwnd, None)
+            remaining = bool(self._hwnds)
+        if old_frame is not None:
+            old_frame.release()
+        return remaining
+
+    def __contains__(self, hwnd: int) -> bool:
+        return hwnd in self._hwnds
+
+    def _windowRects(self, hwnds: List[int]) -> Dict[int, Tuple[int, int, int, int]]:
+        """各窗口的屏幕位置，跳过最小化和取不到位置的窗口"""
+        rects = {}
+        for hwnd in hwnds:
+            try:
+                rect = tuple(self.source.getWindowRect(hwnd))
+            except Exception:
+                continue
+            if rect[0] <= kMinimizedPos or rect[2] <= rect[0] or rect[3] <= rect[1]:
+                continue
+            rects[hwnd] = rect
+        return rects
+
+    def _capture(self):
+        with self._condition:
+            hwnds = list(self._hwnds)
+        rects = self._windowRects(hwnds)
+        # 跳过的窗口丢弃旧帧，不再让调用方拿到过期帧，也不再占住上一块共享缓冲区
+        with self._condition:
+            self._skipped = {hwnd for hwnd in hwnds if hwnd not in rects}
+            stale_frames = [self._latest.pop(hwnd) for hwnd in self._skipped if hwnd in self._latest]
+            if stale_frames:
+                self._condition.notify_all()
+        for stale_frame in stale_frames:
+            stale_frame.release()
+        if not rects:
+            return
+        # 所有窗口的外接矩形截一次，各窗口的帧是其中的切片
+        bounds = np.array(list(rects.values()))
+        union = (int(bounds[:, 0].min()), int(bounds[:, 1].min()), int(bounds[:, 2].max()), int(bounds[:, 3].max()))
+        shape = (union[3] - union[1], union[2] - union[0], 3)
+        if union != self._union:
+            # 外接矩形变化（窗口移动或增减）后按新尺寸预分配
+            self._union = union
+            self.source.frame_pool.preallocate(shape)
+            print(f"[采集线程] 共享采集区域 {union}，{len(rects)} 个窗口")
+        buffer = self.source.frame_pool.lease(shape)
+        try:
+            self.source.grabScreenInto(union, buffer)
+        except Exception:
+            self.source.frame_pool.release(buffer)
+            raise
+        timestamp = time.time()
+        shared = _SharedBuffer(buffer, self.source.frame_pool, len(rects))
+        with self._condition:
+            self._seq += 1
+            old_frames = []
+            for hwnd, (left, top, right, bottom) in rects.items():
+                view = buffer[top - union[1]:bottom - union[1], left - union[0]:right - union[0]]
+                frame = Frame(view, hwnd, (left, top, right, bottom), timestamp, self._seq, pool=shared)
+                if hwnd not in self._hwnds:
+                    # 截图期间窗口已移除
+                    old_frames.append(frame)
+                    continue
+                old_frame = self._latest.get(hwnd)
+                if old_frame is not None:
+                    old_frames.append(old_frame)
+                self._latest[hwnd] = frame
+            self._condition.notify_all()
+        # 槽位持有的租约随之释放，上一块截图的所有切片都释放后整块缓冲区回到池中
+        for old_frame in old_frames:
+            old_frame.release()
+
+    def run(self):
+        interval = 1.0 / self.fps
+        last_error = None
+        while self.running:
+            start_time = time.time()
+            try:
+                self._capture()
+                last_error = None
+            except Exception as e:
+                # 连续失败只打印一次，避免刷屏
+                if last_error is None:
+                    print(f"[采集线程] 共享采集截图失败: {e}")
+                last_error = e
+            time.sleep(max(0.0, interval - (time.time() - start_time)))
+
+        with self._condition:
+            old_frames = list(self._latest.values())
+            self._latest.clear()
+        for old_frame in old_frames:
+            old_frame.release()
+
+    def latestFrame(self, hwnd: int, max_age: Optional[float] = None, timeout: float = 1.0) -> Optional[Frame]:
+        """获取窗口的最新帧并为调用者增加一个租约（用完需 release），语义同 CaptureThread.latestFrame；
+        窗口在上一周期被跳过（最小化等）时立即返回None"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while self.running and hwnd in self._hwnds:
+                if hwnd in self._skipped:
+                    return None
+                frame = self._latest.get(hwnd)
+                if frame is not None and (max_age is None or frame.age() <= max_age):
+                    return frame.lease()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            frame = self._latest.get(hwnd)
+            return frame.lease() if frame is not None else None
+
+    def stop(self):
+        self.running = False
+
+
+class CapturePipeline(FrameSource):
+    """基于采集线程的帧来源
+    通过 acquire/release 引用计数启停每个窗口的采集线程；
+    没有采集线程的窗口退化为直接从底层帧来源同步截图
+    """
+
+    def __init__(self, source: Optional[FrameSource] = None, fps: int = kCaptureConfig.fps, max_age: Optional[float] = None,
+                 shared: bool = kCaptureConfig.shared):
+        super().__init__()
+        self.source = source if source is not None else createFrameSource(kCaptureConfig.backend)
+        self.fps = fps
+        # 共享采集：所有窗口共用一个 SharedCaptureThread
+        self.shared = shared
+        self._shared_thread: Optional[SharedCaptureThread] = None
+        # 默认允许的最大帧龄为两个采集周期
+        self.max_age = max_age if max_age is not None else 2.0 / max(1, fps)
+        self._threads: Dict[int, CaptureThread] = {}
+        self._ref_counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, hwnd: int):
+        """登记一个使用者，第一个使用者启动该窗口的采集线程"""
+        with self._lock:
+            self._ref_counts[hwnd] = self._ref_counts.get(hwnd, 0) + 1
+            if self.shared:
+                if self._shared_thread is None:
+                    self._shared_thread = SharedCaptureThread(self.source, self.fps)
+                    self._shared_thread.start()
+                    print(f"[采集线程] 共享采集开始，帧率 {self.fps}")
+                if hwnd not in self._shared_thread:
+                    self._shared_thread.add(hwnd)
+                    print(f"[采集线程] 窗口 {hwnd} 加入共享采集")
+            elif hwnd not in self._threads:
+                thread = CaptureThread(hwnd, self.source, self.fps)
+                self._threads[hwnd] = thread
+                thread.start()
+                print(f"[采集线程] 窗口 {hwnd} 开始采集，帧率 {self.fps}")
+
+    def release(self, hwnd: int):
+        """注销一个使用者，最后一个使用者退出时停止采集线程"""
+        with self._lock:
+            count = self._ref_counts.get(hwnd, 0) - 1
+            if count > 0:
+                self._ref_counts[hwnd] = count
+                return
+            self._ref_counts.pop(hwnd, None)
+            thread = self._threads.pop(hwnd, None)
+            shared_thread = None
+            if self._shared_thread is not None and hwnd in self._shared_thread:
+                print(f"[采集线程] 窗口 {hwnd} 退出共享采集")
+                if not self._shared_thread.remove(hwnd):
+                    # 最后一个窗口退出时停止共享采集线程
+                    shared_thread, self._shared_thread = self._shared_thread, None
+        if shared_thread is not None:
+            shared_thread.stop()
+            shared_thread.join(timeout=1.0)
+            print("[采集线程] 共享采集停止")
+        if thread is not None:
+            thread.stop()
+            thread.join(timeout=1.0)
+            print(f"[采集线程] 窗口 {hwnd} 停止采集")
+
+    def stopAll(self):
+        """停止所有采集线程"""
+        with self._lock:
+            threads = list(self._threads.values())
+            if self._shared_thread is not None:
+                threads.append(self._shared_thread)
+                self._shared_thread = None
+            self._threads.clear()
+            self._ref_counts.clear()
+        for thread in threads:
+            thread.stop()
+            thread.join(timeout=1.0)
+
+    def _latestFrame(self, hwnd: int) -> Optional[Frame]:
+        """该窗口采集线程（或共享采集线程）的最新帧，没有在采集时返回None"""
+        thread = self._threads.get(hwnd)
+        if thread is not None:
+            return thread.latestFrame(self.max_age)
+        shared_thread = self._shared_thread
+        if shared_thread is not None and hwnd in shared_thread:
+            return shared_thread.latestFrame(hwnd, self.max_age)
+        return None
+
+    def getWindowRect(self, hwnd: int) -> Tuple[int, int, int, int]:
+        frame = self._latestFrame(hwnd)
+        if frame is not None:
+            # 与帧同一时刻的窗口位置，保证坐标换算一致
+            with frame:
+                return frame.window_rect
+        return self.source.getWindowRect(hwnd)
+
+    def grabFrame(self, hwnd: int) -> Frame:
+        """获取最新帧，调用者持有一个租约，用完需 release()（或使用with语句）"""
+        frame = self._latestFrame(hwnd)
+        if frame is not None:
+            return frame
+        return self.source.grabFrame(hwnd)
+
+    def grab(self, hwnd: int, bbox: Optional[Bbox] = None) -> np.ndarray:
+        frame = self._latestFrame(hwnd)
+        if frame is not None:
+            # 返回拷贝，帧释放后缓冲区会被复用
+            with frame:
+                return np.array(frame.crop(bbox))
+        return self.source.grab(hwnd, bbox)
+
+# 全局采集管线，程序启动时设置为默认帧来源
+kCapturePipeline = CapturePipeline()
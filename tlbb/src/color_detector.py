@@ -3,69 +3,181 @@
 @time: 2025/07/04
 @desc: 获取指定窗口坐标系下的颜色，并进行颜色判断
 """
-import win32gui
-import win32ui
-import win32con
-import win32api
-from PIL import Image, ImageGrab
 import numpy as np
 from typing import Tuple, Optional, List
 import time
 import os
 from datetime import datetime
+from game_param import kCoordProfile, kHPStripNames, Bbox
+from color_model import kColorModel
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+from vision_service import getVisionClient
+from layout import kLayout
+
+# 队伍状态数组的字段：每名队员一行，按字段名向量化读取
+kPartyStateDtype = np.dtype([
+    ("alive", np.bool_),        # 低位血条（1/3）为红色，视为存活
+    ("mid_hp", np.bool_),       # 中位血条（2/3）为红色
+    ("high_hp", np.bool_),      # 高位血条（4/5）为红色
+    ("mp_empty", np.bool_),     # 蓝条为空（目前只有p1配置了蓝条采样点）
+])
+
+# 6人队伍的血条采样点：[队员, 低/中/高, (x, y)]，坐标表见 game_param.CoordProfile
+kPartyHPPoints = kCoordProfile.hp_bar
+
+# 蓝条采样点：[队员索引, x, y]
+kPartyMPPoints = kCoordProfile.mp_bar
+
+# 血条扫描行：p1~p6 加宠物，顺序即 getPartyHPRatio 返回值的顺序
+kPartyHPStripNames = kHPStripNames
+kPartyHPStrips = kCoordProfile.hp_strips
+
+# getPartyState 一次读取的所有采样点：先是血条的 6x3 个点，再是蓝条点
+kPartyPoints = np.concatenate([kPartyHPPoints.reshape(-1, 2), kPartyMPPoints[:, 1:]])
 
 class ColorDetector:
     """颜色检测器"""
     
-    def __init__(self):
-        pass
+    def __init__(self, frame_source: Optional[FrameSource] = None):
+        # 未指定时使用全局默认帧来源
+        self.frame_source = frame_source
     
-    def _getPixelColorAtScreen(self, x: int, y: int) -> Tuple[int, int, int]:
-        """获取屏幕坐标系下：像素的颜色 (RGB)"""
-        try:
-            # 使用PIL截图方式
-            screenshot = ImageGrab.grab(bbox=(x, y, x+1, y+1))
-            pixel_color = screenshot.getpixel((0, 0))
-            # 确保返回RGB三元组
-            if isinstance(pixel_color, tuple) and len(pixel_color) >= 3:
-                return (pixel_color[0], pixel_color[1], pixel_color[2])
-            else:
-                return (0, 0, 0)
-        except Exception as e:
-            print(f"获取屏幕像素颜色失败: {e}")
-            return (0, 0, 0)
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
     
     def getPixelPosColorInWindow(self, hwnd: int, x: int, y: int) -> Tuple[int, int, int]:
         """获取窗口坐标系下：像素的颜色 (RGB)"""
         try:
-            # 获取窗口位置
-            window_rect = win32gui.GetWindowRect(hwnd)
-            window_x, window_y = window_rect[0], window_rect[1]
-            
-            # 转换为屏幕坐标
-            screen_x = window_x + x
-            screen_y = window_y + y
-            
-            return self._getPixelColorAtScreen(screen_x, screen_y)
+            pixel = self._grabWindowRegion(hwnd, Bbox(x, y, x + 1, y + 1))[0, 0]
+            return (int(pixel[0]), int(pixel[1]), int(pixel[2]))
         except Exception as e:
             print(f"获取窗口像素颜色失败: {e}")
             return (0, 0, 0)
     
+    def _grabWindowRegion(self, hwnd: int, bbox: Bbox) -> np.ndarray:
+        """截取窗口坐标系下的一块区域，返回 (H, W, 3) 的RGB数组"""
+        return self._getFrameSource().grab(hwnd, bbox)
+    
+    def getPixelsInWindow(self, hwnd: int, points: np.ndarray) -> np.ndarray:
+        """获取窗口坐标系下：一批像素的颜色 (RGB)
+        只截取包含所有点的最小矩形一次，再用NumPy索引取色
+        Args:
+            hwnd: 窗口句柄
+            points: 形如 (..., 2) 的 (x, y) 坐标数组
+        Returns:
+            np.ndarray: 形如 (..., 3) 的RGB数组，截图失败时全为0
+        """
+        points = np.asarray(points, dtype=np.int32)
+        colors = np.zeros(points.shape[:-1] + (3,), dtype=np.uint8)
+        try:
+            client = getVisionClient()
+            if client is not None and client.serves(hwnd):
+                # 窗口由识别进程负责时，在识别进程的最新帧上取色
+                colors[...] = client.sample(hwnd, points)
+                return colors
+            flat = points.reshape(-1, 2)
+            left, top = flat.min(axis=0)
+            right, bottom = flat.max(axis=0) + 1
+            region = self._grabWindowRegion(hwnd, Bbox(int(left), int(top), int(right), int(bottom)))
+            colors[...] = region[points[..., 1] - top, points[..., 0] - left]
+        except Exception as e:
+            print(f"批量获取窗口像素颜色失败: {e}")
+        return colors
+    
+    def getPartyState(self, hwnd: int) -> np.ndarray:
+        """一次截图获取整个队伍的血条/蓝条状态
+        Returns:
+            np.ndarray: 长度为6的结构化数组，字段见 kPartyStateDtype
+        """
+        return self._partyStateFromColors(self.getPixelsInWindow(hwnd, kLayout.points(hwnd, "party", kPartyPoints)))
+    
+    def getPartyStateInFrame(self, frame: Frame) -> np.ndarray:
+        """从已有的帧中读取整个队伍的血条/蓝条状态（不截图），返回值同 getPartyState"""
+        points = kLayout.points(frame.hwnd, "party", kPartyPoints, frame.width, frame.height)
+        return self._partyStateFromColors(frame.image[points[:, 1], points[:, 0]])
+    
+    def _partyStateFromColors(self, colors: np.ndarray) -> np.ndarray:
+        """colors 为 kPartyPoints 各采样点的RGB"""
+        hp_colors = colors[:kPartyHPPoints.shape[0] * 3].reshape(kPartyHPPoints.shape[0], 3, 3)
+        mp_colors = colors[kPartyHPPoints.shape[0] * 3:]
+        
+        is_red = self.isRedArray(hp_colors)
+        state = np.zeros(kPartyHPPoints.shape[0], dtype=kPartyStateDtype)
+        state["alive"] = is_red[:, 0]
+        state["mid_hp"] = is_red[:, 1]
+        state["high_hp"] = is_red[:, 2]
+        state["mp_empty"][kPartyMPPoints[:, 0]] = self.isEmptyArray(mp_colors)
+        return state
+    
+    def getPartyHPRatio(self, hwnd: int) -> np.ndarray:
+        """一次截图扫描 p1~p6 和宠物的整条血条，返回血量比例（用于日志，治疗逻辑仍按三个采样点判断）
+        Returns:
+            np.ndarray: 长度为7的 float32 数组（0.0~1.0），顺序见 kPartyHPStripNames，截图失败时全为0
+        """
+        try:
+            client = getVisionClient()
+            if client is not None and client.serves(hwnd):
+                return client.hpRatio(hwnd)
+            with self._getFrameSource().grabFrame(hwnd) as frame:
+                return self.getPartyHPRatioInFrame(frame)
+        except Exception as e:
+            print(f"扫描血条比例失败: {e}")
+        return np.zeros(len(kPartyHPStripNames), dtype=np.float32)
+    
+    def getPartyHPRatioInFrame(self, frame: Frame) -> np.ndarray:
+        """从已有的帧中扫描血条比例（不截图），返回值同 getPartyHPRatio
+        血条从左往右填充，逐列判断是否为红色，最右侧红色列即红/空分界，比例 = 分界位置 / 满血宽度（kPartyHPStrips 标定）
+        """
+        ratios = np.zeros(len(kPartyHPStripNames), dtype=np.float32)
+        strips = kLayout.bboxes(frame.hwnd, "party", kPartyHPStrips, frame.width, frame.height)
+        for i, (strip_left, strip_top, strip_right, _) in enumerate(strips):
+            row = frame.image[strip_top, max(strip_left, 0):strip_right]
+            is_red = self.isRedArray(row)
+            if not is_red.any():
+                continue
+            # 反向 argmax 找到最后一个红色列
+            last_red = is_red.size - int(np.argmax(is_red[::-1]))
+            ratios[i] = min(1.0, last_red / (strip_right - strip_left))
+        return ratios
+    
+    def calibrateHPStrips(self, frame: Frame) -> np.ndarray:
+        """在全队（含宠物）满血的帧上标定血条扫描行：从每条血条的采样点（p1~p6 为低位采样点，宠物为 pet_hp）
+        向两侧找连续的红色列，得到满血时血条的起止位置
+        Returns:
+            np.ndarray: 参考窗口坐标系下的新 hp_strips，采样点不是红色的行保留原值
+        """
+        transform = kLayout.transformFor(frame.hwnd, frame.width, frame.height)
+        anchors = np.concatenate([kPartyHPPoints[:, 0], kCoordProfile.pet_hp[np.newaxis]])
+        strips = kPartyHPStrips.copy()
+        for i, (x, y) in enumerate(transform.points("party", anchors)):
+            if not (0 <= x < frame.width and 0 <= y < frame.height):
+                print(f"血条 {kPartyHPStripNames[i]} 的采样点 ({x}, {y}) 在画面外，保留原扫描行")
+                continue
+            is_red = self.isRedArray(frame.image[y])
+            if not is_red[x]:
+                print(f"血条 {kPartyHPStripNames[i]} 的采样点 ({x}, {y}) 不是红色，保留原扫描行")
+                continue
+            not_red = np.flatnonzero(~is_red)
+            left = int(not_red[not_red < x].max(initial=-1)) + 1
+            right = int(not_red[not_red > x].min(initial=is_red.size))
+            strips[i] = transform.referencePoints("party", [[left, y], [right, y + 1]]).reshape(4)
+        return strips
+    
+    def isEmptyArray(self, colors: np.ndarray) -> np.ndarray:
+        """向量化版本的 isEmpty，colors 形如 (..., 3)"""
+        return kColorModel.isClass(colors, "empty_bar")
+    
+    def isRedArray(self, colors: np.ndarray) -> np.ndarray:
+        """向量化版本的 isRed，colors 形如 (..., 3)"""
+        return kColorModel.isClass(colors, "hp_red")
+    
     def isEmpty(self, color: Tuple[int, int, int]) -> bool:
         """检查血条或者蓝条是否为空"""
-        r1, g1, b1 = 20, 20, 20
-        r2, g2, b2 = color
-        tolerance = 15
-        return (abs(r1 - r2) <= tolerance and 
-                abs(g1 - g2) <= tolerance and 
-                abs(b1 - b2) <= tolerance)
+        return bool(self.isEmptyArray(color))
     
     def isRed(self, color: Tuple[int, int, int]) -> bool:
         """检查颜色是否为红色"""
-        r1, g1, b1 = 255, 0, 0
-        r2, g2, b2 = color
-        tolerance = 15
-        return abs(r1 - r2) <= tolerance
+        return bool(self.isRedArray(color))
     
     def rgb2Hex(self, rgb: Tuple[int, int, int]) -> str:
         """将RGB颜色转换为十六进制字符串"""
@@ -79,8 +191,17 @@ class ColorDetector:
         else:
             return (0, 0, 0)
 
-# 使用示例
+# 标定血条扫描行: python color_detector.py <全队满血的录制帧（PNG目录或 .npy/.npz）>
 if __name__ == "__main__":
-    pass
+    import sys
+    from frame_source import ReplayFrameSource
+    if len(sys.argv) < 2:
+        print("用法: python color_detector.py <全队满血的录制帧>")
+        sys.exit(1)
+    with ReplayFrameSource(sys.argv[1], auto_advance=False).grabFrame(0) as frame:
+        strips = ColorDetector().calibrateHPStrips(frame)
+    print(f"hp_strips（写入 coord_profiles.yaml 的 {kCoordProfile.name}）:")
+    for row in strips:
+        print(f"  - [{', '.join(str(int(v)) for v in row)}]")
     
     
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 颜色分类模型：启动时把命名颜色类编译成逐通道查找表，整块区域一次索引完成分类
+"""
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+@dataclass(frozen=True)
+class ColorClass:
+    """命名颜色类：RGB三个通道都落在范围内才算命中"""
+    name: str
+    rgb_min: Tuple[int, int, int] = (0, 0, 0)
+    rgb_max: Tuple[int, int, int] = (255, 255, 255)
+
+# 默认颜色类，阈值与 ColorDetector 原有的容差判断保持一致
+kDefaultColorClasses = [
+    ColorClass("hp_red", rgb_min=(240, 0, 0)),                              # 血条红色：R在255±15以内
+    ColorClass("empty_bar", rgb_min=(5, 5, 5), rgb_max=(35, 35, 35)),       # 空血条/空蓝条：各通道在20±15以内
+]
+
+class ColorModel:
+    """颜色查找表
+    每个通道编一张 256 级的位掩码表，第i位表示该通道值落在第i个颜色类的范围内；
+    三张表按像素的 R/G/B 索引后按位与，结果与逐像素比较完全一致
+    """
+
+    def __init__(self, classes: Sequence[ColorClass]):
+        if len(classes) > 32:
+            raise ValueError("颜色类最多支持32个")
+        self.classes: List[ColorClass] = list(classes)
+        self.class_bits: Dict[str, int] = {color_class.name: 1 << i for i, color_class in enumerate(self.classes)}
+        if len(self.classes) <= 8:
+            self.dtype = np.uint8
+        elif len(self.classes) <= 16:
+            self.dtype = np.uint16
+        else:
+            self.dtype = np.uint32
+        self.channel_luts = self._compileChannels()
+
+    def _compileChannels(self) -> np.ndarray:
+        """编译 (3, 256) 的逐通道表：通道值落在该颜色类的RGB范围内时置位"""
+        values = np.arange(256, dtype=np.int16)
+        luts = np.zeros((3, 256), dtype=self.dtype)
+        for color_class in self.classes:
+            bit = self.dtype(self.class_bits[color_class.name])
+            for channel in range(3):
+                hit = (values >= color_class.rgb_min[channel]) & (values <= color_class.rgb_max[channel])
+                luts[channel, hit] |= bit
+        return luts
+
+    def classify(self, region: np.ndarray) -> np.ndarray:
+        """对形如 (..., 3) 的RGB区域分类，返回同形状（去掉最后一维）的位掩码数组"""
+        region = np.asarray(region, dtype=np.uint8)
+        return self.channel_luts[0, region[..., 0]] & self.channel_luts[1, region[..., 1]] & self.channel_luts[2, region[..., 2]]
+
+    def isClass(self, region: np.ndarray, name: str) -> np.ndarray:
+        """判断区域内每个像素是否属于指定颜色类"""
+        return (self.classify(region) & self.class_bits[name]) != 0
+
+# 启动时编译一次，全局共享
+kColorModel = ColorModel(kDefaultColorClasses)
@@ -0,0 +1,133 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 置信度离线标定：回放标注过的录制帧，为每个模板选出漏检最少的搜索缩放比例和置信度，写回 template_meta.yaml
+       标定: python confidence_calibrator.py <录制目录>
+       录制目录下每个状态一个子目录（PNG帧）或一个 .npy/.npz 录制文件，名称即状态名；
+       录制目录下的 labels.yaml 写明每个状态画面中出现的模板（状态名: [模板名, ...]），
+       其余状态的帧作为该模板的反例
+       标定后需重新生成模板包（python template_pack.py）才会在打包版本中生效
+"""
+import os
+import sys
+import glob
+import yaml
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from game_param import kTemplateMetaPath
+from frame_source import ReplayFrameSource
+from template_pack import getTemplate, loadTemplateMeta
+from img_match import kScaleCalibration, kMatchScales, matchInRegion, scaleBbox
+
+# 置信度不低于该值，避免在没有反例的模板上把置信度压得过低
+kMinConfidence = 0.6
+# 置信度至少比反例最高分高出这么多
+kNegativeMargin = 0.05
+# 置信度至少比正例最低分低这么多，留出画面抖动的余量
+kPositiveMargin = 0.02
+
+@dataclass
+class Calibration:
+    """一个模板的标定结果"""
+    name: str
+    scale: float
+    confidence: float
+    false_negatives: int    # 按该置信度仍会漏检的正例帧数
+    positives: int
+    negatives: int
+
+def loadCorpus(corpus_dir: str) -> Dict[str, List[np.ndarray]]:
+    """读取录制目录，返回 状态名 -> BGR帧列表"""
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*"))):
+        if os.path.basename(path) == "labels.yaml":
+            continue
+        label = os.path.splitext(os.path.basename(path))[0]
+        corpus[label] = [np.ascontiguousarray(np.asarray(frame)[..., ::-1])
+                         for frame in ReplayFrameSource(path, auto_advance=False, loop=False).frames]
+    return corpus
+
+def templateScores(frames: List[np.ndarray], name: str, scale: float) -> np.ndarray:
+    """模板按scale缩放后在每一帧（元数据区域内）的最高分"""
+    template = getTemplate(name)
+    image = kScaleCalibration.scaledTemplate(template, scale)
+    mask = kScaleCalibration.scaledMask(template, scale)
+    scores = []
+    for frame in frames:
+        result = matchInRegion(frame, image, scaleBbox(template.roi, scale), mask)
+        scores.append(result.score if result is not None else 0.0)
+    return np.array(scores, dtype=np.float32)
+
+def chooseConfidence(positive: np.ndarray, negative: np.ndarray) -> float:
+    """正反例可分时取两者中间（不高于正例最低分-kPositiveMargin，不低于反例最高分+kNegativeMargin），
+    分数重叠时取不产生误检的最低置信度"""
+    negative_max = float(negative.max()) if negative.size else 0.0
+    lowest = max(kMinConfidence, negative_max + kNegativeMargin)
+    highest = float(positive.min()) - kPositiveMargin
+    if highest < lowest:
+        return round(lowest, 3)
+    return round(max(lowest, min(highest, (negative_max + float(positive.min())) / 2)), 3)
+
+def calibrateTemplate(name: str, positives: List[np.ndarray], negatives: List[np.ndarray],
+                      scales=kMatchScales) -> Calibration:
+    """在每个缩放比例上计算正反例分数，选漏检最少、其次正反例间隔最大的比例"""
+    best: Optional[Calibration] = None
+    best_gap = -np.inf
+    for scale in scales:
+        positive = templateScores(positives, name, scale)
+        negative = templateScores(negatives, name, scale)
+        confidence = chooseConfidence(positive, negative)
+        false_negatives = int((positive < confidence).sum())
+        gap = float(positive.min()) - (float(negative.max()) if negative.size else 0.0)
+        if best is None or (false_negatives, -gap) < (best.false_negatives, -best_gap):
+            best = Calibration(name, scale, confidence, false_negatives, len(positive), len(negative))
+            best_gap = gap
+    return best
+
+def calibrate(corpus_dir: str) -> List[Calibration]:
+    """按 labels.yaml 标定其中出现的所有模板"""
+    with open(os.path.join(corpus_dir, "labels.yaml"), "r", encoding="utf-8") as f:
+        labels: Dict[str, List[str]] = yaml.safe_load(f) or {}
+    corpus = loadCorpus(corpus_dir)
+    names = sorted({name for templates in labels.values() for name in (templates or [])})
+    results = []
+    for name in names:
+        positives = [frame for state, frames in corpus.items() if name in (labels.get(state) or []) for frame in frames]
+        negatives = [frame for state, frames in corpus.items() if name not in (labels.get(state) or []) for frame in frames]
+        if not positives:
+            print(f"{name}: 录制目录中没有包含该模板的帧，跳过")
+            continue
+        result = calibrateTemplate(name, positives, negatives)
+        print(f"{name}: 比例 {result.scale}，置信度 {result.confidence}，"
+              f"漏检 {result.false_negatives}/{result.positives}，反例 {result.negatives} 帧")
+        results.append(result)
+    return results
+
+def writeTemplateMeta(results: List[Calibration], meta_path: str = kTemplateMetaPath):
+    """把标定结果写回模板元数据，保留文件开头的注释和其他模板的配置"""
+    header = []
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.startswith("#"):
+                    break
+                header.append(line)
+    meta = loadTemplateMeta(meta_path)
+    for result in results:
+        entry = meta.setdefault(result.name, {"confidence": result.confidence, "roi": None})
+        entry["confidence"] = result.confidence
+        entry["scale"] = result.scale
+    with open(meta_path, "w", encoding="utf-8") as f:
+        f.writelines(header)
+        yaml.safe_dump(meta, f, allow_unicode=True, sort_keys=False, default_flow_style=False)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python confidence_calibrator.py <录制目录>")
+        sys.exit(1)
+    calibrations = calibrate(sys.argv[1])
+    if calibrations:
+        writeTemplateMeta(calibrations)
+        print(f"已写入模板元数据: {kTemplateMetaPath}（{len(calibrations)} 个模板），请重新生成模板包")
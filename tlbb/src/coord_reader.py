@@ -0,0 +1,179 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 坐标读取：用预先生成的数字字形图集识别游戏中显示的人物坐标，返回整数 (x, y)
+       生成字形图集: python coord_reader.py（从 img_src/digits 下的 0.png~9.png、comma.png 生成）
+"""
+import os
+import re
+import glob
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+from game_param import Bbox, kCoordConfig, kDigitGlyphDir, kDigitAtlasPath
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+
+# 字形统一缩放到的尺寸 (高, 宽)，按整行高度等比缩放后居中放入
+kGlyphSize = (16, 14)
+# 字形与图集最近字形的平均差异（0~1）超过该值视为无法识别（例如两个字形粘连）
+kMaxGlyphDistance = 0.1
+# 字形图片文件名到字符的映射（文件名不能是标点）
+kGlyphFileLabels = {"comma": ","}
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    """Otsu二值化，文字为255；文字像素多于一半时认为是深色文字，取反"""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.count_nonzero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+def inkRows(binary: np.ndarray) -> Tuple[int, int]:
+    """文字的上下边界 [top, bottom)，没有文字时返回整个高度"""
+    rows = np.flatnonzero(binary.any(axis=1))
+    if rows.size == 0:
+        return 0, binary.shape[0]
+    return int(rows[0]), int(rows[-1]) + 1
+
+def lineRows(glyphs: List[np.ndarray]) -> Tuple[int, int]:
+    """整行的上下边界：取各字形上下边界的中位数（数字占多数），逗号等下沉的字形不影响结果"""
+    rows = np.array([inkRows(glyph) for glyph in glyphs])
+    return int(np.median(rows[:, 0])), int(np.median(rows[:, 1]))
+
+def normalizeGlyph(binary: np.ndarray, top: int, bottom: int) -> np.ndarray:
+    """按整行的上下边界和字形自身的左右边界裁剪，等比缩放到 kGlyphSize 的高度后水平居中
+    上下边界取整行而不是字形自身，逗号等小字形保留大小和位置；宽度不拉伸，差一列像素不会放大成整体偏移"""
+    canvas = np.zeros(kGlyphSize, dtype=np.uint8)
+    glyph = binary[top:bottom]
+    cols = np.flatnonzero(glyph.any(axis=0))
+    if cols.size == 0 or glyph.shape[0] == 0:
+        return canvas
+    glyph = glyph[:, cols[0]:cols[-1] + 1]
+    height, width = kGlyphSize
+    scaled_width = min(width, max(1, int(round(glyph.shape[1] * height / glyph.shape[0]))))
+    glyph = cv2.resize(glyph, (scaled_width, height), interpolation=cv2.INTER_AREA)
+    left = (width - scaled_width) // 2
+    canvas[:, left:left + scaled_width] = glyph
+    return canvas
+
+def segmentGlyphs(binary: np.ndarray) -> List[Tuple[int, int]]:
+    """按列投影切分字形，返回每个字形的 [起始列, 结束列)"""
+    has_ink = binary.any(axis=0).astype(np.int8)
+    edges = np.diff(np.concatenate([[0], has_ink, [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class GlyphAtlas:
+    """数字字形图集：labels[i] 对应 glyphs[i]"""
+
+    def __init__(self, labels: str, glyphs: np.ndarray):
+        self.labels = labels
+        self.glyphs = glyphs.astype(np.float32) / 255.0
+
+    @classmethod
+    def fromGlyphDir(cls, glyph_dir: str = kDigitGlyphDir) -> Optional["GlyphAtlas"]:
+        """从字形图片目录生成图集，目录不存在或没有图片时返回None
+        字形图片需从坐标显示区域按同样的上下边界截取（高度相同），逗号才能和数字区分"""
+        labels, binaries = [], []
+        for path in sorted(glob.glob(os.path.join(glyph_dir, "*.png"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            label = kGlyphFileLabels.get(name, name)
+            if len(label) != 1:
+                continue
+            gray = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                continue
+            labels.append(label)
+            binaries.append(binarize(gray))
+        if not labels:
+            return None
+        top, bottom = lineRows(binaries)
+        return cls("".join(labels), np.stack([normalizeGlyph(binary, top, bottom) for binary in binaries]))
+
+    @classmethod
+    def load(cls, path: str = kDigitAtlasPath) -> "GlyphAtlas":
+        data = np.load(path)
+        return cls(str(data["labels"]), data["glyphs"])
+
+    def save(self, path: str = kDigitAtlasPath):
+        np.savez_compressed(path, labels=np.array(self.labels), glyphs=(self.glyphs * 255).astype(np.uint8))
+
+    def classify(self, glyphs: np.ndarray) -> Tuple[str, np.ndarray]:
+        """一次比较所有字形与图集，返回识别出的字符串和每个字形到最近图集字形的平均差异"""
+        samples = glyphs.astype(np.float32)[:, None] / 255.0
+        distances = np.abs(samples - self.glyphs[None]).mean(axis=(2, 3))
+        best = distances.argmin(axis=1)
+        return "".join(self.labels[i] for i in best), distances[np.arange(len(best)), best]
+
+
+def loadDigitAtlas() -> Optional[GlyphAtlas]:
+    """优先加载生成好的图集，没有时从字形图片生成，都没有时返回None"""
+    try:
+        if os.path.exists(kDigitAtlasPath):
+            return GlyphAtlas.load(kDigitAtlasPath)
+        return GlyphAtlas.fromGlyphDir(kDigitGlyphDir)
+    except Exception as e:
+        print(f"加载数字字形图集失败: {e}")
+        return None
+
+
+class CoordReader:
+    """读取游戏中显示的人物坐标"""
+
+    def __init__(self, bbox: Optional[Bbox] = None, atlas: Optional[GlyphAtlas] = None,
+                 frame_source: Optional[FrameSource] = None):
+        # 未指定时使用配置中的坐标区域、默认图集和全局默认帧来源
+        self.bbox = bbox if bbox is not None else kCoordConfig.bbox
+        self.atlas = atlas if atlas is not None else loadDigitAtlas()
+        self.frame_source = frame_source
+
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
+
+    def isAvailable(self) -> bool:
+        """坐标区域和字形图集都存在时才能读取坐标"""
+        return self.bbox is not None and self.atlas is not None
+
+    def readInFrame(self, frame: Frame) -> Optional[Tuple[int, int]]:
+        """从帧中识别坐标，无法识别时返回None"""
+        if not self.isAvailable():
+            return None
+        gray = frame.gray[max(self.bbox.top, 0):self.bbox.bottom, max(self.bbox.left, 0):self.bbox.right]
+        if gray.size == 0:
+            return None
+        binary = binarize(gray)
+        segments = segmentGlyphs(binary)
+        if len(segments) < 2:
+            return None
+        top, bottom = lineRows([binary[:, start:end] for start, end in segments])
+        glyphs = np.stack([normalizeGlyph(binary[:, start:end], top, bottom) for start, end in segments])
+        text, distances = self.atlas.classify(glyphs)
+        if distances.max() > kMaxGlyphDistance:
+            return None
+
+        match = re.fullmatch(r"\D*(\d+)\D+(\d+)\D*", text)
+        if match is not None:
+            return int(match.group(1)), int(match.group(2))
+        # 图集里没有分隔符时，按字形之间最大的间隙把数字分成 x 和 y 两段
+        if not text.isdigit():
+            return None
+        gaps = [segments[i + 1][0] - segments[i][1] for i in range(len(segments) - 1)]
+        split = int(np.argmax(gaps)) + 1
+        return int(text[:split]), int(text[split:])
+
+    def read(self, hwnd: int) -> Optional[Tuple[int, int]]:
+        """截取最新帧识别坐标"""
+        if not self.isAvailable():
+            return None
+        with self._getFrameSource().grabFrame(hwnd) as frame:
+            return self.readInFrame(frame)
+
+
+if __name__ == "__main__":
+    atlas = GlyphAtlas.fromGlyphDir(kDigitGlyphDir)
+    if atlas is None:
+        print(f"未找到字形图片: {kDigitGlyphDir}")
+    else:
+        atlas.save(kDigitAtlasPath)
+        print(f"数字字形图集已生成: {kDigitAtlasPath}（{atlas.labels}）")
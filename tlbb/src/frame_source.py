@@ -0,0 +1,451 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 帧来源：ColorDetector、ImageMatch、WindowManager 统一从这里截图
+       坐标均为窗口坐标系，返回 (H, W, 3) 的 RGB uint8 数组
+"""
+import os
+import glob
+import time
+import ctypes
+import threading
+import zlib
+from collections import OrderedDict
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from PIL import ImageGrab
+from game_param import Bbox
+
+try:
+    import win32gui
+    import win32ui
+    import win32con
+except ImportError:
+    # 回放模式可以在没有游戏客户端的Linux机器上运行
+    win32gui = win32ui = win32con = None
+
+class ViewBufferPool:
+    """派生视图的输出缓冲区池：帧释放后，其派生视图的缓冲区留给下一帧复用"""
+
+    def __init__(self, max_per_key: int = 4):
+        self.max_per_key = max_per_key
+        self._buffers: Dict[Tuple[Tuple[int, ...], str], List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers:
+                buffer = buffers.pop()
+                buffer.flags.writeable = True
+                return buffer
+        return np.empty(shape, dtype=dtype)
+
+    def give(self, buffer: np.ndarray):
+        key = (buffer.shape, buffer.dtype.str)
+        with self._lock:
+            buffers = self._buffers.setdefault(key, [])
+            if len(buffers) < self.max_per_key:
+                buffers.append(buffer)
+
+kViewBufferPool = ViewBufferPool()
+
+
+class FramePool:
+    """整窗口帧缓冲区池：按窗口尺寸预分配，帧释放后缓冲区回到池中供下一次截图写入
+    每种尺寸一个空闲列表（多个不同大小的窗口共用一个帧来源时互不挤占），最多保留 max_shapes 种尺寸，
+    超出时丢弃最久未用尺寸的空闲缓冲区；池空时临时分配，临时缓冲区释放后同样进入池（每种尺寸不超过capacity）
+    """
+
+    def __init__(self, capacity: int = 4, max_shapes: int = 8):
+        self.capacity = capacity
+        self.max_shapes = max_shapes
+        self.allocations = 0        # 累计分配次数，长时间运行后应保持不变
+        self._free: "OrderedDict[Tuple[int, ...], List[np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _freeList(self, shape: Tuple[int, ...]) -> List[np.ndarray]:
+        """取该尺寸的空闲列表并标记为最近使用"""
+        free = self._free.get(shape)
+        if free is None:
+            free = self._free[shape] = []
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+        else:
+            self._free.move_to_end(shape)
+        return free
+
+    def preallocate(self, shape: Tuple[int, ...], count: Optional[int] = None):
+        """按窗口尺寸预分配缓冲区"""
+        shape = tuple(shape)
+        count = self.capacity if count is None else min(count, self.capacity)
+        with self._lock:
+            free = self._freeList(shape)
+            while len(free) < count:
+                free.append(np.empty(shape, dtype=np.uint8))
+                self.allocations += 1
+
+    def lease(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """借出一块指定尺寸的缓冲区"""
+        shape = tuple(shape)
+        with self._lock:
+            free = self._freeList(shape)
+            if free:
+                buffer = free.pop()
+                buffer.flags.writeable = True
+                return buffer
+            self.allocations += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer: np.ndarray):
+        """归还缓冲区，该尺寸已被淘汰时直接丢弃"""
+        with self._lock:
+            free = self._free.get(buffer.shape)
+            if free is not None and len(free) < self.capacity:
+                free.append(buffer)
+
+
+class Frame:
+    """一帧窗口截图：整个窗口的RGB数组 + 截图时间戳，同一tick内所有检测器共享同一帧
+    灰度/BGR/缩小图等派生视图在第一次访问时计算并缓存到帧的生命周期结束
+    租约：帧创建时持有1个租约，共享给其他使用者前调用 lease()，每个使用者用完调用 release()（或使用with语句）；
+    最后一个租约释放后帧和所有派生视图都不能再使用，图像和派生视图的缓冲区会被下一帧复用
+    """
+
+    def __init__(self, image: np.ndarray, hwnd: int, window_rect: Tuple[int, int, int, int],
+                 timestamp: Optional[float] = None, seq: int = 0, pool: Optional["FramePool"] = None):
+        self.image = image
+        self._pool = pool
+        self._lease_count = 1
+        # 共享帧只读，防止某个检测器改写了其他检测器看到的像素
+        self.image.flags.writeable = False
+        self.hwnd = hwnd
+        self.window_rect = window_rect
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.seq = seq
+        self._views: Dict[Tuple, np.ndarray] = {}
+        self._hashes: Dict[Optional[Bbox], int] = {}
+        self._views_lock = threading.Lock()
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    def age(self) -> float:
+        """帧距今的秒数"""
+        return time.time() - self.timestamp
+
+    def crop(self, bbox: Optional[Bbox] = None) -> np.ndarray:
+        """按窗口坐标系的bbox切片（零拷贝视图），bbox为None时返回整帧"""
+        if bbox is None:
+            return self.image
+        return self.image[max(bbox.top, 0):bbox.bottom, max(bbox.left, 0):bbox.right]
+
+    def regionHash(self, bbox: Optional[Bbox] = None) -> int:
+        """区域像素的CRC32（逐行累积，不拷贝），同一帧同一区域只计算一次，用于判断画面是否变化"""
+        value = self._hashes.get(bbox)
+        if value is None:
+            region = self.crop(bbox)
+            value = zlib.crc32(np.int32(region.shape).tobytes())
+            for row in region:
+                value = zlib.crc32(row, value)
+            with self._views_lock:
+                self._hashes[bbox] = value
+        return value
+
+    def _view(self, key: Tuple, shape: Tuple[int, ...], dtype, compute) -> np.ndarray:
+        """取缓存的派生视图，没有则从缓冲区池取输出缓冲区并计算"""
+        with self._views_lock:
+            view = self._views.get(key)
+            if view is None:
+                view = kViewBufferPool.take(shape, dtype)
+                compute(view)
+                view.flags.writeable = False
+                self._views[key] = view
+            return view
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """BGR视图（OpenCV模板匹配用）"""
+        return self._view(("bgr",), self.image.shape, np.uint8,
+                          lambda out: cv2.cvtColor(self.image, cv2.COLOR_RGB2BGR, dst=out))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """灰度视图"""
+        return self._view(("gray",), self.image.shape[:2], np.uint8,
+                          lambda out: cv2.cvtColor(self.image, cv2.COLOR_RGB2GRAY, dst=out))
+
+    def downscaled(self, scale: float, gray: bool = False) -> np.ndarray:
+        """按比例缩小的视图（INTER_AREA），gray=True时基于灰度视图缩小"""
+        source = self.gray if gray else self.image
+        width = max(1, int(round(self.width * scale)))
+        height = max(1, int(round(self.height * scale)))
+        shape = (height, width) + source.shape[2:]
+        return self._view(("down", scale, gray), shape, np.uint8,
+                          lambda out: cv2.resize(source, (width, height), dst=out, interpolation=cv2.INTER_AREA))
+
+    def lease(self) -> "Frame":
+        """增加一个租约，返回自身"""
+        with self._views_lock:
+            self._lease_count += 1
+        return self
+
+    def release(self):
+        """释放一个租约，最后一个租约释放时把图像和派生视图的缓冲区还给缓冲区池"""
+        with self._views_lock:
+            self._lease_count -= 1
+            if self._lease_count > 0:
+                return
+            views = list(self._views.values())
+            self._views.clear()
+            self._hashes.clear()
+        for view in views:
+            kViewBufferPool.give(view)
+        if self._pool is not None:
+            self._pool.release(self.image)
+            self._pool = None
+
+    def __enter__(self) -> "Frame":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FrameSource:
+    """帧来源基类"""
+
+    def __init__(self):
+        # 每个帧来源一个整窗口帧缓冲区池
+        self.frame_pool = FramePool()
+
+    def getWindowRect(self, hwnd: int) -> Tuple[int, int, int, int]:
+        """获取窗口位置和大小 (left, top, right, bottom)"""
+        return win32gui.GetWindowRect(hwnd)
+
+    def getWindowBbox(self, hwnd: int) -> Bbox:
+        """获取整个窗口在窗口坐标系下的bbox"""
+        left, top, right, bottom = self.getWindowRect(hwnd)
+        return Bbox(0, 0, right - left, bottom - top)
+
+    def grabInto(self, hwnd: int, out: np.ndarray, bbox: Optional[Bbox] = None):
+        """截取窗口坐标系下的指定区域，写入预先分配好的 (H, W, 3) 缓冲区，bbox为None时截取整个窗口"""
+        raise NotImplementedError
+
+    def grabScreenInto(self, rect: Tuple[int, int, int, int], out: np.ndarray):
+        """截取屏幕坐标系下的矩形 (left, top, right, bottom)，写入预先分配好的 (H, W, 3) 缓冲区（共享采集用）"""
+        raise NotImplementedError
+
+    def grab(self, hwnd: int, bbox: Optional[Bbox] = None) -> np.ndarray:
+        """截取窗口坐标系下的指定区域，bbox为None时截取整个窗口"""
+        if bbox is None:
+            bbox = self.getWindowBbox(hwnd)
+        out = np.empty((bbox.bottom - bbox.top, bbox.right - bbox.left, 3), dtype=np.uint8)
+        self.grabInto(hwnd, out, bbox)
+        return out
+
+    def grabFrame(self, hwnd: int) -> Frame:
+        """截取整个窗口到帧缓冲区池借出的缓冲区，返回带时间戳的帧，用完需 release()"""
+        window_rect = self.getWindowRect(hwnd)
+        bbox = Bbox(0, 0, window_rect[2] - window_rect[0], window_rect[3] - window_rect[1])
+        image = self.frame_pool.lease((bbox.bottom, bbox.right, 3))
+        try:
+            self.grabInto(hwnd, image, bbox)
+        except Exception:
+            self.frame_pool.release(image)
+            raise
+        return Frame(image, hwnd, window_rect, pool=self.frame_pool)
+
+
+class ImageGrabFrameSource(FrameSource):
+    """PIL ImageGrab 截屏（原有方式），PIL内部的图像分配无法避免，只省去了转换后的数组分配"""
+
+    def grabInto(self, hwnd: int, out: np.ndarray, bbox: Optional[Bbox] = None):
+        window_rect = self.getWindowRect(hwnd)
+        if bbox is None:
+            bbox = Bbox(0, 0, window_rect[2] - window_rect[0], window_rect[3] - window_rect[1])
+        screenshot = ImageGrab.grab(bbox=(window_rect[0] + bbox.left, window_rect[1] + bbox.top,
+                                          window_rect[0] + bbox.right, window_rect[1] + bbox.bottom))
+        np.copyto(out, np.asarray(screenshot)[..., :3])
+
+    def grabScreenInto(self, rect: Tuple[int, int, int, int], out: np.ndarray):
+        np.copyto(out, np.asarray(ImageGrab.grab(bbox=tuple(rect)))[..., :3])
+
+
+class _BitmapInfoHeader(ctypes.Structure):
+    _fields_ = [
+        ("biSize", ctypes.c_uint32), ("biWidth", ctypes.c_int32), ("biHeight", ctypes.c_int32),
+        ("biPlanes", ctypes.c_uint16), ("biBitCount", ctypes.c_uint16), ("biCompression", ctypes.c_uint32),
+        ("biSizeImage", ctypes.c_uint32), ("biXPelsPerMeter", ctypes.c_int32), ("biYPelsPerMeter", ctypes.c_int32),
+        ("biClrUsed", ctypes.c_uint32), ("biClrImportant", ctypes.c_uint32),
+    ]
+
+
+class GdiFrameSource(FrameSource):
+    """GDI 窗口截图：直接从窗口DC BitBlt，不经过整个桌面
+    位图数据用 GetDIBits 直接写入复用的BGRA缓冲区（每个线程一块），再转换到目标缓冲区，截图过程不分配新数组
+    """
+
+    def __init__(self):
+        super().__init__()
+        # BGRA中转缓冲区每个线程一块，多个采集线程共用一个帧来源时互不覆盖
+        self._local = threading.local()
+
+    def grabInto(self, hwnd: int, out: np.ndarray, bbox: Optional[Bbox] = None):
+        if bbox is None:
+            bbox = self.getWindowBbox(hwnd)
+        self._bitBltInto(hwnd, bbox.left, bbox.top, out)
+
+    def grabScreenInto(self, rect: Tuple[int, int, int, int], out: np.ndarray):
+        # 桌面窗口的DC即整个屏幕，坐标为屏幕坐标
+        self._bitBltInto(win32gui.GetDesktopWindow(), rect[0], rect[1], out)
+
+    def _bitBltInto(self, hwnd: int, left: int, top: int, out: np.ndarray):
+        """从窗口DC的 (left, top) 处截取 out 大小的区域"""
+        height, width = out.shape[:2]
+        bgra = getattr(self._local, "bgra", None)
+        if bgra is None or bgra.shape != (height, width, 4):
+            bgra = self._local.bgra = np.empty((height, width, 4), dtype=np.uint8)
+
+        header = _BitmapInfoHeader()
+        header.biSize = ctypes.sizeof(_BitmapInfoHeader)
+        header.biWidth = width
+        header.biHeight = -height       # 负数表示自上而下的行顺序
+        header.biPlanes = 1
+        header.biBitCount = 32
+        header.biCompression = 0        # BI_RGB
+
+        hwnd_dc = win32gui.GetWindowDC(hwnd)
+        src_dc = win32ui.CreateDCFromHandle(hwnd_dc)
+        mem_dc = src_dc.CreateCompatibleDC()
+        bitmap = win32ui.CreateBitmap()
+        try:
+            bitmap.CreateCompatibleBitmap(src_dc, width, height)
+            old_bitmap = mem_dc.SelectObject(bitmap)
+            mem_dc.BitBlt((0, 0), (width, height), src_dc, (left, top), win32con.SRCCOPY)
+            # GetDIBits 要求位图不能处于被选入DC的状态
+            mem_dc.SelectObject(old_bitmap)
+            ctypes.windll.gdi32.GetDIBits(mem_dc.GetSafeHdc(), bitmap.GetHandle(), 0, height,
+                                          bgra.ctypes.data_as(ctypes.c_void_p), ctypes.byref(header), 0)
+            cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=out)
+        finally:
+            win32gui.DeleteObject(bitmap.GetHandle())
+            mem_dc.DeleteDC()
+            src_dc.DeleteDC()
+            win32gui.ReleaseDC(hwnd, hwnd_dc)
+
+
+class ReplayFrameSource(FrameSource):
+    """回放录制好的帧，用于在没有游戏客户端的机器上做基准测试和回归测试
+    Args:
+        path: PNG帧目录（按文件名排序），或 recordFrames 生成的 .npy/.npz 录制文件
+        auto_advance: 每次grab后自动切到下一帧（模拟时间流逝）
+        loop: 播放到最后一帧后是否从头开始
+    """
+
+    def __init__(self, path: str, auto_advance: bool = True, loop: bool = True):
+        super().__init__()
+        self.path = path
+        self.auto_advance = auto_advance
+        self.loop = loop
+        self.index = 0
+        self.frames = self._loadFrames(path)
+        if len(self.frames) == 0:
+            raise ValueError(f"回放文件中没有帧: {path}")
+
+    def _loadFrames(self, path: str):
+        if os.path.isdir(path):
+            frames: List[np.ndarray] = []
+            for file in sorted(glob.glob(os.path.join(path, "*.png"))):
+                # np.fromfile + imdecode 兼容中文路径
+                bgr = cv2.imdecode(np.fromfile(file, dtype=np.uint8), cv2.IMREAD_COLOR)
+                frames.append(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            return frames
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                return data["frames"]
+        # .npy 录制文件使用内存映射，不整体读入内存
+        return np.load(path, mmap_mode="r")
+
+    def currentFrame(self) -> np.ndarray:
+        return self.frames[self.index]
+
+    def nextFrame(self) -> bool:
+        """切到下一帧，已经是最后一帧且不循环时返回False"""
+        if self.index + 1 < len(self.frames):
+            self.index += 1
+            return True
+        if self.loop:
+            self.index = 0
+            return True
+        return False
+
+    def getWindowRect(self, hwnd: int) -> Tuple[int, int, int, int]:
+        height, width = self.currentFrame().shape[:2]
+        return (0, 0, width, height)
+
+    def grabInto(self, hwnd: int, out: np.ndarray, bbox: Optional[Bbox] = None):
+        frame = self.currentFrame()
+        if bbox is None:
+            np.copyto(out, frame[..., :3])
+        else:
+            self._copyRegion(frame, bbox, out)
+        if self.auto_advance:
+            self.nextFrame()
+
+    def grabScreenInto(self, rect: Tuple[int, int, int, int], out: np.ndarray):
+        # 回放时所有窗口都位于 (0, 0)，录制帧即屏幕
+        self._copyRegion(self.currentFrame(), Bbox(*rect), out)
+        if self.auto_advance:
+            self.nextFrame()
+
+    @staticmethod
+    def _copyRegion(frame: np.ndarray, bbox: Bbox, out: np.ndarray):
+        """复制录制帧中的bbox区域，超出录制帧范围的部分填0"""
+        height, width = frame.shape[:2]
+        left, top = max(bbox.left, 0), max(bbox.top, 0)
+        right, bottom = min(bbox.right, width), min(bbox.bottom, height)
+        if left > bbox.left or top > bbox.top or right < bbox.right or bottom < bbox.bottom:
+            out.fill(0)
+        if right > left and bottom > top:
+            out[top - bbox.top:bottom - bbox.top, left - bbox.left:right - bbox.left] = frame[top:bottom, left:right, :3]
+
+
+def recordFrames(source: FrameSource, hwnd: int, path: str, count: int, interval: float = 0.5):
+    """录制窗口帧到 .npy 文件，供 ReplayFrameSource 回放"""
+    frames = []
+    for i in range(count):
+        frames.append(source.grab(hwnd))
+        if i < count - 1:
+            time.sleep(interval)
+    np.save(path, np.stack(frames))
+    print(f"已录制 {count} 帧到: {path}")
+
+
+def createFrameSource(kind: str, **kwargs) -> FrameSource:
+    """按名称创建帧来源: imagegrab / gdi / replay"""
+    if kind == "imagegrab":
+        return ImageGrabFrameSource()
+    if kind == "gdi":
+        return GdiFrameSource()
+    if kind == "replay":
+        return ReplayFrameSource(**kwargs)
+    raise ValueError(f"未知的帧来源: {kind}")
+
+
+# 全局默认帧来源，未显式指定时所有检测器共用
+_default_frame_source: FrameSource = ImageGrabFrameSource()
+
+def getDefaultFrameSource() -> FrameSource:
+    return _default_frame_source
+
+def setDefaultFrameSource(source: FrameSource):
+    global _default_frame_source
+    _default_frame_source = source
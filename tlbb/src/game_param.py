@@ -1,8 +1,9 @@
-from typing import Dict, Tuple
-from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from dataclasses import dataclass, field
 import os
 import sys
 import yaml
+import numpy as np
 
 def getBasePath():
     """获取exe所在的路径，兼容开发环境和打包后的环境"""
@@ -31,6 +32,15 @@ else:
     kResDir = os.path.normpath(os.path.join(kBaseDir, "..", "res"))
 
 kPicDir = os.path.join(kResDir, "img_src")
+kTemplatePackPath = os.path.join(kResDir, "templates.pack")        # 由 template_pack.py 从 img_src 生成
+kTemplateMetaPath = os.path.join(kResDir, "template_meta.yaml")    # 模板元数据（期望搜索区域、默认置信度）
+kDigitGlyphDir = os.path.join(kPicDir, "digits")                    # 坐标数字字形图片 0.png~9.png、comma.png
+kDigitAtlasPath = os.path.join(kResDir, "digit_atlas.npz")          # 由 coord_reader.py 从字形图片生成
+kStateRegionsPath = os.path.join(kResDir, "state_regions.yaml")     # 每个界面状态的参考区域
+kStateIndexPath = os.path.join(kResDir, "state_index.npz")          # 由 state_index.py 从录制帧生成
+kScoreLogPath = os.path.join(kResDir, "match_scores.bin")           # 匹配分数记录（定长二进制记录，追加写入）
+kLayoutPath = os.path.join(kResDir, "layout.yaml")                  # 布局标定：参考窗口尺寸、坐标分组的对齐方式和锚点
+kCoordProfilesPath = os.path.join(kResDir, "coord_profiles.yaml")   # 各分辨率的坐标表
 
 @dataclass(frozen=True)
 class Point:
@@ -47,56 +57,59 @@ class Bbox:
 @dataclass(frozen=True)
 class ImagePath:
     class auto_return:
-        auto_find: str = os.path.join(kPicDir, "auto_return\\1.png")
-        di_fu: str = os.path.join(kPicDir, "auto_return\\2.png")
-        meng_po: str = os.path.join(kPicDir, "auto_return\\3.png")
-        da_li: str = os.path.join(kPicDir, "auto_return\\4.png")
-        xue_yuan: str = os.path.join(kPicDir, "auto_return\\5.png")
-        chu_qiao: str = os.path.join(kPicDir, "auto_return\\6.png")     # 出窍按钮
-        si_xiang: str = os.path.join(kPicDir, "auto_return\\7.png")      # 四象天门阵场景
-        hui_yi: str = os.path.join(kPicDir, "auto_return\\8.png")      # 回营按钮
-        qian_wang_ji_tan: str = os.path.join(kPicDir, "auto_return\\9.png")      # 前往祭坛按钮
-        miao_ren_dong: str = os.path.join(kPicDir, "auto_return\\10.png")     # 苗人洞场景
-        move_scene_confirm: str = os.path.join(kPicDir, "auto_return\\11.png")   # 场景确认框
+        auto_find: str = os.path.join(kPicDir, "auto_return", "1.png")
+        di_fu: str = os.path.join(kPicDir, "auto_return", "2.png")
+        meng_po: str = os.path.join(kPicDir, "auto_return", "3.png")
+        da_li: str = os.path.join(kPicDir, "auto_return", "4.png")
+        xue_yuan: str = os.path.join(kPicDir, "auto_return", "5.png")
+        chu_qiao: str = os.path.join(kPicDir, "auto_return", "6.png")     # 出窍按钮
+        si_xiang: str = os.path.join(kPicDir, "auto_return", "7.png")      # 四象天门阵场景
+        hui_yi: str = os.path.join(kPicDir, "auto_return", "8.png")      # 回营按钮
+        qian_wang_ji_tan: str = os.path.join(kPicDir, "auto_return", "9.png")      # 前往祭坛按钮
+        miao_ren_dong: str = os.path.join(kPicDir, "auto_return", "10.png")     # 苗人洞场景
+        move_scene_confirm: str = os.path.join(kPicDir, "auto_return", "11.png")   # 场景确认框
 
-@dataclass
-class HPBarConfig:
-    # 血条设置在4/5的位置
-    p1_high: Point = Point(200, 66)
-    p2_high: Point = Point(140, 160)
-    p3_high: Point = Point(140, 205)
-    p4_high: Point = Point(140, 250)
-    p5_high: Point = Point(140, 295)
-    p6_high: Point = Point(140, 340)
-    
-    p1_mid: Point = Point(143, 66)
-    p2_mid: Point = Point(100, 160)
-    p3_mid: Point = Point(100, 205)
-    p4_mid: Point = Point(100, 250)
-    p5_mid: Point = Point(100, 295)
-    p6_mid: Point = Point(100, 340)
-    
-    p1_low: Point = Point(95, 66)
-    p2_low: Point = Point(60, 160)
-    p3_low: Point = Point(60, 205)
-    p4_low: Point = Point(60, 250)
-    p5_low: Point = Point(60, 295)
-    p6_low: Point = Point(60, 340)
-    
-    pet: Point = Point(217, 109)
+# 坐标表：按参考窗口标定的坐标，按 [队员, ...] 排成数组，采样时一次花式索引取出所有点
+# 使用前经 layout.kLayout 换算到窗口当前的布局；换分辨率时在 res/coord_profiles.yaml 中另建一套
+# 血条扫描行的名称，顺序即 kCoordProfile.hp_strips 的行顺序
+kHPStripNames = ("p1", "p2", "p3", "p4", "p5", "p6", "pet")
+# 血条采样点的位置，顺序即 kCoordProfile.hp_bar 第二维的顺序
+kHPBarLevels = ("low", "mid", "high")
 
 @dataclass
-class MPBarConfig:
-    player1: Point = Point(167, 73)
-
-@dataclass
-class PhotoConfig:
-    player1: Point = Point(40, 66)
-    player2: Point = Point(24, 160)
-    player3: Point = Point(24, 205)
-    player4: Point = Point(24, 250)
-    player5: Point = Point(24, 295)
-    player6: Point = Point(24, 340)
+class CoordProfile:
+    name: str = "default"
+    # 标定坐标表时的窗口尺寸 [宽, 高]，layout.yaml 没有配置参考尺寸时作为布局的参考尺寸
+    window_size: Optional[Tuple[int, int]] = None
+    # 血条采样点 [队员 p1~p6, 低(1/3)/中(2/3)/高(4/5), (x, y)]
+    hp_bar: np.ndarray = field(default_factory=lambda: np.array([
+        [[95, 66], [143, 66], [200, 66]],
+        [[60, 160], [100, 160], [140, 160]],
+        [[60, 205], [100, 205], [140, 205]],
+        [[60, 250], [100, 250], [140, 250]],
+        [[60, 295], [100, 295], [140, 295]],
+        [[60, 340], [100, 340], [140, 340]],
+    ], dtype=np.int32))
+    # 宠物血条采样点 (x, y)
+    pet_hp: np.ndarray = field(default_factory=lambda: np.array([217, 109], dtype=np.int32))
+    # 满血时整条血条所在的行（高度1像素）[p1~p6、宠物, (left, top, right, bottom)]，right 为满血时最右一列的下一列，
+    # 血量比例 = 红色部分宽度 / 血条宽度；用 color_detector.calibrateHPStrips 在全队（含宠物）满血的帧上标定
+    # 未标定的默认值：p1~p6 的 left 为 1/3→2/3 两点外推到 0 血的位置，right 为高位采样点的下一列；宠物为包含 pet_hp 的估计范围
+    hp_strips: np.ndarray = field(default_factory=lambda: np.array([
+        [47, 66, 201, 67],
+        [20, 160, 141, 161],
+        [20, 205, 141, 206],
+        [20, 250, 141, 251],
+        [20, 295, 141, 296],
+        [20, 340, 141, 341],
+        [110, 109, 230, 110],
+    ], dtype=np.int32))
+    # 蓝条采样点 [采样点, (队员索引, x, y)]，目前只有p1
+    mp_bar: np.ndarray = field(default_factory=lambda: np.array([[0, 167, 73]], dtype=np.int32))
+    # 队员头像 [队员 p1~p6, (x, y)]
+    photos: np.ndarray = field(default_factory=lambda: np.array([
+        [40, 66], [24, 160], [24, 205], [24, 250], [24, 295], [24, 340],
+    ], dtype=np.int32))
 
 @dataclass
 class DefaultKeyConfig:
@@ -115,12 +128,87 @@ class MouseClickConfig:
     start_hotkey: str = "Ctrl+F11"
     stop_hotkey: str = "Ctrl+F12"
 
+@dataclass
+class CaptureConfig:
+    fps: int = 10                   # 每个窗口采集线程的截图帧率
+    backend: str = "imagegrab"      # 截图方式: imagegrab / gdi
+    shared: bool = False            # 共享采集：每个周期只截取一次所有绑定窗口的外接矩形，再按窗口切片（多开时窗口不能互相遮挡）
+
+@dataclass
+class MatchConfig:
+    mode: str = "full"              # 全窗口搜索方式: full（全分辨率） / coarse_to_fine（先缩小灰度粗搜再全分辨率彩色验证）
+    coarse_scale: float = 0.5       # 粗搜时帧和模板的缩放比例
+    coarse_candidates: int = 3      # 粗搜最多保留的候选峰值数，都在全分辨率上验证
+    time_budget_ms: int = 50        # 单次匹配的时间预算，超出后不再验证剩余候选
+    coarse_reject_margin: float = 0.4   # 粗搜最高分低于 置信度-该值 时直接判定未找到（实测真实命中的粗搜分数最多比全分辨率低约0.26）
+    workers: int = 0                # 匹配线程池的线程数，0为CPU核数，1为串行
+    tiles: int = 4                  # full模式下整窗口搜索切分的分块数
+    score_log: bool = False         # 是否把每次匹配的最高分（包括未达到置信度的）记录到 kScoreLogPath
+
+@dataclass
+class MotionConfig:
+    sample_interval: float = 0.25   # 运动检测的采样间隔（秒）
+    scale: float = 0.5              # 采样前缩小的比例（与粗搜比例相同时共享帧的缩小灰度视图）
+    threshold: float = 3.0          # 相邻样本的平均灰度差低于该值视为低运动
+    stop_samples: int = 6           # 连续多少个低运动样本判定人物静止
+
+@dataclass
+class CoordConfig:
+    bbox: Optional[Bbox] = None     # 游戏坐标显示区域（窗口坐标系），未配置时不读取坐标
+    tolerance: int = 2              # 与目标坐标相差不超过该值视为到达
+    stuck_timeout: float = 15.0     # 坐标超过该秒数不变视为卡住
+    sample_interval: float = 0.5    # 读取坐标的间隔（秒）
+
+@dataclass
+class VisionConfig:
+    enabled: bool = False           # 是否在独立进程中截图和识别（每个绑定的窗口一个进程）
+    max_batch: int = 16             # 一次发送给识别进程的最多请求数
+    timeout: float = 5.0            # 等待识别进程回复的超时（秒）
+
 # 创建实例
-kHPBar = HPBarConfig()
-kMPBar = MPBarConfig()
+kCoordProfile = CoordProfile()
 kDefaultKey = DefaultKeyConfig()
 kMouseClickConfig = MouseClickConfig()
-kProfilePhoto = PhotoConfig()
+kCaptureConfig = CaptureConfig()
+kMatchConfig = MatchConfig()
+kMotionConfig = MotionConfig()
+kCoordConfig = CoordConfig()
+kVisionConfig = VisionConfig()
+
+def loadCoordProfile(name: str, path: str = kCoordProfilesPath) -> bool:
+    """从 coord_profiles.yaml 加载指定名称的坐标表到 kCoordProfile（原地替换，已取得引用的数组同步更新）
+    缺少的字段保留默认值，形状不对的字段忽略（mp_bar 的行数可以不同）"""
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    profile = data.get(name) if isinstance(data, dict) else None
+    if not isinstance(profile, dict):
+        print(f"坐标表配置不存在: {name}")
+        return False
+    kCoordProfile.name = name
+    window_size = profile.get("window_size")
+    if isinstance(window_size, list) and len(window_size) == 2 and all(isinstance(v, int) for v in window_size):
+        kCoordProfile.window_size = (window_size[0], window_size[1])
+    for table_name in ("hp_bar", "pet_hp", "hp_strips", "mp_bar", "photos"):
+        value = profile.get(table_name)
+        if value is None:
+            continue
+        table = getattr(kCoordProfile, table_name)
+        try:
+            array = np.asarray(value, dtype=np.int32)
+        except (TypeError, ValueError):
+            print(f"坐标表 {name}.{table_name} 格式错误，已忽略")
+            continue
+        if table_name == "mp_bar" and array.ndim == 2 and array.shape[1] == 3:
+            # 蓝条采样点的个数可以与默认值不同，只能整体替换（在加载检测器模块之前调用）
+            kCoordProfile.mp_bar = array
+            continue
+        if array.shape != table.shape:
+            print(f"坐标表 {name}.{table_name} 形状应为 {table.shape}，实际为 {array.shape}，已忽略")
+            continue
+        np.copyto(table, array)
+    return True
 
 def loadKeyConfig():
     """从 key_setting.yaml 加载按键配置，若文件不存在则保持默认值"""
@@ -151,6 +239,62 @@ def loadKeyConfig():
         mouse_click_stop_hotkey = data.get("mouse_click_stop_hotkey")
         if isinstance(mouse_click_stop_hotkey, str) and mouse_click_stop_hotkey.strip():
             kMouseClickConfig.stop_hotkey = mouse_click_stop_hotkey.strip()
+
+        capture_fps = data.get("capture_fps")
+        if isinstance(capture_fps, int) and capture_fps > 0:
+            kCaptureConfig.fps = capture_fps
+
+        capture_backend = data.get("capture_backend")
+        if isinstance(capture_backend, str) and capture_backend.lower() in ("imagegrab", "gdi"):
+            kCaptureConfig.backend = capture_backend.lower()
+
+        capture_shared = data.get("capture_shared")
+        if isinstance(capture_shared, bool):
+            kCaptureConfig.shared = capture_shared
+
+        match_mode = data.get("match_mode")
+        if isinstance(match_mode, str) and match_mode.lower() in ("coarse_to_fine", "full"):
+            kMatchConfig.mode = match_mode.lower()
+
+        match_time_budget_ms = data.get("match_time_budget_ms")
+        if isinstance(match_time_budget_ms, int) and match_time_budget_ms > 0:
+            kMatchConfig.time_budget_ms = match_time_budget_ms
+
+        match_coarse_reject_margin = data.get("match_coarse_reject_margin")
+        if isinstance(match_coarse_reject_margin, (int, float)) and match_coarse_reject_margin >= 0:
+            kMatchConfig.coarse_reject_margin = float(match_coarse_reject_margin)
+
+        match_workers = data.get("match_workers")
+        if isinstance(match_workers, int) and match_workers >= 0:
+            kMatchConfig.workers = match_workers
+
+        match_score_log = data.get("match_score_log")
+        if isinstance(match_score_log, bool):
+            kMatchConfig.score_log = match_score_log
+
+        motion_sample_interval = data.get("motion_sample_interval")
+        if isinstance(motion_sample_interval, (int, float)) and motion_sample_interval > 0:
+            kMotionConfig.sample_interval = float(motion_sample_interval)
+
+        motion_threshold = data.get("motion_threshold")
+        if isinstance(motion_threshold, (int, float)) and motion_threshold > 0:
+            kMotionConfig.threshold = float(motion_threshold)
+
+        motion_stop_samples = data.get("motion_stop_samples")
+        if isinstance(motion_stop_samples, int) and motion_stop_samples > 0:
+            kMotionConfig.stop_samples = motion_stop_samples
+
+        vision_process = data.get("vision_process")
+        if isinstance(vision_process, bool):
+            kVisionConfig.enabled = vision_process
+
+        coord_profile = data.get("coord_profile")
+        if isinstance(coord_profile, str) and coord_profile.strip():
+            loadCoordProfile(coord_profile.strip())
+
+        coord_bbox = data.get("coord_bbox")
+        if isinstance(coord_bbox, list) and len(coord_bbox) == 4 and all(isinstance(v, int) for v in coord_bbox):
+            kCoordConfig.bbox = Bbox(*coord_bbox)
     except Exception:
         pass
 
@@ -1,75 +1,617 @@
 import cv2
 import numpy as np
-import pyautogui
 import time
 import os
 import sys
 import threading
 import queue
 import logging
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 
 from window_manager import WindowManager
-from game_param import ImagePath, Point, Bbox
-from keyboard_simulator import KeyboardSimulator
+from game_param import ImagePath, Point, Bbox, kMatchConfig
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+from template_pack import TemplateEntry, getTemplate
+from match_executor import kMatchExecutor, splitTiles
+from state_index import StateIndex
+from score_log import kScoreLog
+from vision_service import getVisionClient
+
+@dataclass(frozen=True)
+class MatchResult:
+    """一次模板匹配的结果（窗口坐标系），score为归一化相关系数（TM_CCOEFF_NORMED）"""
+    bbox: Bbox
+    center: Point
+    score: float
+
+@dataclass(frozen=True)
+class SceneResult:
+    """场景分类结果：scene为最佳场景（没有场景达到置信度时为None），scores为每个场景的最高分"""
+    scene: Optional[str]
+    score: float
+    scores: Dict[str, float]
+
+def matchTemplate(image_bgr: np.ndarray, template_bgr: np.ndarray, mask: Optional[np.ndarray] = None) -> Optional[MatchResult]:
+    """在BGR图像中查找模板的最佳匹配位置，模板比图像大时返回None
+    mask为模板的透明度掩码（255参与匹配），透明背景不计入相关系数"""
+    template_height, template_width = template_bgr.shape[:2]
+    if template_height > image_bgr.shape[0] or template_width > image_bgr.shape[1]:
+        return None
+    scores = matchScores(image_bgr, template_bgr, mask)
+    _, max_score, _, max_loc = cv2.minMaxLoc(scores)
+    left, top = max_loc
+    bbox = Bbox(left, top, left + template_width, top + template_height)
+    center = Point(int(left + template_width / 2), int(top + template_height / 2))
+    return MatchResult(bbox, center, float(max_score))
+
+def matchScores(image: np.ndarray, template: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """TM_CCOEFF_NORMED 分数图；带掩码时图像块在掩码内没有对比度会得到 inf/nan，置为0"""
+    if mask is None:
+        return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    if template.ndim == 3 and mask.ndim == 2:
+        mask = cv2.merge([mask] * template.shape[2])
+    scores = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED, mask=mask)
+    scores[~np.isfinite(scores)] = 0.0
+    return scores
+
+def offsetMatchResult(result: MatchResult, offset_x: int, offset_y: int) -> MatchResult:
+    """把在子区域中得到的匹配结果平移回窗口坐标系"""
+    bbox = Bbox(result.bbox.left + offset_x, result.bbox.top + offset_y,
+                result.bbox.right + offset_x, result.bbox.bottom + offset_y)
+    return MatchResult(bbox, Point(result.center.x + offset_x, result.center.y + offset_y), result.score)
+
+def clipBbox(bbox: Bbox, width: int, height: int) -> Bbox:
+    """把bbox限制在 width x height 的图像范围内"""
+    return Bbox(max(bbox.left, 0), max(bbox.top, 0), min(bbox.right, width), min(bbox.bottom, height))
+
+def matchInRegion(image_bgr: np.ndarray, template_bgr: np.ndarray, region: Optional[Bbox] = None,
+                  mask: Optional[np.ndarray] = None) -> Optional[MatchResult]:
+    """只在图像的region区域内匹配模板，返回图像坐标系下的结果；region为None时搜索整幅图像"""
+    if region is None:
+        return matchTemplate(image_bgr, template_bgr, mask)
+    region = clipBbox(region, image_bgr.shape[1], image_bgr.shape[0])
+    result = matchTemplate(image_bgr[region.top:region.bottom, region.left:region.right], template_bgr, mask)
+    if result is not None and (region.left or region.top):
+        result = offsetMatchResult(result, region.left, region.top)
+    return result
+
+def bestResult(results) -> Optional[MatchResult]:
+    """取分数最高的结果，分数相同时取靠前的一个，合并结果与执行顺序无关"""
+    best = None
+    for result in results:
+        if result is not None and (best is None or result.score > best.score):
+            best = result
+    return best
+
+def matchTiled(image_bgr: np.ndarray, template_bgr: np.ndarray, region: Optional[Bbox] = None,
+               mask: Optional[np.ndarray] = None, tiles: int = kMatchConfig.tiles) -> Optional[MatchResult]:
+    """把搜索区域切成相互重叠的分块，在匹配线程池中并行匹配后合并，结果与 matchInRegion 相同"""
+    region = clipBbox(region or Bbox(0, 0, image_bgr.shape[1], image_bgr.shape[0]), image_bgr.shape[1], image_bgr.shape[0])
+    template_height, template_width = template_bgr.shape[:2]
+    tile_regions = splitTiles(region, template_width, template_height, tiles)
+    if len(tile_regions) == 1:
+        return matchInRegion(image_bgr, template_bgr, region, mask)
+    return bestResult(kMatchExecutor.map(lambda tile: matchInRegion(image_bgr, template_bgr, tile, mask), tile_regions))
+
+# 缩小后的模板短边小于这个像素数时，粗搜已无法区分，直接全分辨率搜索
+kCoarseMinSide = 6
+_coarse_templates: Dict[Tuple[str, float, Tuple[int, int]], np.ndarray] = {}
+_coarse_lock = threading.Lock()
+
+def coarsePhases(coarse_scale: float) -> Tuple[Tuple[int, int], ...]:
+    """缩小图的一个像素对应原图 1/coarse_scale 个像素，模板在原图中的位置相对像素块有这么多种相位"""
+    step = max(1, int(round(1.0 / coarse_scale)))
+    return tuple((dx, dy) for dy in range(step) for dx in range(step))
+
+def coarseTemplate(template: np.ndarray, coarse_scale: float, phase: Tuple[int, int] = (0, 0),
+                   cache_name: Optional[str] = None) -> np.ndarray:
+    """去掉左边 phase[0] 列、上边 phase[1] 行后缩小的灰度模板（二维输入视为掩码，按最近邻缩小）
+    cache_name 为模板的唯一名称（如 "模板名@缩放比例"），按 (名称, 比例, 相位) 缓存；为None时不缓存"""
+    cache_key = (cache_name, coarse_scale, phase)
+    image = _coarse_templates.get(cache_key) if cache_name is not None else None
+    if image is None:
+        cropped = np.asarray(template)[phase[1]:, phase[0]:]
+        height, width = cropped.shape[:2]
+        size = (max(1, int(round(width * coarse_scale))), max(1, int(round(height * coarse_scale))))
+        if cropped.ndim == 2:
+            image = cv2.resize(cropped, size, interpolation=cv2.INTER_NEAREST)
+        else:
+            gray = cv2.cvtColor(np.ascontiguousarray(cropped), cv2.COLOR_BGR2GRAY)
+            image = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        if cache_name is not None:
+            with _coarse_lock:
+                _coarse_templates[cache_key] = image
+    return image
+
+def coarseToFineMatch(frame: Frame, template_bgr: np.ndarray, region: Optional[Bbox], confidence: float,
+                      mask: Optional[np.ndarray] = None,
+                      coarse_scale: float = kMatchConfig.coarse_scale,
+                      max_candidates: int = kMatchConfig.coarse_candidates,
+                      time_budget: Optional[float] = None,
+                      cache_name: Optional[str] = None,
+                      reject_margin: Optional[float] = None) -> Optional[MatchResult]:
+    """
+    两级匹配：先在缩小的灰度帧上找候选峰值，再只在候选附近做全分辨率彩色匹配
+    缩小图按 2x2（1/coarse_scale）像素块取平均，模板落在块内不同相位时缩小后的样子不同，
+    因此粗搜对每个相位各用一个缩小模板；粗搜分数主要用来排序候选，分数最高的 max_candidates 个候选都在全分辨率上验证，
+    只有所有相位的最高分都比置信度低出 reject_margin 以上（远超粗搜与全分辨率分数的实测差距）时才直接判定未找到
+    Args:
+        frame: 帧（缩小的灰度视图由帧缓存，多个模板共享）
+        template_bgr: 全分辨率BGR模板
+        region: 搜索区域（窗口坐标系），None为整个窗口
+        confidence: 置信度（找到与否由全分辨率验证的分数决定，粗搜分数只用于保守的提前拒绝）
+        mask: 模板的透明度掩码，粗搜和验证都只比较不透明的像素
+        time_budget: 时间预算（秒），超出后不再验证剩余候选（分数最高的候选总会验证），None时取 kMatchConfig.time_budget_ms
+        cache_name: 模板的唯一名称，缩小的模板按它缓存，None时每次重新缩小
+        reject_margin: 提前拒绝的余量，None时取 kMatchConfig.coarse_reject_margin
+    Returns:
+        MatchResult: 验证过的最佳结果，提前拒绝时为None
+    """
+    start_time = time.perf_counter()
+    if time_budget is None:
+        time_budget = kMatchConfig.time_budget_ms / 1000.0
+    if reject_margin is None:
+        reject_margin = kMatchConfig.coarse_reject_margin
+    template_height, template_width = template_bgr.shape[:2]
+    if min(template_height, template_width) * coarse_scale < kCoarseMinSide:
+        return matchInRegion(frame.bgr, template_bgr, region, mask)
+
+    coarse_frame = frame.downscaled(coarse_scale, gray=True)
+    offset_x = offset_y = 0
+    if region is not None:
+        coarse_region = clipBbox(Bbox(int(region.left * coarse_scale), int(region.top * coarse_scale),
+                                      int(np.ceil(region.right * coarse_scale)), int(np.ceil(region.bottom * coarse_scale))),
+                                 coarse_frame.shape[1], coarse_frame.shape[0])
+        coarse_frame = coarse_frame[coarse_region.top:coarse_region.bottom, coarse_region.left:coarse_region.right]
+        offset_x, offset_y = coarse_region.left, coarse_region.top
+
+    # 每个相位依次取最高峰并抑制其邻域，得到互不重叠的候选（换算回全分辨率的左上角）
+    candidates = []
+    for phase in coarsePhases(coarse_scale):
+        coarse_template = coarseTemplate(template_bgr, coarse_scale, phase, cache_name)
+        coarse_height, coarse_width = coarse_template.shape[:2]
+        if coarse_height > coarse_frame.shape[0] or coarse_width > coarse_frame.shape[1]:
+            continue
+        coarse_mask = (coarseTemplate(mask, coarse_scale, phase, cache_name and cache_name + "#mask")
+                       if mask is not None else None)
+        scores = matchScores(coarse_frame, coarse_template, coarse_mask)
+        for _ in range(max_candidates):
+            _, peak, _, (x, y) = cv2.minMaxLoc(scores)
+            if peak <= -1.0:
+                break
+            candidates.append((peak, int(round((x + offset_x) / coarse_scale)) - phase[0],
+                               int(round((y + offset_y) / coarse_scale)) - phase[1]))
+            scores[max(0, y - coarse_height // 2):y + coarse_height // 2 + 1,
+                   max(0, x - coarse_width // 2):x + coarse_width // 2 + 1] = -1.0
+    if not candidates or max(candidate[0] for candidate in candidates) < confidence - reject_margin:
+        return None
+
+    # 不同相位找到的同一位置只验证一次
+    padding = int(np.ceil(1.0 / coarse_scale)) + 2
+    selected = []
+    for peak, left, top in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if all(abs(left - other_left) > padding or abs(top - other_top) > padding for _, other_left, other_top in selected):
+            selected.append((peak, left, top))
+        if len(selected) >= max_candidates:
+            break
+
+    # 粗搜坐标外扩量化误差后在全分辨率上验证
+    best: Optional[MatchResult] = None
+    for index, (_, left, top) in enumerate(selected):
+        if index > 0 and time.perf_counter() - start_time > time_budget:
+            break
+        verify_region = Bbox(left - padding, top - padding, left + template_width + padding, top + template_height + padding)
+        result = matchInRegion(frame.bgr, template_bgr, verify_region, mask)
+        if result is not None and (best is None or result.score > best.score):
+            best = result
+    return best
+
+# 上次命中位置向外扩展的像素数，在这个范围内先做局部搜索
+kHintPadding = 32
+
+@dataclass
+class HintStats:
+    """单个模板的搜索提示统计"""
+    hits: int = 0               # 局部搜索命中次数
+    misses: int = 0             # 局部搜索未命中、退回全窗口搜索的次数
+    full_searches: int = 0      # 全窗口（或元数据区域）搜索次数
+    full_time: float = 0.0      # 全窗口搜索耗时的滑动平均（秒）
+    time_saved: float = 0.0     # 相比每次都全窗口搜索节省的总耗时（秒），未命中浪费的时间会扣除
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+class SearchHints:
+    """记录每个模板在每个窗口上次被找到的位置，下次先在附近搜索
+    以 (hwnd, 模板名, 帧宽, 帧高) 为键，窗口尺寸变化后旧位置自动失效
+    """
+
+    def __init__(self, padding: int = kHintPadding):
+        self.padding = padding
+        self._hints: Dict[Tuple[int, str, int, int], Bbox] = {}
+        self._stats: Dict[str, HintStats] = {}
+        self._lock = threading.Lock()
+
+    def region(self, key: Tuple[int, str, int, int]) -> Optional[Bbox]:
+        """上次命中位置外扩padding后的搜索区域，没有记录时返回None"""
+        bbox = self._hints.get(key)
+        if bbox is None:
+            return None
+        return Bbox(bbox.left - self.padding, bbox.top - self.padding,
+                    bbox.right + self.padding, bbox.bottom + self.padding)
+
+    def _getStats(self, name: str) -> HintStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = HintStats()
+        return stats
+
+    def recordHit(self, key: Tuple[int, str, int, int], bbox: Bbox, elapsed: float):
+        with self._lock:
+            stats = self._getStats(key[1])
+            stats.hits += 1
+            if stats.full_time > 0:
+                stats.time_saved += stats.full_time - elapsed
+            self._hints[key] = bbox
+
+    def recordMiss(self, key: Tuple[int, str, int, int], elapsed: float):
+        with self._lock:
+            stats = self._getStats(key[1])
+            stats.misses += 1
+            stats.time_saved -= elapsed
+
+    def recordFullSearch(self, key: Tuple[int, str, int, int], bbox: Optional[Bbox], elapsed: float):
+        """记录一次全窗口搜索，bbox为达到置信度的命中位置（未命中为None）"""
+        with self._lock:
+            stats = self._getStats(key[1])
+            stats.full_searches += 1
+            stats.full_time = elapsed if stats.full_time == 0 else stats.full_time * 0.8 + elapsed * 0.2
+            if bbox is not None:
+                self._hints[key] = bbox
+            else:
+                self._hints.pop(key, None)
+
+    def clear(self, hwnd: Optional[int] = None):
+        """清除指定窗口（None为全部）的搜索提示"""
+        with self._lock:
+            if hwnd is None:
+                self._hints.clear()
+            else:
+                for key in [key for key in self._hints if key[0] == hwnd]:
+                    del self._hints[key]
+
+    def stats(self) -> Dict[str, HintStats]:
+        with self._lock:
+            return {name: HintStats(**vars(stats)) for name, stats in self._stats.items()}
+
+    def summary(self) -> str:
+        """每个模板的命中率和节省时间，用于日志"""
+        lines = ["[图像识别] 搜索提示统计:"]
+        for name, stats in sorted(self.stats().items()):
+            lines.append(f"  {name}: 命中率 {stats.hit_rate:.0%}（{stats.hits}/{stats.hits + stats.misses}），"
+                         f"全窗口搜索 {stats.full_searches} 次，节省 {stats.time_saved * 1000:.1f}ms")
+        return "\n".join(lines)
+
+# 全局搜索提示，所有 ImageMatch 实例共享
+kSearchHints = SearchHints()
+
+# 匹配结果缓存的最大条目数
+kMatchCacheSize = 256
+_kCacheMissing = object()
+
+class MatchCache:
+    """匹配结果的LRU缓存
+    键为 (模板, 缩放比例, 置信度, 匹配模式, 搜索区域, 区域像素哈希)，区域画面没变时直接返回上次的结果（包括未找到）
+    """
+
+    def __init__(self, capacity: int = kMatchCacheSize):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Optional[MatchResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple):
+        """取缓存的结果，没有时返回 _kCacheMissing"""
+        with self._lock:
+            result = self._entries.get(key, _kCacheMissing)
+            if result is _kCacheMissing:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: Tuple, result: Optional[MatchResult]):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        return f"[图像识别] 结果缓存: 命中率 {hit_rate:.0%}（{self.hits}/{total}），当前 {len(self._entries)} 条"
+
+# 全局匹配结果缓存，所有 ImageMatch 实例共享
+kMatchCache = MatchCache()
+
+# 窗口缩放系数的候选，覆盖 1080p 与 2k 等分辨率（2k/1080p ≈ 1.33）；离线标定模板自身的比例时也在这些比例上搜索
+kMatchScales = (1.0, 0.75, 0.8, 0.9, 1.1, 1.2, 1.25, 1.33, 1.5)
+# 多尺度标定失败后，隔多少秒才允许再次标定（期间按模板自身的比例匹配）
+kCalibrationRetryInterval = 5.0
+
+def scaleBbox(bbox: Optional[Bbox], scale: float) -> Optional[Bbox]:
+    if bbox is None or scale == 1.0:
+        return bbox
+    return Bbox(int(bbox.left * scale), int(bbox.top * scale), int(bbox.right * scale + 0.5), int(bbox.bottom * scale + 0.5))
+
+def templateScale(template: TemplateEntry, window_scale: float) -> float:
+    """模板在窗口上的搜索比例 = 模板自身离线标定的比例（未标定为1）* 窗口的缩放系数"""
+    return round((template.scale or 1.0) * window_scale, 3)
+
+class ScaleCalibration:
+    """每个窗口的缩放系数（相对各模板自身离线标定的比例，见 templateScale）
+    以 (hwnd, 帧宽, 帧高) 为键，第一次在多个系数上找到模板后缓存胜出的系数，窗口尺寸变化后重新标定
+    系数是窗口的属性，对所有模板通用；各模板离线标定比例的差异不会带到其他模板上
+    """
+
+    def __init__(self, scales=kMatchScales, retry_interval: float = kCalibrationRetryInterval):
+        self.scales = tuple(scales)
+        self.retry_interval = retry_interval
+        self._scales: Dict[Tuple[int, int, int], float] = {}
+        self._last_attempt: Dict[Tuple[int, int, int, str], float] = {}
+        self._templates: Dict[Tuple[str, float], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[int, int, int]) -> Optional[float]:
+        return self._scales.get(key)
+
+    def set(self, key: Tuple[int, int, int], scale: float):
+        with self._lock:
+            self._scales[key] = scale
+
+    def shouldCalibrate(self, key: Tuple[int, int, int], name: str) -> bool:
+        """窗口未标定，且用该模板标定失败后已超过重试间隔（当前画面里没有的模板不会反复拖慢匹配）"""
+        if key in self._scales:
+            return False
+        with self._lock:
+            now = time.time()
+            attempt_key = key + (name,)
+            if now - self._last_attempt.get(attempt_key, 0.0) < self.retry_interval:
+                return False
+            self._last_attempt[attempt_key] = now
+            return True
+
+    def scaledTemplate(self, template: TemplateEntry, scale: float) -> np.ndarray:
+        """缩放后的模板像素，按 (模板名, 比例) 缓存"""
+        if scale == 1.0:
+            return template.image
+        cache_key = (template.name, scale)
+        image = self._templates.get(cache_key)
+        if image is None:
+            height, width = template.image.shape[:2]
+            size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            image = cv2.resize(np.asarray(template.image), size, interpolation=interpolation)
+            with self._lock:
+                self._templates[cache_key] = image
+        return image
+
+    def scaledMask(self, template: TemplateEntry, scale: float) -> Optional[np.ndarray]:
+        """缩放后的透明度掩码（最近邻），模板不透明时为None"""
+        if template.mask is None or scale == 1.0:
+            return template.mask
+        cache_key = (template.name + "#mask", scale)
+        mask = self._templates.get(cache_key)
+        if mask is None:
+            height, width = self.scaledTemplate(template, scale).shape[:2]
+            mask = cv2.resize(np.asarray(template.mask), (width, height), interpolation=cv2.INTER_NEAREST)
+            with self._lock:
+                self._templates[cache_key] = mask
+        return mask
+
+    def clear(self, hwnd: Optional[int] = None):
+        with self._lock:
+            if hwnd is None:
+                self._scales.clear()
+                self._last_attempt.clear()
+            else:
+                for key in [key for key in self._scales if key[0] == hwnd]:
+                    del self._scales[key]
+                for key in [key for key in self._last_attempt if key[0] == hwnd]:
+                    del self._last_attempt[key]
+
+# 全局尺度标定，所有 ImageMatch 实例共享
+kScaleCalibration = ScaleCalibration()
 
 class ImageMatch:
-    def __init__(self, hwnd:int):
-        self.window_manager = WindowManager()
+    def __init__(self, hwnd:int, frame_source: Optional[FrameSource] = None):
+        # 未指定时使用全局默认帧来源
+        self.frame_source = frame_source
+        self.window_manager = WindowManager(frame_source)
         self.hwnd = hwnd
-    
-    def getImageCenterPos(self, image_path:str, confidence:float = 0.8, is_print:bool = True, max_retries:int = 3, retry_interval:float = 0.5):
+
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
+
+    def matchInFrame(self, frame: Frame, image_path:str, confidence:Optional[float] = None) -> Optional[MatchResult]:
+        """在已有的帧中查找图片，返回最佳匹配（不论分数高低）
+        先在该模板上次命中位置附近搜索，达到置信度直接返回；否则退回全窗口搜索
+        模板元数据配置了期望区域时全窗口搜索只在该区域内进行
+        模板按 模板元数据中离线标定的比例 * 该窗口标定的缩放系数 搜索，窗口尚未标定时系数先取1，
+        仍未找到再在 kMatchScales 的各个系数上搜索并缓存胜出的系数
+        已标定的窗口上，搜索区域像素与之前某次相同时直接返回缓存的结果（kMatchCache）"""
+        template = getTemplate(image_path)
+        if confidence is None:
+            confidence = template.confidence
+        image = frame.bgr
+        window_key = (frame.hwnd, frame.width, frame.height)
+        scale = kScaleCalibration.get(window_key)
+        search_scale = templateScale(template, scale or 1.0)
+        template_image = kScaleCalibration.scaledTemplate(template, search_scale)
+        template_mask = kScaleCalibration.scaledMask(template, search_scale)
+        key = (frame.hwnd, template.name, frame.width, frame.height)
+
+        def cachedSearch(region: Bbox, search) -> Optional[MatchResult]:
+            if scale is None:
+                return search()
+            cache_key = (template.name, search_scale, confidence, kMatchConfig.mode, region, frame.regionHash(region))
+            result = kMatchCache.get(cache_key)
+            if result is _kCacheMissing:
+                result = search()
+                kMatchCache.put(cache_key, result)
+            return result
+
+        hint_region = kSearchHints.region(key)
+        if hint_region is not None:
+            start_time = time.perf_counter()
+            hint_region = clipBbox(hint_region, frame.width, frame.height)
+            result = cachedSearch(hint_region, lambda: matchInRegion(image, template_image, hint_region, template_mask))
+            elapsed = time.perf_counter() - start_time
+            if result is not None and result.score >= confidence:
+                kSearchHints.recordHit(key, result.bbox, elapsed)
+                kScoreLog.record(frame.timestamp, template.name, result.score, confidence, search_scale)
+                return result
+            kSearchHints.recordMiss(key, elapsed)
+
+        start_time = time.perf_counter()
+        region = clipBbox(scaleBbox(template.roi, search_scale) or Bbox(0, 0, frame.width, frame.height), frame.width, frame.height)
+        if kMatchConfig.mode == "coarse_to_fine":
+            result = cachedSearch(region, lambda: coarseToFineMatch(frame, template_image, region, confidence, template_mask,
+                                                                    cache_name=f"{template.name}@{search_scale}"))
+        else:
+            result = cachedSearch(region, lambda: matchTiled(image, template_image, region, template_mask))
+        elapsed = time.perf_counter() - start_time
+        if scale is None:
+            if result is not None and result.score >= confidence:
+                # 按模板自身的比例命中，窗口没有额外缩放
+                kScaleCalibration.set(window_key, 1.0)
+            elif kScaleCalibration.shouldCalibrate(window_key, template.name):
+                result, search_scale = self._calibrateScale(image, template, confidence, window_key, result)
+        hit_bbox = result.bbox if result is not None and result.score >= confidence else None
+        kSearchHints.recordFullSearch(key, hit_bbox, elapsed)
+        kScoreLog.record(frame.timestamp, template.name, result.score if result is not None else 0.0, confidence, search_scale)
+        return result
+
+    def _calibrateScale(self, image: np.ndarray, template: TemplateEntry, confidence: float,
+                        window_key: Tuple[int, int, int], best: Optional[MatchResult]) -> Tuple[Optional[MatchResult], float]:
+        """在其余缩放系数上并行搜索模板（系数1已搜索过），达到置信度时缓存分数最高的系数，
+        返回所有系数中的最佳结果及其搜索比例"""
+        factors = [factor for factor in kScaleCalibration.scales if factor != 1.0]
+        scales = [templateScale(template, factor) for factor in factors]
+        results = kMatchExecutor.map(
+            lambda scale: matchInRegion(image, kScaleCalibration.scaledTemplate(template, scale), scaleBbox(template.roi, scale),
+                                        kScaleCalibration.scaledMask(template, scale)),
+            scales)
+        best_factor, best_scale = 1.0, templateScale(template, 1.0)
+        for factor, scale, result in zip(factors, scales, results):
+            if result is not None and (best is None or result.score > best.score):
+                best, best_factor, best_scale = result, factor, scale
+        if best is not None and best.score >= confidence:
+            kScaleCalibration.set(window_key, best_factor)
+            print(f"[图像识别] 窗口 {window_key[0]}（{window_key[1]}x{window_key[2]}）缩放系数标定为 {best_factor}（{template.name}，分数 {best.score:.3f}）")
+        return best, best_scale
+
+    def classifyScene(self, scene_templates: Dict[str, str], state_index: Optional[StateIndex] = None) -> SceneResult:
         """
-        获取图片在窗口坐标系下的中心位置
+        在同一帧上一次性匹配所有场景模板（在匹配线程池中并行），不重试、不等待
+        Args:
+            scene_templates: 场景名 -> 模板图片路径或模板名称
+            state_index: 状态索引，提供时先按感知哈希识别，结果明确时不再做模板匹配
+        Returns:
+            SceneResult: 达到各自默认置信度的场景中分数最高的一个
+        """
+        client = getVisionClient()
+        if client is not None and client.serves(self.hwnd):
+            # 窗口由识别进程负责时，在识别进程中分类（使用识别进程自己加载的状态索引）
+            return client.classify(self.hwnd, scene_templates, state_index is not None)
+        with self._getFrameSource().grabFrame(self.hwnd) as frame:
+            return self.classifySceneInFrame(frame, scene_templates, state_index)
+
+    def classifySceneInFrame(self, frame: Frame, scene_templates: Dict[str, str],
+                             state_index: Optional[StateIndex] = None) -> SceneResult:
+        """在已有的帧中分类场景（不截图），参数和返回值同 classifyScene"""
+        if state_index is not None:
+            # 参考区域按窗口的缩放系数换算，与模板期望区域一致
+            window_scale = kScaleCalibration.get((frame.hwnd, frame.width, frame.height)) or 1.0
+            state = state_index.classify(frame, scene_templates.keys(), window_scale)
+            if not state.ambiguous:
+                score = 1.0 - state.distance / 64.0
+                return SceneResult(state.label, score, {state.label: score})
+        scores: Dict[str, float] = {}
+        best_scene, best_score = None, 0.0
+        items = list(scene_templates.items())
+        results = kMatchExecutor.map(lambda item: self.matchInFrame(frame, item[1]), items)
+        # 按场景定义的顺序合并，分数相同时取先定义的场景
+        for (scene, image_path), result in zip(items, results):
+            score = result.score if result is not None else 0.0
+            scores[scene] = score
+            if score >= getTemplate(image_path).confidence and score > best_score:
+                best_scene, best_score = scene, score
+        if best_scene is None and scores:
+            best_score = max(scores.values())
+        return SceneResult(best_scene, best_score, scores)
+
+    def _locateOnce(self, image_path: str, confidence: float) -> Optional[MatchResult]:
+        """匹配一次，达到置信度时保存截图；窗口由识别进程负责时转发给识别进程"""
+        client = getVisionClient()
+        if client is not None and client.serves(self.hwnd):
+            return client.locate(self.hwnd, image_path, confidence)
+        # 每次重试都重新截取整个窗口（窗口位置由帧来源动态获取）
+        with self._getFrameSource().grabFrame(self.hwnd) as frame:
+            result = self.matchInFrame(frame, image_path, confidence)
+            if result is not None and result.score >= confidence:
+                self.window_manager.saveBboxImage(self.hwnd, result.bbox, frame)
+            return result
+
+    def locate(self, image_path:str, confidence:Optional[float] = None, is_print:bool = True, max_retries:int = 3, retry_interval:float = 0.5, error_prefix:str = "查找图片失败"):
+        """
+        在整个窗口截图中查找图片
         Args:
-            image_path: 图片路径
-            confidence: 置信度
+            image_path: 图片路径或模板名称
+            confidence: 置信度，None时使用模板元数据中的默认置信度
             is_print: 是否打印错误信息
             max_retries: 最大重试次数（默认3次）
             retry_interval: 重试间隔秒数（默认0.5秒）
         Returns:
-            Point: 图片中心位置
+            MatchResult: 窗口坐标系下的bbox、中心点和匹配分数
             None: 未找到图片
         """
         last_exception = None
-        
+        # 各次尝试中的最高分（包括低于置信度的），用于日志
+        best_score = 0.0
+        if confidence is None:
+            confidence = getTemplate(image_path).confidence
+
         for attempt in range(max_retries):
             try:
-                # 动态获取当前窗口位置，而不是使用缓存的位置
-                window_rect = self.window_manager.getWindowRect(self.hwnd)
-                current_window_x = window_rect[0]
-                current_window_y = window_rect[1]
-                current_window_width = window_rect[2] - window_rect[0]
-                current_window_height = window_rect[3] - window_rect[1]
-                
-                window_region = (current_window_x, current_window_y, current_window_width, current_window_height)
-                pic_region = pyautogui.locateOnScreen(
-                    image=image_path, 
-                    confidence=confidence,
-                    grayscale=False,
-                    region=window_region    # 指定搜索区域
-                )
-                if pic_region is not None:
-                    local_pic_x = int(pic_region.left + pic_region.width / 2 - current_window_x)
-                    local_pic_y = int(pic_region.top + pic_region.height / 2 - current_window_y) 
-                    bbox_left = pic_region.left - current_window_x
-                    bbox_top = pic_region.top - current_window_y
-                    bbox_right = pic_region.left + pic_region.width - current_window_x
-                    bbox_bottom = pic_region.top + pic_region.height - current_window_y
-                    self.window_manager.saveBboxImage(self.hwnd, Bbox(bbox_left, bbox_top, bbox_right, bbox_bottom))
-                    
+                result = self._locateOnce(image_path, confidence)
+                if result is not None:
+                    best_score = max(best_score, result.score)
+                if result is not None and result.score >= confidence:
                     # 如果是重试成功的，打印提示信息
                     if attempt > 0:
                         print(f"[图像识别] 第{attempt + 1}次尝试成功找到图像")
-                    
-                    return Point(local_pic_x, local_pic_y)
-                else:
-                    # 图像未找到，如果还有重试机会，继续尝试
-                    if attempt < max_retries - 1:
-                        if is_print:
-                            print(f"[图像识别] 第{attempt + 1}次未找到图像，{retry_interval}秒后重试...")
-                        time.sleep(retry_interval)
-                        continue
-                    
+
+                    return result
+
+                # 图像未找到，如果还有重试机会，继续尝试
+                if attempt < max_retries - 1:
+                    if is_print:
+                        print(f"[图像识别] 第{attempt + 1}次未找到图像，{retry_interval}秒后重试...")
+                    time.sleep(retry_interval)
+                    continue
+
             except Exception as e:
                 last_exception = e
                 # 如果还有重试机会，继续尝试
@@ -78,22 +620,38 @@ class ImageMatch:
                         print(f"[图像识别] 第{attempt + 1}次识别出错: {e}，{retry_interval}秒后重试...")
                     time.sleep(retry_interval)
                     continue
-        
+
         # 所有重试都失败了，打印最终错误信息
         if is_print:
             if last_exception:
-                print(f"获取图片中心位置失败: {last_exception}")
+                print(f"{error_prefix}: {last_exception}")
             else:
-                print(f"获取图片中心位置失败: 未找到图像（已重试{max_retries}次）")
-        
+                print(f"{error_prefix}: 未找到图像（已重试{max_retries}次，最高分{best_score:.3f}）")
+
         return None
-    
-    def getImageBbox(self, image_path:str, confidence:float = 0.8, is_print:bool = True, max_retries:int = 3, retry_interval:float = 0.5):
+
+    def getImageCenterPos(self, image_path:str, confidence:Optional[float] = None, is_print:bool = True, max_retries:int = 3, retry_interval:float = 0.5):
+        """
+        获取图片在窗口坐标系下的中心位置
+        Args:
+            image_path: 图片路径或模板名称
+            confidence: 置信度，None时使用模板元数据中的默认置信度
+            is_print: 是否打印错误信息
+            max_retries: 最大重试次数（默认3次）
+            retry_interval: 重试间隔秒数（默认0.5秒）
+        Returns:
+            Point: 图片中心位置
+            None: 未找到图片
+        """
+        result = self.locate(image_path, confidence, is_print, max_retries, retry_interval, "获取图片中心位置失败")
+        return result.center if result is not None else None
+
+    def getImageBbox(self, image_path:str, confidence:Optional[float] = None, is_print:bool = True, max_retries:int = 3, retry_interval:float = 0.5):
         """
         获取图片在窗口坐标系下的bbox
         Args:
-            image_path: 图片路径
-            confidence: 置信度
+            image_path: 图片路径或模板名称
+            confidence: 置信度，None时使用模板元数据中的默认置信度
             is_print: 是否打印错误信息
             max_retries: 最大重试次数（默认3次）
             retry_interval: 重试间隔秒数（默认0.5秒）
@@ -101,75 +659,9 @@ class ImageMatch:
             Bbox: 图片bbox
             None: 未找到图片
         """
-        last_exception = None
-        
-        for attempt in range(max_retries):
-            try:
-                # 动态获取当前窗口位置，而不是使用缓存的位置
-                window_rect = self.window_manager.getWindowRect(self.hwnd)
-                current_window_x = window_rect[0]
-                current_window_y = window_rect[1]
-                current_window_width = window_rect[2] - window_rect[0]
-                current_window_height = window_rect[3] - window_rect[1]
-                
-                window_region = (current_window_x, current_window_y, current_window_width, current_window_height)
-                pic_region = pyautogui.locateOnScreen(
-                    image=image_path, 
-                    confidence=confidence,
-                    grayscale=False,
-                    region=window_region    # 指定搜索区域
-                )
-                if pic_region is not None:
-                    bbox_left = pic_region.left - current_window_x
-                    bbox_top = pic_region.top - current_window_y
-                    bbox_right = pic_region.left + pic_region.width - current_window_x
-                    bbox_bottom = pic_region.top + pic_region.height - current_window_y
-                    self.window_manager.saveBboxImage(self.hwnd, Bbox(bbox_left, bbox_top, bbox_right, bbox_bottom))
-                    
-                    # 如果是重试成功的，打印提示信息
-                    if attempt > 0:
-                        print(f"[图像识别] 第{attempt + 1}次尝试成功找到图像")
-                    
-                    return Bbox(bbox_left, bbox_top, bbox_right, bbox_bottom)
-                else:
-                    # 图像未找到，如果还有重试机会，继续尝试
-                    if attempt < max_retries - 1:
-                        if is_print:
-                            print(f"[图像识别] 第{attempt + 1}次未找到图像，{retry_interval}秒后重试...")
-                        time.sleep(retry_interval)
-                        continue
-                        
-            except Exception as e:
-                last_exception = e
-                # 如果还有重试机会，继续尝试
-                if attempt < max_retries - 1:
-                    if is_print:
-                        print(f"[图像识别] 第{attempt + 1}次识别出错: {e}，{retry_interval}秒后重试...")
-                    time.sleep(retry_interval)
-                    continue
-        
-        # 所有重试都失败了，打印最终错误信息
-        if is_print:
-            if last_exception:
-                print(f"获取图片bbox失败: {last_exception}")
-            else:
-                print(f"获取图片bbox失败: 未找到图像（已重试{max_retries}次）")
-        
-        return None
+        result = self.locate(image_path, confidence, is_print, max_retries, retry_interval, "获取图片bbox失败")
+        return result.bbox if result is not None else None
 
 
 if __name__ == "__main__":
     pass
-        
-        
-
-    
-        
-
-
-
-
-
-
-
-
@@ -0,0 +1,195 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 布局标定：代码中的固定坐标（血条采样点、头像、自动寻路按钮、世界地图、人物区域等）按参考窗口标定，
+       每个窗口尺寸第一次使用时按窗口尺寸与参考尺寸之比求缩放，按锚点模板（或对齐方式）求每组坐标的平移，缓存到窗口尺寸变化
+       坐标换算是一次向量化的 坐标*缩放+平移，检测器每次调用不再需要全窗口搜索
+       配置写在 res/layout.yaml，文件不存在时坐标不做换算
+"""
+import os
+import time
+import threading
+import numpy as np
+import yaml
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from game_param import Point, Bbox, kLayoutPath, kCoordProfile
+from frame_source import FrameSource, getDefaultFrameSource
+from template_pack import getTemplate
+from match_executor import kMatchExecutor
+from img_match import ImageMatch
+
+# 配置了锚点但当前画面中没找到时，隔多少秒再重新找（期间按对齐方式换算）
+kLayoutRetryInterval = 5.0
+
+@dataclass(frozen=True)
+class LayoutGroup:
+    """一组随同一块界面移动的坐标"""
+    align: Tuple[float, float] = (0.0, 0.0)     # 没有锚点时的对齐方式（0=左/上，0.5=居中，1=右/下）
+    anchor: Optional[str] = None                # 锚点模板名
+    anchor_pos: Optional[Point] = None          # 锚点在参考窗口中的左上角
+
+# 默认的坐标分组：队伍面板贴左上角，小地图和自动寻路按钮贴右上角，世界地图和人物以窗口中心对齐
+kDefaultLayoutGroups = {
+    "party": LayoutGroup((0.0, 0.0)),
+    "minimap": LayoutGroup((1.0, 0.0)),
+    "center": LayoutGroup((0.5, 0.5)),
+}
+
+def loadLayoutConfig(path: str = kLayoutPath) -> Tuple[Optional[Tuple[int, int]], Dict[str, LayoutGroup]]:
+    """读取布局配置，返回 (参考窗口尺寸, 坐标分组)；没有配置参考尺寸时取坐标表的 window_size（也未配置时为None）"""
+    groups = dict(kDefaultLayoutGroups)
+    if not os.path.exists(path):
+        return kCoordProfile.window_size, groups
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    reference_size = data.get("reference_size")
+    if not (isinstance(reference_size, list) and len(reference_size) == 2 and all(isinstance(v, int) for v in reference_size)):
+        # 没有单独配置时，使用当前坐标表标定时的窗口尺寸
+        reference_size = kCoordProfile.window_size
+    for name, value in (data.get("groups") or {}).items():
+        if not isinstance(value, dict):
+            continue
+        default = groups.get(name, LayoutGroup())
+        align = value.get("align")
+        anchor = value.get("anchor")
+        anchor_pos = value.get("anchor_pos")
+        groups[str(name)] = LayoutGroup(
+            align=tuple(float(v) for v in align) if isinstance(align, list) and len(align) == 2 else default.align,
+            anchor=anchor if isinstance(anchor, str) else None,
+            anchor_pos=Point(*[int(v) for v in anchor_pos]) if isinstance(anchor_pos, list) and len(anchor_pos) == 2 else None,
+        )
+    return (tuple(reference_size) if reference_size else None), groups
+
+@dataclass(frozen=True)
+class LayoutTransform:
+    """一个窗口尺寸下每组坐标的换算：窗口坐标 = 参考坐标 * scales[组] + offsets[组]"""
+    groups: Dict[str, int]
+    scales: np.ndarray          # (组数,)
+    offsets: np.ndarray         # (组数, 2)
+    complete: bool              # 配置的锚点是否都已找到
+    created: float
+
+    def points(self, group: str, points: np.ndarray) -> np.ndarray:
+        """换算形如 (..., 2) 的 (x, y) 坐标"""
+        index = self.groups[group]
+        return np.rint(np.asarray(points, dtype=np.float32) * self.scales[index] + self.offsets[index]).astype(np.int32)
+
+    def referencePoints(self, group: str, points: np.ndarray) -> np.ndarray:
+        """points 的逆换算：窗口当前布局下的坐标换回参考窗口坐标（标定坐标表时使用）"""
+        index = self.groups[group]
+        return np.rint((np.asarray(points, dtype=np.float32) - self.offsets[index]) / self.scales[index]).astype(np.int32)
+
+    def bboxes(self, group: str, bboxes: np.ndarray) -> np.ndarray:
+        """换算形如 (..., 4) 的 [left, top, right, bottom]，缩小后宽高至少保留1像素"""
+        bboxes = np.asarray(bboxes)
+        result = self.points(group, bboxes.reshape(bboxes.shape[:-1] + (2, 2))).reshape(bboxes.shape)
+        result[..., 2:] = np.maximum(result[..., 2:], result[..., :2] + 1)
+        return result
+
+
+class Layout:
+    """按 (hwnd, 窗口宽, 窗口高) 缓存布局换算，窗口尺寸变化后重新标定"""
+
+    def __init__(self, frame_source: Optional[FrameSource] = None, config_path: str = kLayoutPath,
+                 retry_interval: float = kLayoutRetryInterval):
+        # 未指定时使用全局默认帧来源
+        self.frame_source = frame_source
+        self.reference_size, self.groups = loadLayoutConfig(config_path)
+        self.retry_interval = retry_interval
+        self._group_index = {name: index for index, name in enumerate(self.groups)}
+        self._transforms: Dict[Tuple[int, int, int], LayoutTransform] = {}
+        self._lock = threading.Lock()
+
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
+
+    def transformFor(self, hwnd: int, width: Optional[int] = None, height: Optional[int] = None) -> LayoutTransform:
+        """取该窗口当前尺寸的布局换算，没有缓存（或锚点未找全且已过重试间隔）时标定"""
+        if width is None or height is None:
+            left, top, right, bottom = self._getFrameSource().getWindowRect(hwnd)
+            width, height = right - left, bottom - top
+        key = (hwnd, width, height)
+        transform = self._transforms.get(key)
+        if transform is not None and self._isValid(key, transform):
+            return transform
+        with self._lock:
+            transform = self._transforms.get(key)
+            if transform is None or not self._isValid(key, transform):
+                transform = self._calibrate(key)
+                self._transforms[key] = transform
+        return transform
+
+    def _isValid(self, key: Tuple[int, int, int], transform: LayoutTransform) -> bool:
+        return transform.complete or time.time() - transform.created < self.retry_interval
+
+    def windowScale(self, width: int, height: int) -> float:
+        """窗口尺寸（与截图帧尺寸一致）相对参考尺寸的等比缩放，取宽高比例中较小的一个；没有参考尺寸时为1"""
+        if self.reference_size is None:
+            return 1.0
+        return min(width / self.reference_size[0], height / self.reference_size[1])
+
+    def _calibrate(self, key: Tuple[int, int, int]) -> LayoutTransform:
+        """缩放取窗口尺寸相对参考尺寸的比例；没有锚点的组按对齐方式把缩放后的参考窗口放进当前窗口，有锚点的组按锚点实际位置求平移"""
+        hwnd, width, height = key
+        anchored = [(index, group) for index, group in enumerate(self.groups.values())
+                    if group.anchor is not None and group.anchor_pos is not None]
+        results = []
+        if anchored:
+            image_match = ImageMatch(hwnd, self.frame_source)
+            with self._getFrameSource().grabFrame(hwnd) as frame:
+                results = kMatchExecutor.map(lambda item: image_match.matchInFrame(frame, item[1].anchor), anchored)
+
+        window_scale = self.windowScale(width, height)
+        reference = np.array(self.reference_size or (width, height), dtype=np.float32)
+        align = np.array([group.align for group in self.groups.values()], dtype=np.float32).reshape(-1, 2)
+        scales = np.full(len(self.groups), window_scale, dtype=np.float32)
+        offsets = (np.array([width, height], dtype=np.float32) - reference * window_scale) * align
+        complete = True
+        for (index, group), result in zip(anchored, results):
+            if result is None or result.score < getTemplate(group.anchor).confidence:
+                complete = False
+                continue
+            offsets[index] = (result.bbox.left - group.anchor_pos.x * window_scale,
+                              result.bbox.top - group.anchor_pos.y * window_scale)
+
+        if self.reference_size is not None or anchored:
+            items = "，".join(f"{name} x{scales[i]:.2f}+({offsets[i, 0]:.0f},{offsets[i, 1]:.0f})"
+                             for name, i in self._group_index.items())
+            print(f"[布局] 窗口 {hwnd}（{width}x{height}）布局标定{'' if complete else '（部分锚点未找到）'}: {items}")
+        return LayoutTransform(self._group_index, scales, offsets, complete, time.time())
+
+    def points(self, hwnd: int, group: str, points: np.ndarray,
+               width: Optional[int] = None, height: Optional[int] = None) -> np.ndarray:
+        """把参考窗口下的一批 (x, y) 坐标换算到窗口的当前布局"""
+        return self.transformFor(hwnd, width, height).points(group, points)
+
+    def bboxes(self, hwnd: int, group: str, bboxes: np.ndarray,
+               width: Optional[int] = None, height: Optional[int] = None) -> np.ndarray:
+        """把参考窗口下的一批 [left, top, right, bottom] 换算到窗口的当前布局"""
+        return self.transformFor(hwnd, width, height).bboxes(group, bboxes)
+
+    def point(self, hwnd: int, group: str, point: Point) -> Point:
+        x, y = self.points(hwnd, group, (point.x, point.y))
+        return Point(int(x), int(y))
+
+    def bbox(self, hwnd: int, group: str, bbox: Bbox) -> Bbox:
+        return Bbox(*(int(v) for v in self.bboxes(hwnd, group, (bbox.left, bbox.top, bbox.right, bbox.bottom))))
+
+    def offset(self, hwnd: int, group: str, dx: int, dy: int) -> Tuple[int, int]:
+        """只按缩放换算相对偏移（例如对话框内控件相对对话框的位置）"""
+        transform = self.transformFor(hwnd)
+        scale = transform.scales[transform.groups[group]]
+        return int(round(dx * scale)), int(round(dy * scale))
+
+    def clear(self, hwnd: Optional[int] = None):
+        """清除指定窗口（None为全部）的布局缓存"""
+        with self._lock:
+            if hwnd is None:
+                self._transforms.clear()
+            else:
+                for key in [key for key in self._transforms if key[0] == hwnd]:
+                    del self._transforms[key]
+
+# 全局布局，所有检测器共享
+kLayout = Layout()
@@ -0,0 +1,84 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 匹配线程池：cv2.matchTemplate 执行时会释放GIL，多个模板/多个分块可以在线程池中真正并行
+       结果按输入顺序返回，合并规则固定，保证与串行执行的结果一致
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, TypeVar
+from game_param import Bbox, kMatchConfig
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def splitTiles(region: Bbox, template_width: int, template_height: int, tiles: int) -> List[Bbox]:
+    """
+    把搜索区域按行切成最多tiles个相互重叠的分块，相邻分块重叠 模板高度-1 行，
+    保证任何一个模板位置都完整落在某个分块内
+    Args:
+        region: 搜索区域（已限制在图像范围内）
+        template_width: 模板宽度
+        template_height: 模板高度
+        tiles: 最多分块数
+    Returns:
+        List[Bbox]: 从上到下的分块，区域太矮无法切分时只返回region本身
+    """
+    positions = region.bottom - region.top - template_height + 1
+    if tiles <= 1 or positions < tiles * 2 or region.right - region.left < template_width:
+        return [region]
+    step = (positions + tiles - 1) // tiles
+    result = []
+    for start in range(0, positions, step):
+        top = region.top + start
+        bottom = min(region.top + start + step + template_height - 1, region.bottom)
+        result.append(Bbox(region.left, top, region.right, bottom))
+    return result
+
+
+class MatchExecutor:
+    """有上限的匹配线程池
+    在线程池的工作线程内再次提交的任务直接串行执行，避免嵌套等待导致死锁
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if not max_workers:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _getPool(self) -> ThreadPoolExecutor:
+        # 第一次使用时才创建线程
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="match")
+        return self._pool
+
+    def _run(self, func: Callable[[T], R], item: T) -> R:
+        self._local.in_worker = True
+        try:
+            return func(item)
+        finally:
+            self._local.in_worker = False
+
+    def map(self, func: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """并行执行func，结果按items的顺序返回；只有一个任务、单线程或已在工作线程内时串行执行"""
+        items = list(items)
+        if len(items) <= 1 or self.max_workers <= 1 or getattr(self._local, "in_worker", False):
+            return [func(item) for item in items]
+        futures = [self._getPool().submit(self._run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+# 全局匹配线程池，线程数由 kMatchConfig.workers 决定（0为CPU核数）
+kMatchExecutor = MatchExecutor(kMatchConfig.workers)
@@ -0,0 +1,124 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 流式运动检测：按固定频率采样缩小的灰度区域，用int16帧差判断画面是否静止
+       连续N个低运动样本即判定静止，不写盘、不做固定时长的等待
+"""
+import time
+from collections import deque
+from typing import Deque, Optional
+import cv2
+import numpy as np
+from game_param import Bbox, kMotionConfig
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+
+class MotionDetector:
+    """单个区域的运动检测器"""
+
+    def __init__(self, bbox: Bbox, frame_source: Optional[FrameSource] = None,
+                 sample_interval: float = kMotionConfig.sample_interval, scale: float = kMotionConfig.scale,
+                 threshold: float = kMotionConfig.threshold, stop_samples: int = kMotionConfig.stop_samples):
+        """
+        Args:
+            bbox: 检测区域（窗口坐标系）
+            frame_source: 帧来源，None时使用全局默认帧来源
+            sample_interval: 采样间隔（秒）
+            scale: 采样前的缩小比例，与粗搜比例相同时共享帧的缩小灰度视图
+            threshold: 相邻样本平均灰度差低于该值视为低运动
+            stop_samples: 连续多少个低运动样本判定为静止
+        """
+        self.bbox = bbox
+        self.frame_source = frame_source
+        self.sample_interval = sample_interval
+        self.scale = scale
+        self.threshold = threshold
+        self.stop_samples = max(1, stop_samples)
+        # 最近的帧差，用于日志
+        self.diffs: Deque[float] = deque(maxlen=self.stop_samples * 2)
+        self._previous: Optional[np.ndarray] = None
+        self._current: Optional[np.ndarray] = None
+        self._diff: Optional[np.ndarray] = None
+        self._last_timestamp: Optional[float] = None
+        self._still_count = 0
+        self._warned_empty = False
+
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
+
+    def reset(self):
+        """清空历史样本，重新开始判断"""
+        self.diffs.clear()
+        self._previous = None
+        self._last_timestamp = None
+        self._still_count = 0
+        self._warned_empty = False
+
+    def _sampleFrame(self, frame: Frame) -> Optional[float]:
+        """取帧中检测区域的缩小灰度图，与上一个样本比较，返回平均差值
+        第一个样本、检测区域完全在画面外（区域为空，无法判断）时返回None"""
+        view = frame.downscaled(self.scale, gray=True)
+        left, top = int(self.bbox.left * self.scale), int(self.bbox.top * self.scale)
+        right, bottom = int(self.bbox.right * self.scale), int(self.bbox.bottom * self.scale)
+        region = view[max(top, 0):bottom, max(left, 0):right]
+        if region.size == 0:
+            if not self._warned_empty:
+                print(f"运动检测区域 {self.bbox} 不在画面（{frame.width}x{frame.height}）内，无法判断是否静止")
+                self._warned_empty = True
+            self._previous = None
+            return None
+
+        if self._current is None or self._current.shape != region.shape:
+            # 样本缓冲区按区域尺寸分配一次，之后循环复用
+            self._current = np.empty(region.shape, dtype=np.int16)
+            self._previous = None
+            self._diff = np.empty(region.shape, dtype=np.int16)
+        np.copyto(self._current, region, casting="unsafe")
+
+        if self._previous is None:
+            self._previous = self._current.copy()
+            return None
+        np.subtract(self._current, self._previous, out=self._diff)
+        np.abs(self._diff, out=self._diff)
+        diff = float(self._diff.mean())
+        self._previous, self._current = self._current, self._previous
+        return diff
+
+    def sample(self, hwnd: int, threshold: Optional[float] = None) -> Optional[float]:
+        """采一个样本并更新连续低运动计数；帧与上次相同（采集线程还没出新帧）或无法判断时返回None
+        threshold 只对本次采样生效，None时使用 self.threshold"""
+        with self._getFrameSource().grabFrame(hwnd) as frame:
+            if frame.timestamp == self._last_timestamp:
+                return None
+            self._last_timestamp = frame.timestamp
+            diff = self._sampleFrame(frame)
+        if diff is None:
+            return None
+        self.diffs.append(diff)
+        self._still_count = self._still_count + 1 if diff < (self.threshold if threshold is None else threshold) else 0
+        return diff
+
+    def isStopped(self) -> bool:
+        return self._still_count >= self.stop_samples
+
+    def waitUntilStopped(self, hwnd: int, max_wait_time: float, threshold: Optional[float] = None) -> bool:
+        """
+        持续采样直到连续 stop_samples 个低运动样本，或超时
+        Args:
+            threshold: 本次等待使用的低运动阈值，None时使用 self.threshold（不修改 self.threshold）
+        Returns:
+            bool: 静止返回True，超时返回False
+        """
+        self.reset()
+        start_time = time.time()
+        last_print = start_time
+        while time.time() - start_time < max_wait_time:
+            sample_time = time.time()
+            self.sample(hwnd, threshold)
+            if self.isStopped():
+                return True
+            # 每5秒打印一次运动情况
+            if sample_time - last_print >= 5 and self.diffs:
+                print(f"人物移动检测 - 最近平均像素差异值: {np.mean(self.diffs):.2f}")
+                last_print = sample_time
+            time.sleep(max(0.0, self.sample_interval - (time.time() - sample_time)))
+        return False
@@ -0,0 +1,95 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 区域订阅总线：检测器登记关注的窗口区域和回调，每个tick只对像素发生变化的区域调用回调
+       画面大部分是静止的UI，没有变化时检测器几乎没有开销
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from game_param import Bbox
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+
+@dataclass
+class Subscription:
+    """一个区域订阅"""
+    name: str
+    bbox: Bbox                                  # 窗口坐标系下关注的区域
+    callback: Callable[[Frame, Bbox], None]     # 区域变化时调用，参数为当前帧和区域
+    last_hash: Optional[int] = None             # 上次调用回调时区域像素的哈希
+    runs: int = 0                               # 回调执行次数
+    skips: int = 0                              # 区域未变化而跳过的次数
+
+class RegionBus:
+    """按窗口管理区域订阅，tick时对每个区域求像素哈希（Frame.regionHash，同一帧同一区域只算一次），
+    与上次执行回调时不同才执行回调"""
+
+    def __init__(self, frame_source: Optional[FrameSource] = None):
+        # 未指定时使用全局默认帧来源
+        self.frame_source = frame_source
+        self._subscriptions: Dict[int, Dict[str, Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
+
+    def subscribe(self, hwnd: int, name: str, bbox: Bbox, callback: Callable[[Frame, Bbox], None]) -> Subscription:
+        """登记区域和回调，同名订阅会被替换；新订阅在下一个tick必定执行一次"""
+        subscription = Subscription(name, bbox, callback)
+        with self._lock:
+            self._subscriptions.setdefault(hwnd, {})[name] = subscription
+        return subscription
+
+    def unsubscribe(self, hwnd: int, name: Optional[str] = None):
+        """注销指定订阅，name为None时注销该窗口的全部订阅"""
+        with self._lock:
+            if name is None:
+                self._subscriptions.pop(hwnd, None)
+            else:
+                self._subscriptions.get(hwnd, {}).pop(name, None)
+
+    def invalidate(self, hwnd: int, name: Optional[str] = None):
+        """让指定订阅（name为None时为全部）在下一个tick强制执行"""
+        with self._lock:
+            for subscription in self._subscriptions.get(hwnd, {}).values():
+                if name is None or subscription.name == name:
+                    subscription.last_hash = None
+
+    def tick(self, hwnd: int, frame: Optional[Frame] = None) -> List[str]:
+        """
+        检查该窗口所有订阅的区域，执行发生变化的区域的回调
+        Args:
+            hwnd: 窗口句柄
+            frame: 使用已有的帧，None时从帧来源取一帧
+        Returns:
+            List[str]: 本次执行了回调的订阅名称
+        """
+        if frame is None:
+            with self._getFrameSource().grabFrame(hwnd) as frame:
+                return self.tick(hwnd, frame)
+
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(hwnd, {}).values())
+        changed = []
+        for subscription in subscriptions:
+            region_hash = frame.regionHash(subscription.bbox)
+            if region_hash == subscription.last_hash:
+                subscription.skips += 1
+                continue
+            try:
+                subscription.callback(frame, subscription.bbox)
+                subscription.last_hash = region_hash
+                subscription.runs += 1
+                changed.append(subscription.name)
+            except Exception as e:
+                # 回调失败时不记录哈希，下一个tick重试
+                subscription.last_hash = None
+                print(f"[区域订阅] {subscription.name} 回调出错: {e}")
+        return changed
+
+    def summary(self, hwnd: int) -> str:
+        """每个订阅的执行/跳过次数，用于日志"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(hwnd, {}).values())
+        items = [f"{s.name} 执行{s.runs}/跳过{s.skips}" for s in subscriptions]
+        return "[区域订阅] " + ("，".join(items) if items else "无订阅")
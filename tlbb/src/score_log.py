@@ -0,0 +1,100 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 匹配分数记录：把每次匹配的最高分（包括未达到置信度的近似命中）写成定长二进制记录，
+       供离线查看各模板的分数分布、决定哪些模板需要重新标定置信度
+       查看统计: python score_log.py
+"""
+import os
+import atexit
+import threading
+import numpy as np
+from typing import Dict, Optional
+from game_param import kMatchConfig, kScoreLogPath
+
+# 每条记录定长 84 字节，直接追加到文件末尾，读取时 np.fromfile 一次读入
+kScoreRecordDtype = np.dtype([
+    ("time", "<f8"),            # 匹配时间（time.time()）
+    ("template", "S64"),        # 模板名（UTF-8）
+    ("score", "<f4"),           # 最高分，没有结果时为0
+    ("confidence", "<f4"),      # 本次使用的置信度
+    ("scale", "<f4"),           # 本次搜索使用的缩放比例
+])
+# 内存中攒满这么多条才写一次文件
+kScoreLogBufferSize = 1024
+# 分数低于置信度但在该范围内视为近似命中（最可能是置信度设得太高造成的漏检）
+kNearMissMargin = 0.15
+
+class ScoreLog:
+    """匹配分数记录，线程安全；未开启时 record 直接返回"""
+
+    def __init__(self, path: str = kScoreLogPath, buffer_size: int = kScoreLogBufferSize):
+        self.path = path
+        self._buffer = np.zeros(buffer_size, dtype=kScoreRecordDtype)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return kMatchConfig.score_log
+
+    def record(self, timestamp: float, template: str, score: float, confidence: float, scale: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._buffer[self._count] = (timestamp, template.encode("utf-8")[:64], score, confidence, scale)
+            self._count += 1
+            if self._count >= len(self._buffer):
+                self._flushLocked()
+
+    def _flushLocked(self):
+        if self._count == 0:
+            return
+        try:
+            with open(self.path, "ab") as f:
+                self._buffer[:self._count].tofile(f)
+        except OSError as e:
+            print(f"[图像识别] 写入匹配分数记录失败: {e}")
+        self._count = 0
+
+    def flush(self):
+        """把内存中的记录写入文件"""
+        with self._lock:
+            self._flushLocked()
+
+
+def loadScoreLog(path: str = kScoreLogPath) -> np.ndarray:
+    """读取所有分数记录，文件不存在时返回空数组"""
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=kScoreRecordDtype)
+    return np.fromfile(path, dtype=kScoreRecordDtype)
+
+def summarizeScores(records: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """按模板统计：记录数、命中率、近似命中数、命中分数的最小值和未命中分数的最大值"""
+    summary = {}
+    for name in np.unique(records["template"]):
+        rows = records[records["template"] == name]
+        hits = rows["score"] >= rows["confidence"]
+        near = ~hits & (rows["score"] >= rows["confidence"] - kNearMissMargin)
+        summary[name.decode("utf-8", errors="replace")] = {
+            "count": int(len(rows)),
+            "hit_rate": float(hits.mean()),
+            "near_misses": int(near.sum()),
+            "min_hit": float(rows["score"][hits].min()) if hits.any() else 0.0,
+            "max_miss": float(rows["score"][~hits].max()) if (~hits).any() else 0.0,
+        }
+    return summary
+
+
+# 全局分数记录，程序退出时写入剩余记录
+kScoreLog = ScoreLog()
+atexit.register(kScoreLog.flush)
+
+
+if __name__ == "__main__":
+    records = loadScoreLog()
+    if len(records) == 0:
+        print(f"没有匹配分数记录: {kScoreLogPath}（在 key_setting.yaml 中设置 match_score_log: true 开启）")
+    for name, stats in sorted(summarizeScores(records).items()):
+        print(f"{name}: {stats['count']} 次，命中率 {stats['hit_rate']:.0%}，近似命中 {stats['near_misses']} 次，"
+              f"命中最低分 {stats['min_hit']:.3f}，未命中最高分 {stats['max_miss']:.3f}")
@@ -12,14 +12,31 @@ from PyQt5.QtGui import QFont, QIcon, QPixmap, QPainter, QColor, QCursor, QKeySe
 from io import StringIO
 import os
 import time
+import multiprocessing
 import win32con
-from game_param import kHPBar, kMPBar, kDefaultKey, kProfilePhoto, kBaseDir, kResDir, kMouseClickConfig
+import numpy as np
+from game_param import kCoordProfile, kDefaultKey, kBaseDir, kResDir, kMouseClickConfig, kVisionConfig, Bbox
 from window_manager import WindowManager
-from color_detector import ColorDetector
+from color_detector import ColorDetector, kPartyStateDtype, kPartyHPStripNames, kPartyHPStrips, kPartyMPPoints
 from keyboard_simulator import KeyboardSimulator
 from auto_return import AutoReturn  # 导入AutoReturn类
 from mouse_clicker import MouseClicker
 from sys_manager import shutdownPC, cancelShutdown
+from frame_source import setDefaultFrameSource
+from capture_pipeline import kCapturePipeline
+from template_pack import loadTemplatePack
+from img_match import kSearchHints, kMatchCache
+from region_bus import RegionBus
+from vision_service import startVisionService, stopVisionService, getVisionClient
+from layout import kLayout
+
+# 队员头像坐标 [队员, (x, y)]（参考窗口下，点击前经 kLayout 换算），顺序与 ColorDetector.getPartyState 的行一致
+kPartyPhotos = kCoordProfile.photos
+
+def getCaptureOwner():
+    """负责持续采集的对象：开启识别进程时为识别进程客户端，否则为本进程的采集管线"""
+    client = getVisionClient()
+    return client if client is not None else kCapturePipeline
 
 class UILogStream:
     """自定义输出流，将print输出重定向到UI日志"""
@@ -59,8 +76,14 @@ class RaidThread(QThread):
             self.original_stdout = sys.stdout
             sys.stdout = UILogStream(self.log_signal.emit)
             
-            # 开始自动按键的主要逻辑
-            self.autoKeyPress(self.hwnd)
+            # 开始自动按键的主要逻辑；只有峨眉治疗需要读取画面，运行期间该窗口保持持续采集
+            if self.is_em:
+                getCaptureOwner().acquire(self.hwnd)
+            try:
+                self.autoKeyPress(self.hwnd)
+            finally:
+                if self.is_em:
+                    getCaptureOwner().release(self.hwnd)
         except Exception as e:
             self.log_signal.emit(f"错误：{str(e)}")
         finally:
@@ -80,6 +103,36 @@ class RaidThread(QThread):
             print("按键序列为空，无法执行")
             return
         
+        # 峨眉：订阅6名队员的血条行和蓝条采样点，只有像素变化时才重新读取该队员的状态
+        party_state = np.zeros(len(kPartyPhotos), dtype=kPartyStateDtype)
+        # 扫描整条血条得到的血量比例，只用于日志
+        hp_ratio = np.zeros(len(kPartyPhotos), dtype=np.float32)
+        region_bus = RegionBus()
+        def updatePlayer(index: int):
+            def callback(frame, bbox):
+                party_state[index] = color_detector.getPartyStateInFrame(frame)[index]
+                hp_ratio[index] = color_detector.getPartyHPRatioInFrame(frame)[index]
+            return callback
+        def updateMP(index: int):
+            # 蓝条采样点不在任何血条行内，单独订阅
+            def callback(frame, bbox):
+                party_state["mp_empty"][index] = color_detector.getPartyStateInFrame(frame)["mp_empty"][index]
+            return callback
+        # 按窗口当前的布局换算，窗口尺寸或布局标定变化后重新订阅（同名订阅会被替换）
+        subscribed_transform = None
+        def subscribeRegions():
+            nonlocal subscribed_transform
+            transform = kLayout.transformFor(hwnd)
+            if transform is subscribed_transform:
+                return
+            strips = transform.bboxes("party", kPartyHPStrips)
+            for index in range(len(kPartyPhotos)):
+                left, top, right, bottom = (int(v) for v in strips[index])
+                region_bus.subscribe(hwnd, kPartyHPStripNames[index], Bbox(left, top, right, bottom), updatePlayer(index))
+            for index, (x, y) in zip(kPartyMPPoints[:, 0], transform.points("party", kPartyMPPoints[:, 1:])):
+                region_bus.subscribe(hwnd, f"mp{index + 1}", Bbox(int(x), int(y), int(x) + 1, int(y) + 1), updateMP(int(index)))
+            subscribed_transform = transform
+        
         # 主循环
         cycle_count = 0
         while self.running:
@@ -106,130 +159,40 @@ class RaidThread(QThread):
             # keyboard_simulator.pressKey(kDefaultKey.pet_eat, hwnd)
             
             # # 2.1 如果自己空蓝，点击血迹
-            # mp_color_p1 = color_detector.getPixelPosColorInWindow(hwnd, kMPBar.player1.x, kMPBar.player1.y)
+            # mp_color_p1 = color_detector.getPixelPosColorInWindow(hwnd, *kCoordProfile.mp_bar[0, 1:])
             # if color_detector.isEmpty(mp_color_p1):
             #     keyboard_simulator.pressKey(kDefaultKey.xue_ji, hwnd)
             
             # 2.1 峨眉
             if self.is_em:
-                # p1相关条件
-                is_p1_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p1_low.x, kHPBar.p1_low.y))
-                is_p1_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p1_mid.x, kHPBar.p1_mid.y))
-                is_p1_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p1_high.x, kHPBar.p1_high.y))
-                
-                # p2相关条件
-                is_p2_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p2_low.x, kHPBar.p2_low.y))
-                is_p2_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p2_mid.x, kHPBar.p2_mid.y))
-                is_p2_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p2_high.x, kHPBar.p2_high.y))
-                
-                # p3相关条件
-                is_p3_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p3_low.x, kHPBar.p3_low.y))
-                is_p3_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p3_mid.x, kHPBar.p3_mid.y))
-                is_p3_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p3_high.x, kHPBar.p3_high.y))
-                
-                # p4相关条件
-                is_p4_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p4_low.x, kHPBar.p4_low.y))
-                is_p4_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p4_mid.x, kHPBar.p4_mid.y))
-                is_p4_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p4_high.x, kHPBar.p4_high.y))
-                
-                # p5相关条件
-                is_p5_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p5_low.x, kHPBar.p5_low.y))
-                is_p5_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p5_mid.x, kHPBar.p5_mid.y))
-                is_p5_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p5_high.x, kHPBar.p5_high.y))
-                
-                # p6相关条件
-                is_p6_alive = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p6_low.x, kHPBar.p6_low.y))
-                is_p6_mid_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p6_mid.x, kHPBar.p6_mid.y))
-                is_p6_high_hp = color_detector.isRed(color_detector.getPixelPosColorInWindow(hwnd, kHPBar.p6_high.x, kHPBar.p6_high.y))
+                # 一帧内检查6条血条和蓝条，只更新发生变化的队员
+                subscribeRegions()
+                region_bus.tick(hwnd)
+                is_alive = party_state["alive"]
+                is_mid_hp = party_state["mid_hp"]
+                is_high_hp = party_state["high_hp"]
                 
                 # 峨眉治疗逻辑：两级优先级治疗系统
                 healed = False  # 标记是否已经治疗了某个队友
                 
                 # 第一优先级：紧急治疗 - 检查血量不足中等水平的队友
-                if not healed:
-                    # 检查p1
-                    if is_p1_alive and not is_p1_mid_hp:
-                        print("p1血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player1.x, kProfilePhoto.player1.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p2
-                    elif is_p2_alive and not is_p2_mid_hp:
-                        print("p2血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player2.x, kProfilePhoto.player2.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p3
-                    elif is_p3_alive and not is_p3_mid_hp:
-                        print("p3血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player3.x, kProfilePhoto.player3.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p4
-                    elif is_p4_alive and not is_p4_mid_hp:
-                        print("p4血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player4.x, kProfilePhoto.player4.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p5
-                    elif is_p5_alive and not is_p5_mid_hp:
-                        print("p5血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player5.x, kProfilePhoto.player5.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p6
-                    elif is_p6_alive and not is_p6_mid_hp:
-                        print("p6血量不足中等水平，紧急治疗")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player6.x, kProfilePhoto.player6.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
+                urgent = np.flatnonzero(is_alive & ~is_mid_hp)
+                if urgent.size > 0:
+                    index = int(urgent[0])
+                    print(f"p{index + 1}血量不足中等水平（约 {hp_ratio[index]:.0%}），紧急治疗")
+                    x, y = (int(v) for v in kLayout.points(hwnd, "party", kPartyPhotos[index]))
+                    keyboard_simulator.mouseClick(x, y, hwnd)
+                    keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
+                    healed = True
                 
                 # 第二优先级：预防性治疗 - 当所有人都有中等血量时，提升到高血量
                 if not healed:
-                    # 检查p1
-                    if is_p1_alive and is_p1_mid_hp and not is_p1_high_hp:
-                        print("p1血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player1.x, kProfilePhoto.player1.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p2
-                    elif is_p2_alive and is_p2_mid_hp and not is_p2_high_hp:
-                        print("p2血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player2.x, kProfilePhoto.player2.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p3
-                    elif is_p3_alive and is_p3_mid_hp and not is_p3_high_hp:
-                        print("p3血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player3.x, kProfilePhoto.player3.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p4
-                    elif is_p4_alive and is_p4_mid_hp and not is_p4_high_hp:
-                        print("p4血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player4.x, kProfilePhoto.player4.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p5
-                    elif is_p5_alive and is_p5_mid_hp and not is_p5_high_hp:
-                        print("p5血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player5.x, kProfilePhoto.player5.y, hwnd)
-                        keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
-                        healed = True
-                    
-                    # 检查p6
-                    elif is_p6_alive and is_p6_mid_hp and not is_p6_high_hp:
-                        print("p6血量中等，预防性加血到高血量")
-                        keyboard_simulator.mouseClick(kProfilePhoto.player6.x, kProfilePhoto.player6.y, hwnd)
+                    preventive = np.flatnonzero(is_alive & is_mid_hp & ~is_high_hp)
+                    if preventive.size > 0:
+                        index = int(preventive[0])
+                        print(f"p{index + 1}血量中等（约 {hp_ratio[index]:.0%}），预防性加血到高血量")
+                        x, y = (int(v) for v in kLayout.points(hwnd, "party", kPartyPhotos[index]))
+                        keyboard_simulator.mouseClick(x, y, hwnd)
                         keyboard_simulator.pressKey(kDefaultKey.qing_xin, hwnd)
                         healed = True
                 
@@ -244,6 +207,8 @@ class RaidThread(QThread):
             
             if not self.running:
                 print("**************休眠期间收到停止信号，脚本退出**************")
+                if self.is_em:
+                    print(region_bus.summary(hwnd))
                 return
 
         
@@ -273,8 +238,14 @@ class AutoReturnThread(QThread):
             self.original_stdout = sys.stdout
             sys.stdout = UILogStream(self.log_signal.emit)
             
-            # 开始自动回点的主要逻辑
-            self.autoReturnProcess()
+            # 开始自动回点的主要逻辑，运行期间该窗口保持持续采集
+            getCaptureOwner().acquire(self.hwnd)
+            try:
+                self.autoReturnProcess()
+            finally:
+                getCaptureOwner().release(self.hwnd)
+                print(kSearchHints.summary())
+                print(kMatchCache.summary())
         except Exception as e:
             self.log_signal.emit(f"错误：{str(e)}")
         finally:
@@ -1574,6 +1545,14 @@ def loadStylesheet():
 
 def main():
     app = QApplication(sys.argv)    
+    if kVisionConfig.enabled:
+        # 截图和识别放到每个窗口独立的识别进程，本进程的检测器从共享内存读取最新帧
+        setDefaultFrameSource(startVisionService())
+    else:
+        # 所有检测器共享持续采集的最新帧
+        setDefaultFrameSource(kCapturePipeline)
+    # 内存映射预解码的模板包
+    loadTemplatePack()
     # 应用样式
     stylesheet = loadStylesheet()
     if stylesheet:
@@ -1586,6 +1565,8 @@ def main():
     try:
         result = app.exec_()
     finally:
+        stopVisionService()
+        kCapturePipeline.stopAll()
         # 确保退出时恢复stdout
         if hasattr(window, 'original_stdout') and window.original_stdout:
             sys.stdout = window.original_stdout
@@ -1594,6 +1575,8 @@ def main():
 
 
 if __name__ == '__main__':
+    # 打包后识别进程以spawn方式启动同一个exe，需要先交给multiprocessing处理
+    multiprocessing.freeze_support()
     main()
 
 
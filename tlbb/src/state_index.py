@@ -0,0 +1,158 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 界面状态索引：离线把录制帧中各状态参考区域的感知哈希（pHash）存成索引，
+       运行时按汉明距离找最近的状态，距离不明确时再退回模板匹配
+       生成索引: python state_index.py <录制目录>
+       录制目录下每个状态一个子目录（PNG帧）或一个 .npy/.npz 录制文件，名称即状态名；
+       每个状态的参考区域写在 res/state_regions.yaml（状态名: [left, top, right, bottom]）
+"""
+import os
+import sys
+import glob
+import cv2
+import numpy as np
+import yaml
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from game_param import Bbox, kStateIndexPath, kStateRegionsPath
+from frame_source import Frame, ReplayFrameSource
+
+# 最近状态的汉明距离（64位）超过该值视为不认识的画面
+kMaxStateDistance = 10
+# 最近的两个不同状态的距离差小于该值视为不明确
+kStateMargin = 6
+
+def perceptualHash(region: np.ndarray) -> np.uint64:
+    """64位感知哈希：缩小到32x32灰度图做DCT，取左上8x8低频系数与中位数比较"""
+    if region.ndim == 3:
+        region = cv2.cvtColor(np.ascontiguousarray(region), cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(region, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # 中位数不计直流分量，直流分量只反映整体亮度
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).view(">u8")[0].astype(np.uint64)
+
+def hammingDistance(hashes: np.ndarray, value: np.uint64) -> np.ndarray:
+    """一批哈希与value的汉明距离（unpackbits 计数，兼容 numpy<2.0）"""
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(value))
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1, dtype=np.int32)
+
+def loadStateRegions(path: str = kStateRegionsPath) -> Dict[str, Bbox]:
+    """读取每个状态的参考区域，文件不存在时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return {str(label): Bbox(*[int(v) for v in bbox]) for label, bbox in data.items()
+            if isinstance(bbox, (list, tuple)) and len(bbox) == 4}
+
+@dataclass(frozen=True)
+class StateMatch:
+    """状态识别结果：label为最近的状态（不认识时为None），ambiguous为True时应退回模板匹配"""
+    label: Optional[str]
+    distance: int
+    ambiguous: bool
+
+class StateIndex:
+    """感知哈希索引：每条记录为 (状态名, 参考区域, 哈希)，同一状态可以有多条记录"""
+
+    def __init__(self, labels: Iterable[str], bboxes: np.ndarray, hashes: np.ndarray):
+        self.labels = np.asarray(list(labels), dtype=str)
+        self.bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+
+    @classmethod
+    def build(cls, corpus_dir: str, regions: Dict[str, Bbox]) -> "StateIndex":
+        """从录制目录生成索引，每个状态的每一帧生成一条记录"""
+        labels: List[str] = []
+        bboxes: List[Tuple[int, int, int, int]] = []
+        hashes: List[np.uint64] = []
+        for path in sorted(glob.glob(os.path.join(corpus_dir, "*"))):
+            label = os.path.splitext(os.path.basename(path))[0]
+            bbox = regions.get(label)
+            if bbox is None:
+                print(f"状态 {label} 没有配置参考区域，跳过")
+                continue
+            frames = ReplayFrameSource(path, auto_advance=False, loop=False).frames
+            for image in frames:
+                labels.append(label)
+                bboxes.append((bbox.left, bbox.top, bbox.right, bbox.bottom))
+                hashes.append(perceptualHash(np.asarray(image)[bbox.top:bbox.bottom, bbox.left:bbox.right]))
+            print(f"状态 {label}: {len(frames)} 帧")
+        return cls(labels, np.array(bboxes, dtype=np.int32), np.array(hashes, dtype=np.uint64))
+
+    @classmethod
+    def load(cls, path: str = kStateIndexPath) -> "StateIndex":
+        with np.load(path) as data:
+            return cls(data["labels"], data["bboxes"], data["hashes"])
+
+    def save(self, path: str = kStateIndexPath):
+        np.savez(path, labels=self.labels, bboxes=self.bboxes, hashes=self.hashes)
+
+    def classify(self, frame: Frame, labels: Optional[Iterable[str]] = None, scale: float = 1.0) -> StateMatch:
+        """
+        识别帧属于哪个已知状态
+        Args:
+            frame: 帧
+            labels: 只在这些状态中选择，None为全部
+            scale: 窗口的缩放系数（与模板期望区域的换算相同，见 img_match.scaleBbox），参考区域按它换算到当前窗口
+        Returns:
+            StateMatch: 最近的状态、距离，以及是否需要退回模板匹配
+        """
+        candidates = np.ones(len(self.labels), dtype=bool) if labels is None else np.isin(self.labels, list(labels))
+        if not candidates.any():
+            return StateMatch(None, 64, True)
+        distances = np.full(len(self.labels), 64, dtype=np.int32)
+        # 同一参考区域只计算一次哈希
+        for bbox in np.unique(self.bboxes[candidates], axis=0):
+            left, top, right, bottom = (int(v) for v in bbox)
+            if scale != 1.0:
+                left, top, right, bottom = int(left * scale), int(top * scale), int(right * scale + 0.5), int(bottom * scale + 0.5)
+            # 只转换参考区域本身，不触发整帧灰度图的计算
+            region = frame.crop(Bbox(left, top, right, bottom))
+            if region.size == 0:
+                continue
+            same_bbox = candidates & np.all(self.bboxes == bbox, axis=1)
+            distances[same_bbox] = hammingDistance(self.hashes[same_bbox], perceptualHash(region))
+
+        # 每个状态取最近的一条记录
+        label_names, label_index = np.unique(self.labels[candidates], return_inverse=True)
+        label_distances = np.full(len(label_names), 64, dtype=np.int32)
+        np.minimum.at(label_distances, label_index, distances[candidates])
+        order = np.argsort(label_distances, kind="stable")
+        best = int(label_distances[order[0]])
+        second = int(label_distances[order[1]]) if len(order) > 1 else 64
+        if best > kMaxStateDistance:
+            return StateMatch(None, best, True)
+        return StateMatch(str(label_names[order[0]]), best, second - best < kStateMargin)
+
+
+_state_index: Optional[StateIndex] = None
+_state_index_loaded = False
+
+def loadStateIndex(path: str = kStateIndexPath) -> Optional[StateIndex]:
+    """加载状态索引（只加载一次），文件不存在时返回None"""
+    global _state_index, _state_index_loaded
+    if not _state_index_loaded:
+        _state_index_loaded = True
+        if os.path.exists(path):
+            try:
+                _state_index = StateIndex.load(path)
+                print(f"状态索引加载成功: {len(_state_index.labels)} 条记录")
+            except Exception as e:
+                print(f"状态索引加载失败，使用模板匹配: {e}")
+    return _state_index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python state_index.py <录制目录>")
+        sys.exit(1)
+    regions = loadStateRegions()
+    if not regions:
+        print(f"未找到状态参考区域配置: {kStateRegionsPath}")
+        sys.exit(1)
+    index = StateIndex.build(sys.argv[1], regions)
+    index.save()
+    print(f"状态索引已生成: {kStateIndexPath}（{len(index.labels)} 条记录）")
@@ -0,0 +1,233 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 模板包：把 img_src 下的模板图片预解码成一个文件（像素、透明度掩码、统计量、元数据），
+       启动时内存映射，按名称直接取用，打包时只需携带这一个资源文件
+       生成模板包: python template_pack.py
+"""
+import os
+import json
+import struct
+import threading
+import cv2
+import numpy as np
+import yaml
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from game_param import ImagePath, Bbox, kPicDir, kTemplatePackPath, kTemplateMetaPath
+
+kPackMagic = b"TLBBPACK"
+kPackVersion = 1
+kPackAlign = 64             # 每个数组按64字节对齐，内存映射后可直接作为ndarray使用
+kDefaultConfidence = 0.8
+
+@dataclass(frozen=True)
+class TemplateEntry:
+    """一个预解码的模板"""
+    name: str                           # ImagePath 下的 "分组.字段名"
+    path: str                           # 相对 img_src 的路径，如 auto_return/1.png
+    image: np.ndarray                   # BGR像素
+    mask: Optional[np.ndarray]          # 透明度>0的像素为255；模板完全不透明时为None
+    mean: Tuple[float, float, float]    # 掩码内BGR各通道均值
+    std: Tuple[float, float, float]     # 掩码内BGR各通道标准差
+    roi: Optional[Bbox]                 # 期望出现的区域（窗口坐标系），None表示整个窗口
+    confidence: float                   # 默认置信度
+    scale: Optional[float] = None       # 离线标定的搜索缩放比例，窗口尚未标定时先按该比例搜索
+
+def iterImagePaths() -> List[Tuple[str, str]]:
+    """列出 ImagePath 中定义的所有模板 (名称, 绝对路径)"""
+    templates = []
+    for group_name, group in vars(ImagePath).items():
+        if group_name.startswith("_") or not isinstance(group, type):
+            continue
+        for field, path in vars(group).items():
+            if not field.startswith("_") and isinstance(path, str):
+                templates.append((f"{group_name}.{field}", path))
+    return templates
+
+def relativePicPath(image_path: str) -> str:
+    """模板图片相对 img_src 的路径（统一用 / 分隔）"""
+    try:
+        return os.path.relpath(os.path.normpath(image_path), kPicDir).replace(os.sep, "/")
+    except ValueError:
+        # Windows下不在同一个盘符
+        return os.path.normpath(image_path).replace(os.sep, "/")
+
+def loadTemplateMeta(meta_path: str = kTemplateMetaPath) -> Dict[str, dict]:
+    """读取模板元数据，文件不存在时返回空字典"""
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    return data if isinstance(data, dict) else {}
+
+def _parseRoi(roi) -> Optional[Bbox]:
+    if isinstance(roi, (list, tuple)) and len(roi) == 4:
+        return Bbox(*[int(v) for v in roi])
+    return None
+
+def _parseScale(scale) -> Optional[float]:
+    if isinstance(scale, (int, float)) and scale > 0:
+        return float(scale)
+    return None
+
+def decodeTemplate(name: str, image_path: str, meta: Optional[dict] = None) -> TemplateEntry:
+    """从PNG解码模板并计算统计量"""
+    meta = meta or {}
+    # np.fromfile + imdecode 兼容中文路径
+    raw = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if raw is None:
+        raise FileNotFoundError(f"无法读取模板图片: {image_path}")
+    if raw.ndim == 2:
+        raw = cv2.cvtColor(raw, cv2.COLOR_GRAY2BGR)
+    image = np.ascontiguousarray(raw[..., :3])
+    mask = None
+    if raw.shape[2] == 4 and (raw[..., 3] < 255).any():
+        mask = np.where(raw[..., 3] > 0, 255, 0).astype(np.uint8)
+    mean, std = cv2.meanStdDev(image, mask=mask)
+    return TemplateEntry(
+        name=name,
+        path=relativePicPath(image_path),
+        image=image,
+        mask=mask,
+        mean=tuple(float(v) for v in mean.ravel()),
+        std=tuple(float(v) for v in std.ravel()),
+        roi=_parseRoi(meta.get("roi")),
+        confidence=float(meta.get("confidence", kDefaultConfidence)),
+        scale=_parseScale(meta.get("scale")),
+    )
+
+def buildTemplatePack(out_path: str = kTemplatePackPath, meta_path: str = kTemplateMetaPath):
+    """把 ImagePath 中的所有模板写成一个模板包
+    文件格式: 魔数(8) + 版本(uint32) + 头长度(uint32) + JSON头 + 按64字节对齐的像素/掩码数据
+    """
+    meta = loadTemplateMeta(meta_path)
+    entries = [decodeTemplate(name, path, meta.get(name)) for name, path in iterImagePaths()]
+
+    blobs: List[bytes] = []
+    header_entries = {}
+    offset = 0
+    def addBlob(array: np.ndarray) -> int:
+        nonlocal offset
+        start = offset
+        data = np.ascontiguousarray(array).tobytes()
+        padding = (-len(data)) % kPackAlign
+        blobs.append(data + b"\0" * padding)
+        offset += len(data) + padding
+        return start
+
+    for entry in entries:
+        header_entries[entry.name] = {
+            "path": entry.path,
+            "shape": list(entry.image.shape),
+            "offset": addBlob(entry.image),
+            "mask_offset": addBlob(entry.mask) if entry.mask is not None else None,
+            "mean": list(entry.mean),
+            "std": list(entry.std),
+            "roi": [entry.roi.left, entry.roi.top, entry.roi.right, entry.roi.bottom] if entry.roi else None,
+            "confidence": entry.confidence,
+            "scale": entry.scale,
+        }
+
+    header = json.dumps({"templates": header_entries}, ensure_ascii=False).encode("utf-8")
+    prefix_size = len(kPackMagic) + 8 + len(header)
+    header += b" " * ((-prefix_size) % kPackAlign)
+    with open(out_path, "wb") as f:
+        f.write(kPackMagic)
+        f.write(struct.pack("<II", kPackVersion, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    print(f"模板包已生成: {out_path}（{len(entries)} 个模板）")
+
+
+class TemplatePack:
+    """内存映射的模板包，按名称或图片路径取模板"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._data[:len(kPackMagic)]) != kPackMagic:
+            raise ValueError(f"不是有效的模板包: {path}")
+        version, header_size = struct.unpack("<II", bytes(self._data[len(kPackMagic):len(kPackMagic) + 8]))
+        if version != kPackVersion:
+            raise ValueError(f"模板包版本不匹配: {version}")
+        header_start = len(kPackMagic) + 8
+        header = json.loads(bytes(self._data[header_start:header_start + header_size]).decode("utf-8"))
+        data_start = header_start + header_size
+
+        self.entries: Dict[str, TemplateEntry] = {}
+        self._path_to_name: Dict[str, str] = {}
+        for name, info in header["templates"].items():
+            shape = tuple(info["shape"])
+            size = int(np.prod(shape))
+            image = np.asarray(self._data[data_start + info["offset"]:data_start + info["offset"] + size]).reshape(shape)
+            mask = None
+            if info["mask_offset"] is not None:
+                mask_start = data_start + info["mask_offset"]
+                mask = np.asarray(self._data[mask_start:mask_start + shape[0] * shape[1]]).reshape(shape[:2])
+            self.entries[name] = TemplateEntry(
+                name=name,
+                path=info["path"],
+                image=image,
+                mask=mask,
+                mean=tuple(info["mean"]),
+                std=tuple(info["std"]),
+                roi=_parseRoi(info["roi"]),
+                confidence=float(info["confidence"]),
+                scale=_parseScale(info.get("scale")),
+            )
+            self._path_to_name[info["path"]] = name
+
+    def names(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def get(self, name: str) -> Optional[TemplateEntry]:
+        return self.entries.get(name)
+
+    def getByPath(self, image_path: str) -> Optional[TemplateEntry]:
+        name = self._path_to_name.get(relativePicPath(image_path))
+        return self.entries.get(name) if name is not None else None
+
+
+_template_pack: Optional[TemplatePack] = None
+_template_cache: Dict[str, TemplateEntry] = {}
+_template_lock = threading.Lock()
+
+def loadTemplatePack(path: str = kTemplatePackPath) -> Optional[TemplatePack]:
+    """启动时内存映射模板包，文件不存在时返回None（退回逐个解码PNG）"""
+    global _template_pack
+    if not os.path.exists(path):
+        print(f"未找到模板包，使用PNG模板: {path}")
+        return None
+    try:
+        _template_pack = TemplatePack(path)
+        print(f"模板包加载成功: {len(_template_pack.entries)} 个模板")
+    except Exception as e:
+        print(f"模板包加载失败，使用PNG模板: {e}")
+        _template_pack = None
+    return _template_pack
+
+def getTemplate(name_or_path: str) -> TemplateEntry:
+    """按名称（如 auto_return.di_fu）或图片路径取模板，优先从模板包取，没有时解码PNG并缓存"""
+    entry = _template_cache.get(name_or_path)
+    if entry is not None:
+        return entry
+    if _template_pack is not None:
+        entry = _template_pack.get(name_or_path) or _template_pack.getByPath(name_or_path)
+    if entry is None:
+        names = dict(iterImagePaths())
+        if name_or_path in names:
+            name, image_path = name_or_path, names[name_or_path]
+        else:
+            paths = {path: name for name, path in names.items()}
+            image_path = name_or_path
+            name = paths.get(name_or_path, relativePicPath(name_or_path))
+        entry = decodeTemplate(name, image_path, loadTemplateMeta().get(name))
+    with _template_lock:
+        _template_cache[name_or_path] = entry
+    return entry
+
+
+if __name__ == "__main__":
+    buildTemplatePack()
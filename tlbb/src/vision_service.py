@@ -0,0 +1,501 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 识别进程：每个绑定的窗口一个独立进程，负责截图和模板匹配，把最新帧发布到共享内存，
+       通过管道批量应答 locate / classify / sample 等请求；界面进程中的 ImageMatch、ColorDetector 只转发请求，
+       识别计算不再和 Qt 界面线程争抢GIL，每个游戏窗口的识别可以占满一个CPU核
+       在 key_setting.yaml 中设置 vision_process: true 开启
+"""
+import os
+import time
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+from game_param import Bbox, kCaptureConfig, kVisionConfig
+from frame_source import Frame, FramePool, FrameSource, createFrameSource
+
+# 共享内存帧槽位的头部：写入前后各把 seq 加1（奇数表示正在写入），读取前后 seq 相同才算读到完整的一帧
+kSlotHeaderDtype = np.dtype([
+    ("seq", "<i8"),
+    ("timestamp", "<f8"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("rect", "<i4", (4,)),      # 截图时的窗口位置 (left, top, right, bottom)
+    ("stale", "<i4"),           # 窗口变大后换了新槽位，旧槽位置1，读取方需重新获取槽位名
+])
+kSlotHeaderSize = 64
+# 读到正在写入的帧时最多重试的次数
+kSlotReadRetries = 5
+# 识别进程还没有发布帧时，隔多少秒才再次询问槽位名（期间退回本进程直接截图）
+kSlotRetryInterval = 1.0
+
+class SharedFrameSlot:
+    """共享内存中的最新帧槽位：识别进程写入，界面进程读取"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.capacity = shm.size - kSlotHeaderSize
+        self._header = np.ndarray((), dtype=kSlotHeaderDtype, buffer=shm.buf)
+        self._pixels = np.ndarray((self.capacity,), dtype=np.uint8, buffer=shm.buf, offset=kSlotHeaderSize)
+
+    @classmethod
+    def create(cls, name: str, capacity: int) -> "SharedFrameSlot":
+        slot = cls(shared_memory.SharedMemory(name=name, create=True, size=kSlotHeaderSize + capacity), owner=True)
+        slot._header[()] = np.zeros((), dtype=kSlotHeaderDtype)
+        return slot
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFrameSlot":
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def stale(self) -> bool:
+        return bool(self._header["stale"])
+
+    def markStale(self):
+        self._header["stale"] = 1
+
+    def write(self, frame: Frame):
+        """写入一帧（只由识别进程的发布线程调用）"""
+        height, width = frame.image.shape[:2]
+        self._header["seq"] += 1
+        np.copyto(self._pixels[:frame.image.size].reshape(frame.image.shape), frame.image)
+        self._header["timestamp"] = frame.timestamp
+        self._header["width"] = width
+        self._header["height"] = height
+        self._header["rect"] = frame.window_rect
+        self._header["seq"] += 1
+
+    def _image(self, width: int, height: int) -> np.ndarray:
+        return self._pixels[:width * height * 3].reshape(height, width, 3)
+
+    def read(self, pool: FramePool) -> Optional[Tuple[np.ndarray, Tuple[int, int, int, int], float, int]]:
+        """把最新帧拷贝到帧缓冲区池借出的缓冲区，返回 (图像, 窗口位置, 时间戳, 序号)；还没有帧或一直在写入时返回None"""
+        for _ in range(kSlotReadRetries):
+            seq = int(self._header["seq"])
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            width, height = int(self._header["width"]), int(self._header["height"])
+            rect = tuple(int(v) for v in self._header["rect"])
+            timestamp = float(self._header["timestamp"])
+            image = pool.lease((height, width, 3))
+            np.copyto(image, self._image(width, height))
+            if int(self._header["seq"]) == seq:
+                return image, rect, timestamp, seq
+            pool.release(image)
+        return None
+
+    def readRegion(self, bbox: Optional[Bbox]) -> Optional[np.ndarray]:
+        """只拷贝窗口坐标系下的一块区域（bbox为None时整帧）"""
+        for _ in range(kSlotReadRetries):
+            seq = int(self._header["seq"])
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            image = self._image(int(self._header["width"]), int(self._header["height"]))
+            region = np.array(image if bbox is None else image[max(bbox.top, 0):bbox.bottom, max(bbox.left, 0):bbox.right])
+            if int(self._header["seq"]) == seq:
+                return region
+        return None
+
+    def windowRect(self) -> Optional[Tuple[int, int, int, int]]:
+        if int(self._header["seq"]) == 0:
+            return None
+        return tuple(int(v) for v in self._header["rect"])
+
+    def close(self):
+        # 先释放指向共享内存的数组，否则 close 会因为缓冲区仍被引用而失败
+        del self._header, self._pixels
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class _FramePublisher(threading.Thread):
+    """识别进程内：把采集线程的最新帧拷贝到共享内存槽位"""
+
+    def __init__(self, hwnd: int, pipeline, slot_prefix: str):
+        super().__init__(daemon=True)
+        self.hwnd = hwnd
+        self.pipeline = pipeline
+        self.slot_prefix = slot_prefix
+        self.slot: Optional[SharedFrameSlot] = None
+        self.running = True
+        self._generation = 0
+        self._stale_slots: List[SharedFrameSlot] = []
+        self._ready = threading.Event()
+
+    def run(self):
+        interval = 1.0 / max(1, self.pipeline.fps)
+        last_seq = None
+        last_error = None
+        while self.running:
+            start_time = time.time()
+            try:
+                with self.pipeline.grabFrame(self.hwnd) as frame:
+                    # seq为0的帧是没有采集线程时的同步截图，每次都发布
+                    if frame.seq == 0 or frame.seq != last_seq:
+                        self._publish(frame)
+                        last_seq = frame.seq
+                last_error = None
+            except Exception as e:
+                if last_error is None:
+                    print(f"[识别进程] 窗口 {self.hwnd} 发布帧失败: {e}")
+                last_error = e
+            time.sleep(max(0.0, interval - (time.time() - start_time)))
+        for slot in self._stale_slots + ([self.slot] if self.slot is not None else []):
+            slot.close()
+
+    def _publish(self, frame: Frame):
+        if self.slot is None or frame.image.size > self.slot.capacity:
+            # 窗口变大放不下时换一个新槽位，旧槽位标记失效，读取方会重新获取槽位名
+            self._generation += 1
+            slot = SharedFrameSlot.create(f"{self.slot_prefix}_{self._generation}", frame.image.size)
+            if self.slot is not None:
+                self.slot.markStale()
+                self._stale_slots.append(self.slot)
+            self.slot = slot
+        self.slot.write(frame)
+        self._ready.set()
+
+    def slotName(self, timeout: float) -> Optional[str]:
+        self._ready.wait(timeout)
+        return self.slot.name if self.slot is not None else None
+
+    def stop(self):
+        self.running = False
+
+
+def _workerMain(hwnd: int, conn, slot_prefix: str):
+    """识别进程入口（spawn方式启动）：持续采集并发布帧，循环处理界面进程发来的请求批次
+    同一批次的请求共用一帧，并在匹配线程池中并行处理"""
+    from frame_source import setDefaultFrameSource
+    from capture_pipeline import kCapturePipeline
+    from template_pack import loadTemplatePack
+    from match_executor import kMatchExecutor
+    from img_match import ImageMatch
+    from color_detector import ColorDetector
+    from state_index import loadStateIndex
+    from score_log import kScoreLog
+
+    setDefaultFrameSource(kCapturePipeline)
+    loadTemplatePack()
+    # 每个识别进程只负责一个窗口，按窗口截图即可，不使用共享采集
+    kCapturePipeline.shared = False
+    kCapturePipeline.acquire(hwnd)
+    publisher = _FramePublisher(hwnd, kCapturePipeline, slot_prefix)
+    publisher.start()
+    image_match = ImageMatch(hwnd)
+    color_detector = ColorDetector()
+
+    def handle(frame: Frame, op: str, args: tuple) -> Any:
+        if op == "locate":
+            image_path, confidence = args
+            result = image_match.matchInFrame(frame, image_path, confidence)
+            if result is not None and result.score >= confidence:
+                image_match.window_manager.saveBboxImage(hwnd, result.bbox, frame)
+            return result
+        if op == "classify":
+            scene_templates, use_state_index = args
+            return image_match.classifySceneInFrame(frame, scene_templates, loadStateIndex() if use_state_index else None)
+        if op == "sample":
+            points = args[0]
+            return np.array(frame.image[points[..., 1], points[..., 0]])
+        if op == "hp_ratio":
+            return color_detector.getPartyHPRatioInFrame(frame)
+        if op == "slot":
+            return publisher.slotName(kSlotRetryInterval)
+        raise ValueError(f"未知的请求: {op}")
+
+    def respond(frame: Frame, request: Tuple[int, str, tuple]) -> Tuple[int, bool, Any]:
+        request_id, op, args = request
+        try:
+            return request_id, True, handle(frame, op, args)
+        except Exception as e:
+            return request_id, False, f"{type(e).__name__}: {e}"
+
+    try:
+        while True:
+            try:
+                batch = conn.recv()
+            except EOFError:
+                break
+            if batch is None:
+                break
+            try:
+                with kCapturePipeline.grabFrame(hwnd) as frame:
+                    responses = kMatchExecutor.map(lambda request: respond(frame, request), batch)
+            except Exception as e:
+                responses = [(request_id, False, f"截图失败: {e}") for request_id, _, _ in batch]
+            conn.send(responses)
+    finally:
+        publisher.stop()
+        publisher.join(timeout=1.0)
+        kCapturePipeline.stopAll()
+        kScoreLog.flush()
+        conn.close()
+
+
+class _WorkerHandle:
+    """界面进程中一个识别进程的句柄
+    请求先进入待发送队列，同一时刻只有一个批次在识别进程中处理，处理期间到达的请求合并成下一个批次"""
+
+    def __init__(self, hwnd: int):
+        context = multiprocessing.get_context("spawn")
+        self.hwnd = hwnd
+        self.ref_count = 0
+        self.frame_pool = FramePool()
+        self.slot: Optional[SharedFrameSlot] = None
+        self._stale_slots: List[SharedFrameSlot] = []
+        self._slot_retry_at = 0.0
+        self._slot_lock = threading.Lock()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_workerMain, args=(hwnd, child_conn, f"tlbb_{os.getpid()}_{hwnd}"),
+                                       name=f"vision-{hwnd}", daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.running = True
+        self._pending: List[Tuple[int, str, tuple]] = []
+        self._futures: Dict[int, Future] = {}
+        self._next_id = 0
+        self._in_flight = False
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._sendLoop, daemon=True).start()
+        threading.Thread(target=self._receiveLoop, daemon=True).start()
+
+    def submit(self, op: str, *args) -> Future:
+        future = Future()
+        with self._condition:
+            if not self.running:
+                future.set_exception(RuntimeError(f"窗口 {self.hwnd} 的识别进程已退出"))
+                return future
+            self._next_id += 1
+            self._futures[self._next_id] = future
+            self._pending.append((self._next_id, op, args))
+            self._condition.notify_all()
+        return future
+
+    def call(self, op: str, *args) -> Any:
+        """发送请求并等待结果，识别进程中出错时抛出 RuntimeError"""
+        return self.submit(op, *args).result(timeout=kVisionConfig.timeout)
+
+    def _sendLoop(self):
+        while True:
+            with self._condition:
+                while self.running and (self._in_flight or not self._pending):
+                    self._condition.wait()
+                if not self.running:
+                    return
+                batch = self._pending[:max(1, kVisionConfig.max_batch)]
+                del self._pending[:len(batch)]
+                self._in_flight = True
+            try:
+                with self._send_lock:
+                    self.conn.send(batch)
+            except (OSError, ValueError) as e:
+                self._fail(e)
+                return
+
+    def _receiveLoop(self):
+        while True:
+            try:
+                responses = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self._fail(e)
+                return
+            with self._condition:
+                self._in_flight = False
+                results = [(self._futures.pop(request_id, None), ok, value) for request_id, ok, value in responses]
+                self._condition.notify_all()
+            for future, ok, value in results:
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+
+    def _fail(self, error: Exception):
+        with self._condition:
+            was_running = self.running
+            self.running = False
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self._pending.clear()
+            self._condition.notify_all()
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError(f"识别进程通信失败: {error}"))
+        if was_running:
+            print(f"[识别进程] 窗口 {self.hwnd} 的识别进程已断开: {error}")
+
+    def getSlot(self) -> Optional[SharedFrameSlot]:
+        """当前的共享内存槽位，第一次使用或槽位失效时向识别进程询问槽位名"""
+        slot = self.slot
+        if slot is not None and not slot.stale:
+            return slot
+        with self._slot_lock:
+            if self.slot is not None and not self.slot.stale:
+                return self.slot
+            if not self.running or time.time() < self._slot_retry_at:
+                return None
+            try:
+                name = self.call("slot")
+            except Exception as e:
+                print(f"[识别进程] 获取窗口 {self.hwnd} 的帧槽位失败: {e}")
+                name = None
+            if name is None:
+                self._slot_retry_at = time.time() + kSlotRetryInterval
+                return None
+            # 其他线程可能还在读旧槽位，关闭识别进程时再统一释放
+            if self.slot is not None:
+                self._stale_slots.append(self.slot)
+            self.slot = SharedFrameSlot.attach(name)
+            return self.slot
+
+    def close(self):
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        try:
+            with self._send_lock:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        with self._slot_lock:
+            for slot in self._stale_slots + ([self.slot] if self.slot is not None else []):
+                slot.close()
+            self._stale_slots.clear()
+            self.slot = None
+
+
+class VisionClient(FrameSource):
+    """界面进程中的识别进程客户端
+    acquire/release 与 CapturePipeline 相同，按引用计数启停每个窗口的识别进程；
+    作为帧来源时从共享内存读取识别进程发布的最新帧，没有识别进程的窗口退化为直接截图
+    """
+
+    def __init__(self, source: Optional[FrameSource] = None):
+        super().__init__()
+        self.source = source if source is not None else createFrameSource(kCaptureConfig.backend)
+        self._workers: Dict[int, _WorkerHandle] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, hwnd: int):
+        """登记一个使用者，第一个使用者启动该窗口的识别进程"""
+        with self._lock:
+            worker = self._workers.get(hwnd)
+            if worker is None or not worker.running:
+                worker = self._workers[hwnd] = _WorkerHandle(hwnd)
+                print(f"[识别进程] 窗口 {hwnd} 启动识别进程 {worker.process.pid}")
+            worker.ref_count += 1
+
+    def release(self, hwnd: int):
+        """注销一个使用者，最后一个使用者退出时关闭识别进程"""
+        with self._lock:
+            worker = self._workers.get(hwnd)
+            if worker is None:
+                return
+            worker.ref_count -= 1
+            if worker.ref_count > 0:
+                return
+            del self._workers[hwnd]
+        worker.close()
+        print(f"[识别进程] 窗口 {hwnd} 识别进程已关闭")
+
+    def stopAll(self):
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+    def _getWorker(self, hwnd: int) -> Optional[_WorkerHandle]:
+        worker = self._workers.get(hwnd)
+        return worker if worker is not None and worker.running else None
+
+    def serves(self, hwnd: int) -> bool:
+        """该窗口是否由识别进程负责"""
+        return self._getWorker(hwnd) is not None
+
+    def _getSlot(self, hwnd: int) -> Optional[SharedFrameSlot]:
+        worker = self._getWorker(hwnd)
+        return worker.getSlot() if worker is not None else None
+
+    def getWindowRect(self, hwnd: int) -> Tuple[int, int, int, int]:
+        slot = self._getSlot(hwnd)
+        rect = slot.windowRect() if slot is not None else None
+        return rect if rect is not None else self.source.getWindowRect(hwnd)
+
+    def grabFrame(self, hwnd: int) -> Frame:
+        """从共享内存拷贝最新帧（一次内存拷贝，不截图），调用者用完需 release()"""
+        worker = self._getWorker(hwnd)
+        slot = worker.getSlot() if worker is not None else None
+        data = slot.read(worker.frame_pool) if slot is not None else None
+        if data is None:
+            return self.source.grabFrame(hwnd)
+        image, rect, timestamp, seq = data
+        return Frame(image, hwnd, rect, timestamp, seq, pool=worker.frame_pool)
+
+    def grab(self, hwnd: int, bbox: Optional[Bbox] = None) -> np.ndarray:
+        slot = self._getSlot(hwnd)
+        region = slot.readRegion(bbox) if slot is not None else None
+        return region if region is not None else self.source.grab(hwnd, bbox)
+
+    def _call(self, hwnd: int, op: str, *args) -> Any:
+        worker = self._getWorker(hwnd)
+        if worker is None:
+            raise RuntimeError(f"窗口 {hwnd} 没有识别进程")
+        return worker.call(op, *args)
+
+    def locate(self, hwnd: int, image_path: str, confidence: float):
+        """在识别进程的最新帧中匹配一次模板，返回 MatchResult（不论分数高低）或None"""
+        return self._call(hwnd, "locate", image_path, confidence)
+
+    def classify(self, hwnd: int, scene_templates: Dict[str, str], use_state_index: bool):
+        """在识别进程中分类场景，返回 SceneResult"""
+        return self._call(hwnd, "classify", dict(scene_templates), use_state_index)
+
+    def sample(self, hwnd: int, points: np.ndarray) -> np.ndarray:
+        """读取一批 (x, y) 采样点的RGB"""
+        return self._call(hwnd, "sample", np.asarray(points, dtype=np.int32))
+
+    def hpRatio(self, hwnd: int) -> np.ndarray:
+        """在识别进程中扫描血条比例，返回值同 ColorDetector.getPartyHPRatio"""
+        return self._call(hwnd, "hp_ratio")
+
+
+_vision_client: Optional[VisionClient] = None
+
+def startVisionService() -> VisionClient:
+    """创建识别进程客户端（各窗口的识别进程在 acquire 时才启动）"""
+    global _vision_client
+    if _vision_client is None:
+        _vision_client = VisionClient()
+    return _vision_client
+
+def getVisionClient() -> Optional[VisionClient]:
+    """识别进程客户端，未开启识别进程时为None"""
+    return _vision_client
+
+def stopVisionService():
+    global _vision_client
+    if _vision_client is not None:
+        _vision_client.stopAll()
+        _vision_client = None
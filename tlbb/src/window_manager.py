@@ -1,21 +1,33 @@
-import win32gui
-import win32con
-import win32api
 import ctypes
 import os
 import sys
 from typing import List, Tuple, Optional
 from game_param import Bbox, kBaseDir
-from PIL import ImageGrab
+import numpy as np
+from PIL import Image
 from datetime import datetime
 import glob
+from frame_source import Frame, FrameSource, getDefaultFrameSource
+
+try:
+    import win32gui
+    import win32con
+    import win32api
+except ImportError:
+    # 回放模式下只需要截图相关功能
+    win32gui = win32con = win32api = None
 
 class WindowManager:
     """Windows窗口管理器"""
     
-    def __init__(self):
+    def __init__(self, frame_source: Optional[FrameSource] = None):
         self.windows = []
         self.pic_save_dir = os.path.join(kBaseDir, "pics")
+        # 未指定时使用全局默认帧来源
+        self.frame_source = frame_source
+    
+    def _getFrameSource(self) -> FrameSource:
+        return self.frame_source if self.frame_source is not None else getDefaultFrameSource()
     
     def isAdmin(self) -> bool:
         """检查当前程序是否以管理员权限运行"""
@@ -101,7 +113,7 @@ class WindowManager:
     
     def getWindowRect(self, hwnd: int) -> Tuple[int, int, int, int]:
         """获取窗口位置和大小 (left, top, right, bottom)"""
-        return win32gui.GetWindowRect(hwnd)
+        return self._getFrameSource().getWindowRect(hwnd)
     
     def selectWindow(self) -> Optional[int]:
         """交互式选择窗口
@@ -162,8 +174,8 @@ class WindowManager:
                 print(f"发生错误: {e}")
                 return None
 
-    def saveBboxImage(self, hwnd:int, bbox:Bbox):
-        """保存指定窗口的指定区域截图"""
+    def saveBboxImage(self, hwnd:int, bbox:Bbox, frame: Optional[Frame] = None):
+        """保存指定窗口的指定区域截图，传入frame时直接从已有的帧裁剪，不再重新截图"""
         # 确保保存目录存在
         if not os.path.exists(self.pic_save_dir):
             os.makedirs(self.pic_save_dir)
@@ -181,13 +193,10 @@ class WindowManager:
                 except Exception as e:
                     pass
         
-        window_rect = self.getWindowRect(hwnd)
-        left = window_rect[0] + bbox.left
-        top = window_rect[1] + bbox.top
-        right = window_rect[0] + bbox.right
-        bottom = window_rect[1] + bbox.bottom
-        
-        screenshot = ImageGrab.grab(bbox=(left, top, right, bottom))
+        if frame is not None:
+            screenshot = Image.fromarray(np.ascontiguousarray(frame.crop(bbox)))
+        else:
+            screenshot = Image.fromarray(self._getFrameSource().grab(hwnd, bbox))
         screenshot.save(os.path.join(self.pic_save_dir, f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"))
         return screenshot
 
@@ -0,0 +1,9 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 测试公共配置：把 src 加入模块搜索路径（源码按脚本方式组织，模块之间直接 import）
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
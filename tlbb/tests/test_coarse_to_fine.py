@@ -0,0 +1,83 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 两级匹配的召回率与全分辨率匹配一致：模板贴在奇数偏移处（与缩小图的2x2像素块错开半个像素）时仍能找到；
+       画面中没有模板时按粗搜分数提前拒绝，不做全分辨率验证，带噪声的真实命中不会被拒绝
+"""
+import numpy as np
+import pytest
+import img_match
+from frame_source import Frame
+from game_param import ImagePath
+from template_pack import getTemplate
+from img_match import coarseToFineMatch, matchInRegion
+
+kTemplates = [ImagePath.auto_return.chu_qiao, ImagePath.auto_return.si_xiang]
+kOffsets = [(0, 0), (1, 0), (0, 1), (1, 1)]
+
+def _frameWithTemplate(template, left: int, top: int, seed: int = 0) -> Frame:
+    """随机纹理背景上把模板（不透明像素）贴在 (left, top)，返回RGB帧"""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    height, width = template.image.shape[:2]
+    patch = image[top:top + height, left:left + width]
+    mask = template.mask if template.mask is not None else np.full((height, width), 255, np.uint8)
+    patch[mask > 0] = template.image[..., ::-1][mask > 0]
+    return Frame(image, 0, (0, 0, image.shape[1], image.shape[0]))
+
+@pytest.mark.parametrize("name", kTemplates)
+@pytest.mark.parametrize("dx, dy", kOffsets)
+def test_coarse_to_fine_finds_template_at_any_phase(name, dx, dy):
+    template = getTemplate(name)
+    left, top = 120 + dx, 80 + dy
+    with _frameWithTemplate(template, left, top) as frame:
+        full = matchInRegion(frame.bgr, template.image, None, template.mask)
+        result = coarseToFineMatch(frame, template.image, None, template.confidence, template.mask)
+        assert full.score >= 0.99
+        assert result is not None
+        assert (result.bbox.left, result.bbox.top) == (left, top)
+        assert result.score == pytest.approx(full.score, abs=1e-4)
+
+@pytest.mark.parametrize("name", kTemplates)
+def test_coarse_to_fine_agrees_with_full_on_random_layouts(name):
+    template = getTemplate(name)
+    rng = np.random.default_rng(1)
+    height, width = template.image.shape[:2]
+    for seed in range(30):
+        left, top = int(rng.integers(0, 400 - width)), int(rng.integers(0, 300 - height))
+        with _frameWithTemplate(template, left, top, seed) as frame:
+            result = coarseToFineMatch(frame, template.image, None, template.confidence, template.mask, time_budget=10.0)
+            assert result is not None and result.score >= template.confidence, (seed, left, top)
+            assert (result.bbox.left, result.bbox.top) == (left, top)
+
+@pytest.mark.parametrize("name", kTemplates)
+def test_absent_template_is_rejected_without_verification(name, monkeypatch):
+    template = getTemplate(name)
+    verified = []
+    def countingMatch(*args, **kwargs):
+        verified.append(args)
+        return matchInRegion(*args, **kwargs)
+    monkeypatch.setattr(img_match, "matchInRegion", countingMatch)
+    image = np.random.default_rng(2).integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    with Frame(image, 0, (0, 0, 400, 300)) as frame:
+        assert coarseToFineMatch(frame, template.image, None, template.confidence, template.mask) is None
+        assert not verified
+        # 余量足够大时不提前拒绝，候选照常验证
+        result = coarseToFineMatch(frame, template.image, None, template.confidence, template.mask, reject_margin=2.0)
+        assert result is not None and result.score < template.confidence
+        assert verified
+
+@pytest.mark.parametrize("name", kTemplates)
+def test_noisy_hit_is_not_rejected(name):
+    template = getTemplate(name)
+    rng = np.random.default_rng(3)
+    height, width = template.image.shape[:2]
+    for seed in range(10):
+        left, top = int(rng.integers(0, 400 - width)), int(rng.integers(0, 300 - height))
+        with _frameWithTemplate(template, left, top, seed) as clean:
+            noisy = np.clip(clean.image + rng.normal(0, 12, clean.image.shape), 0, 255).astype(np.uint8)
+        with Frame(noisy, 0, (0, 0, 400, 300)) as frame:
+            full = matchInRegion(frame.bgr, template.image, None, template.mask)
+            result = coarseToFineMatch(frame, template.image, None, template.confidence, template.mask, time_budget=10.0)
+            if full.score >= template.confidence:
+                assert result is not None and result.score == pytest.approx(full.score, abs=1e-4), seed
@@ -0,0 +1,24 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 颜色查找表与原有逐像素容差判断在整个 256³ 色彩空间上一致
+"""
+import numpy as np
+from color_model import kColorModel
+
+def _cubeSlice(r: int) -> np.ndarray:
+    """R=r 时所有 (G, B) 组合，形如 (256, 256, 3)"""
+    g, b = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+    return np.stack([np.full_like(g, r), g, b], axis=-1).astype(np.uint8)
+
+def test_empty_bar_matches_tolerance_check():
+    for r in range(256):
+        colors = _cubeSlice(r)
+        expected = np.all(np.abs(colors.astype(np.int16) - 20) <= 15, axis=-1)
+        assert np.array_equal(kColorModel.isClass(colors, "empty_bar"), expected), f"R={r}"
+
+def test_hp_red_matches_tolerance_check():
+    for r in range(256):
+        colors = _cubeSlice(r)
+        expected = np.abs(255 - colors[..., 0].astype(np.int16)) <= 15
+        assert np.array_equal(kColorModel.isClass(colors, "hp_red"), expected), f"R={r}"
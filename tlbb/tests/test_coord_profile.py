@@ -0,0 +1,71 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 坐标表：从 yaml 原地加载到 kCoordProfile，已取得引用的数组同步更新，形状不对的表忽略
+"""
+import copy
+import numpy as np
+import pytest
+import game_param
+from game_param import kCoordProfile, loadCoordProfile
+
+kSampleYaml = """
+big:
+  window_size: [2560, 1440]
+  hp_bar:
+    - [[127, 88], [191, 88], [267, 88]]
+    - [[80, 213], [133, 213], [187, 213]]
+    - [[80, 273], [133, 273], [187, 273]]
+    - [[80, 333], [133, 333], [187, 333]]
+    - [[80, 393], [133, 393], [187, 393]]
+    - [[80, 453], [133, 453], [187, 453]]
+  pet_hp: [289, 145]
+  mp_bar:
+    - [0, 223, 97]
+    - [1, 100, 222]
+  photos: [[1, 2], [3, 4]]
+"""
+
+@pytest.fixture
+def restoreProfile():
+    saved = copy.deepcopy(vars(kCoordProfile))
+    yield
+    for name, value in saved.items():
+        current = getattr(kCoordProfile, name)
+        if isinstance(value, np.ndarray) and isinstance(current, np.ndarray) and current.shape == value.shape:
+            np.copyto(current, value)
+        else:
+            setattr(kCoordProfile, name, value)
+
+def test_load_profile_in_place(tmp_path, restoreProfile):
+    path = tmp_path / "coord_profiles.yaml"
+    path.write_text(kSampleYaml, encoding="utf-8")
+    hp_bar = kCoordProfile.hp_bar
+    photos = kCoordProfile.photos.copy()
+    hp_strips = kCoordProfile.hp_strips.copy()
+    assert loadCoordProfile("big", str(path))
+    assert kCoordProfile.name == "big" and kCoordProfile.window_size == (2560, 1440)
+    # 原地替换：模块加载时取得的引用看到新坐标
+    assert kCoordProfile.hp_bar is hp_bar and hp_bar[0, 2].tolist() == [267, 88]
+    assert kCoordProfile.pet_hp.tolist() == [289, 145]
+    # 蓝条采样点的个数可以不同
+    assert kCoordProfile.mp_bar.tolist() == [[0, 223, 97], [1, 100, 222]]
+    # 形状不对的表忽略，缺少的表保留原值
+    assert np.array_equal(kCoordProfile.photos, photos)
+    assert np.array_equal(kCoordProfile.hp_strips, hp_strips)
+
+def test_missing_profile_or_file(tmp_path, restoreProfile):
+    path = tmp_path / "coord_profiles.yaml"
+    path.write_text(kSampleYaml, encoding="utf-8")
+    assert not loadCoordProfile("small", str(path))
+    assert not loadCoordProfile("big", str(tmp_path / "missing.yaml"))
+    assert kCoordProfile.name == "default"
+
+def test_bundled_default_matches_code():
+    """res/coord_profiles.yaml 的 default 与代码中的默认值一致"""
+    import yaml
+    with open(game_param.kCoordProfilesPath, "r", encoding="utf-8") as f:
+        default = yaml.safe_load(f)["default"]
+    profile = game_param.CoordProfile()
+    for name in ("hp_bar", "pet_hp", "hp_strips", "mp_bar", "photos"):
+        assert np.array_equal(np.asarray(default[name]), getattr(profile, name)), name
@@ -0,0 +1,49 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 坐标读取：用字形图片生成图集，识别同一字体渲染的坐标文字；无法识别的画面返回None
+"""
+import cv2
+import numpy as np
+from coord_reader import CoordReader, GlyphAtlas
+from frame_source import Frame
+from game_param import Bbox
+
+kFont = cv2.FONT_HERSHEY_SIMPLEX
+
+def _render(text: str, width: int) -> np.ndarray:
+    """深色背景上的浅色文字，基线固定（字形图片与坐标文字的上下边界一致）"""
+    image = np.full((24, width), 30, dtype=np.uint8)
+    cv2.putText(image, text, (2, 17), kFont, 0.6, 230, 1, cv2.LINE_AA)
+    return image
+
+def _atlas(tmp_path) -> GlyphAtlas:
+    for char, name in [(str(d), str(d)) for d in range(10)] + [(",", "comma")]:
+        cv2.imwrite(str(tmp_path / f"{name}.png"), _render(char, 20))
+    return GlyphAtlas.fromGlyphDir(str(tmp_path))
+
+def _frame(text: str) -> Frame:
+    image = np.zeros((60, 200, 3), dtype=np.uint8)
+    image[20:44, 10:130] = _render(text, 120)[..., None]
+    return Frame(image, 0, (0, 0, 200, 60))
+
+def test_read_coordinates(tmp_path):
+    reader = CoordReader(Bbox(10, 20, 130, 44), _atlas(tmp_path))
+    for x, y in [(123, 45), (7, 260), (98, 301)]:
+        with _frame(f"{x},{y}") as frame:
+            assert reader.readInFrame(frame) == (x, y)
+
+def test_atlas_save_load_round_trip(tmp_path):
+    atlas = _atlas(tmp_path)
+    path = str(tmp_path / "atlas.npz")
+    atlas.save(path)
+    loaded = GlyphAtlas.load(path)
+    assert loaded.labels == atlas.labels
+    assert np.allclose(loaded.glyphs, atlas.glyphs, atol=1 / 255)
+
+def test_unreadable_region(tmp_path):
+    reader = CoordReader(Bbox(10, 20, 130, 44), _atlas(tmp_path))
+    with Frame(np.zeros((60, 200, 3), dtype=np.uint8), 0, (0, 0, 200, 60)) as frame:
+        assert reader.readInFrame(frame) is None
+    # 没有配置坐标区域时不读取
+    assert not CoordReader(None, reader.atlas).isAvailable()
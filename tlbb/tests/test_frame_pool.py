@@ -0,0 +1,50 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 帧缓冲区池：多个不同尺寸的窗口交替截图时不再重复分配
+"""
+import threading
+import numpy as np
+from frame_source import FramePool, Frame
+
+def test_mixed_shapes_reuse_buffers():
+    pool = FramePool(capacity=2)
+    shapes = [(600, 800, 3), (768, 1024, 3), (300, 400, 3)]
+    for shape in shapes:
+        pool.preallocate(shape)
+    allocations = pool.allocations
+    for _ in range(50):
+        for shape in shapes:
+            with Frame(pool.lease(shape), 0, (0, 0, shape[1], shape[0]), pool=pool):
+                pass
+    assert pool.allocations == allocations
+
+def test_concurrent_lease_release():
+    pool = FramePool(capacity=4)
+    shapes = [(60, 80, 3), (70, 90, 3)]
+
+    def worker(shape):
+        for _ in range(200):
+            buffer = pool.lease(shape)
+            assert buffer.shape == shape
+            buffer.fill(1)
+            pool.release(buffer)
+
+    threads = [threading.Thread(target=worker, args=(shapes[i % 2],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 每种尺寸最多同时借出两块，之后全部复用
+    assert pool.allocations <= 4
+
+def test_oldest_shape_evicted():
+    pool = FramePool(capacity=1, max_shapes=2)
+    pool.preallocate((10, 10, 3))
+    pool.preallocate((20, 20, 3))
+    pool.preallocate((30, 30, 3))
+    allocations = pool.allocations
+    pool.release(pool.lease((20, 20, 3)))
+    assert pool.allocations == allocations
+    pool.release(pool.lease((10, 10, 3)))
+    assert pool.allocations == allocations + 1
@@ -0,0 +1,42 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 血条比例：满血为1、按满血宽度线性换算，满血帧上标定出每条血条的起止列
+"""
+import numpy as np
+from color_detector import ColorDetector, kPartyHPStrips
+from frame_source import Frame
+
+kRed = (250, 0, 0)
+
+def _frame(strips, fractions) -> Frame:
+    image = np.zeros((400, 300, 3), dtype=np.uint8)
+    for (left, top, right, _), fraction in zip(strips, fractions):
+        image[top, left:left + int(round((right - left) * fraction))] = kRed
+    return Frame(image, 0, (0, 0, 300, 400))
+
+def test_ratio_covers_full_range():
+    fractions = [1.0, 0.0, 0.5, 0.25, 0.9, 0.1, 1.0]
+    with _frame(kPartyHPStrips, fractions) as frame:
+        ratios = ColorDetector().getPartyHPRatioInFrame(frame)
+    widths = kPartyHPStrips[:, 2] - kPartyHPStrips[:, 0]
+    expected = np.round(widths * fractions) / widths
+    assert np.allclose(ratios, expected)
+    assert ratios[0] == 1.0 and ratios[1] == 0.0
+
+def test_calibrate_finds_full_bar_extent():
+    # 满血时血条比当前扫描行多出20列
+    strips = kPartyHPStrips.copy()
+    strips[:, 0] -= 5
+    strips[:, 2] += 20
+    with _frame(strips, [1.0] * len(strips)) as frame:
+        calibrated = ColorDetector().calibrateHPStrips(frame)
+    assert calibrated.tolist() == strips.tolist()
+
+def test_calibrate_keeps_rows_without_red_sample():
+    strips = kPartyHPStrips.copy()
+    fractions = [1.0] * len(strips)
+    fractions[3] = 0.0
+    with _frame(strips, fractions) as frame:
+        calibrated = ColorDetector().calibrateHPStrips(frame)
+    assert calibrated[3].tolist() == kPartyHPStrips[3].tolist()
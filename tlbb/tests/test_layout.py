@@ -0,0 +1,31 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 布局换算：缩放按窗口尺寸相对参考尺寸计算，窗口尺寸变化后重新标定
+"""
+import numpy as np
+from layout import Layout
+
+def _layout(tmp_path, reference_size) -> Layout:
+    path = tmp_path / "layout.yaml"
+    path.write_text(f"reference_size: {list(reference_size)}\ngroups:\n  party:\n    align: [0, 0]\n  center:\n    align: [0.5, 0.5]\n",
+                    encoding="utf-8")
+    return Layout(config_path=str(path))
+
+def test_scale_follows_window_size(tmp_path):
+    layout = _layout(tmp_path, (1000, 800))
+    points = layout.points(0, "party", np.array([[100, 50]]), width=2000, height=1600)
+    assert points.tolist() == [[200, 100]]
+
+def test_aspect_mismatch_uses_smaller_ratio_and_aligns(tmp_path):
+    layout = _layout(tmp_path, (1000, 800))
+    transform = layout.transformFor(0, width=1500, height=800)
+    assert transform.points("party", np.array([100, 50])).tolist() == [100, 50]
+    # 居中对齐：多出的500像素宽度两边各分一半
+    assert transform.points("center", np.array([100, 50])).tolist() == [350, 50]
+
+def test_resize_gives_new_transform(tmp_path):
+    layout = _layout(tmp_path, (1000, 800))
+    small = layout.transformFor(0, width=1000, height=800)
+    assert layout.transformFor(0, width=1000, height=800) is small
+    assert layout.transformFor(0, width=500, height=400) is not small
@@ -0,0 +1,68 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 匹配结果缓存：搜索区域像素相同（区域哈希相同）时直接返回上次的结果，像素变化后重新匹配
+"""
+import numpy as np
+import img_match
+from frame_source import Frame
+from game_param import ImagePath
+from template_pack import getTemplate
+from img_match import ImageMatch, MatchCache, _kCacheMissing, kMatchCache, kScaleCalibration
+
+kHwnd = 9002
+
+def _frame(image: np.ndarray) -> Frame:
+    return Frame(image.copy(), kHwnd, (0, 0, image.shape[1], image.shape[0]))
+
+def test_cache_hits_on_same_region_hash(monkeypatch):
+    # 只看全窗口搜索的缓存，不走上次命中位置的局部搜索
+    monkeypatch.setattr(img_match.kSearchHints, "region", lambda key: None)
+    template = getTemplate(ImagePath.auto_return.chu_qiao)
+    image = np.random.default_rng(0).integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    height, width = template.image.shape[:2]
+    image[50:50 + height, 60:60 + width] = template.image[..., ::-1]
+    kScaleCalibration.set((kHwnd, 400, 300), 1.0)
+    kMatchCache.clear()
+    image_match = ImageMatch(kHwnd)
+    try:
+        hits, misses = kMatchCache.hits, kMatchCache.misses
+        with _frame(image) as frame:
+            first = image_match.matchInFrame(frame, ImagePath.auto_return.chu_qiao)
+        assert (kMatchCache.hits, kMatchCache.misses) == (hits, misses + 1)
+        assert (first.bbox.left, first.bbox.top) == (60, 50)
+
+        # 新的一帧，像素相同：命中缓存，返回同一个结果
+        with _frame(image) as frame:
+            assert image_match.matchInFrame(frame, ImagePath.auto_return.chu_qiao) is first
+        assert (kMatchCache.hits, kMatchCache.misses) == (hits + 1, misses + 1)
+
+        # 区域内有一个像素变化：重新匹配
+        image[0, 0] ^= 0xFF
+        with _frame(image) as frame:
+            second = image_match.matchInFrame(frame, ImagePath.auto_return.chu_qiao)
+        assert second is not first and (second.bbox.left, second.bbox.top) == (60, 50)
+        assert (kMatchCache.hits, kMatchCache.misses) == (hits + 1, misses + 2)
+    finally:
+        kScaleCalibration.clear(kHwnd)
+        kMatchCache.clear()
+
+def test_uncalibrated_window_is_not_cached(monkeypatch):
+    monkeypatch.setattr(img_match.kSearchHints, "region", lambda key: None)
+    image = np.random.default_rng(1).integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    kScaleCalibration.clear(kHwnd)
+    hits, misses = kMatchCache.hits, kMatchCache.misses
+    with _frame(image) as frame:
+        ImageMatch(kHwnd).matchInFrame(frame, ImagePath.auto_return.chu_qiao)
+    assert (kMatchCache.hits, kMatchCache.misses) == (hits, misses)
+    kScaleCalibration.clear(kHwnd)
+
+def test_lru_eviction():
+    cache = MatchCache(capacity=2)
+    cache.put(("a",), None)
+    cache.put(("b",), None)
+    assert cache.get(("a",)) is None
+    cache.put(("c",), None)
+    # b 最久未使用，被淘汰
+    assert cache.get(("b",)) is _kCacheMissing
+    assert cache.get(("a",)) is None and cache.get(("c",)) is None
@@ -0,0 +1,34 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 运动检测：静止画面判定静止、区域在画面外时不判定静止、单次阈值不影响之后的判断
+"""
+import numpy as np
+from frame_source import ReplayFrameSource
+from game_param import Bbox
+from motion_detector import MotionDetector
+
+def _replay(tmp_path, frames) -> ReplayFrameSource:
+    path = str(tmp_path / "frames.npy")
+    np.save(path, np.stack(frames))
+    return ReplayFrameSource(path)
+
+def test_static_region_is_stopped(tmp_path):
+    frame = np.full((120, 160, 3), 80, dtype=np.uint8)
+    detector = MotionDetector(Bbox(20, 20, 100, 80), _replay(tmp_path, [frame]), sample_interval=0.0, stop_samples=3)
+    assert detector.waitUntilStopped(0, max_wait_time=1.0)
+
+def test_region_outside_frame_is_unknown(tmp_path):
+    frame = np.full((120, 160, 3), 80, dtype=np.uint8)
+    detector = MotionDetector(Bbox(500, 500, 600, 600), _replay(tmp_path, [frame]), sample_interval=0.0, stop_samples=3)
+    assert not detector.waitUntilStopped(0, max_wait_time=0.3)
+    assert not detector.diffs
+
+def test_threshold_applies_to_one_call(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=(120, 160, 3), dtype=np.uint8) for _ in range(4)]
+    detector = MotionDetector(Bbox(0, 0, 160, 120), _replay(tmp_path, frames), sample_interval=0.0,
+                              threshold=1.0, stop_samples=2)
+    assert detector.waitUntilStopped(0, max_wait_time=1.0, threshold=255.0)
+    assert detector.threshold == 1.0
+    assert not detector.waitUntilStopped(0, max_wait_time=0.3)
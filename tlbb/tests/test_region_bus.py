@@ -0,0 +1,71 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 区域订阅总线：只对像素变化的区域执行回调，回调出错时下一个tick重试
+"""
+import numpy as np
+from frame_source import Frame
+from game_param import Bbox
+from region_bus import RegionBus
+
+kHwnd = 1
+kLeft, kRight = Bbox(0, 0, 10, 10), Bbox(20, 0, 30, 10)
+
+def _frame(image: np.ndarray) -> Frame:
+    return Frame(image.copy(), kHwnd, (0, 0, image.shape[1], image.shape[0]))
+
+def _tick(bus: RegionBus, image: np.ndarray):
+    with _frame(image) as frame:
+        return bus.tick(kHwnd, frame)
+
+def _bus(calls: list) -> RegionBus:
+    bus = RegionBus()
+    bus.subscribe(kHwnd, "left", kLeft, lambda frame, bbox: calls.append(("left", bbox)))
+    bus.subscribe(kHwnd, "right", kRight, lambda frame, bbox: calls.append(("right", bbox)))
+    return bus
+
+def test_tick_delivers_only_changed_regions():
+    calls = []
+    bus = _bus(calls)
+    image = np.zeros((10, 40, 3), dtype=np.uint8)
+    # 新订阅第一个tick必定执行
+    assert _tick(bus, image) == ["left", "right"]
+    assert calls == [("left", kLeft), ("right", kRight)]
+    # 新的一帧像素相同：都跳过
+    assert _tick(bus, image) == []
+    # 只改右侧区域
+    image[5, 25] = 255
+    assert _tick(bus, image) == ["right"]
+    # 区域外的变化不触发
+    image[5, 15] = 255
+    assert _tick(bus, image) == []
+    assert "left 执行1/跳过3" in bus.summary(kHwnd) and "right 执行2/跳过2" in bus.summary(kHwnd)
+
+def test_invalidate_resubscribe_and_unsubscribe():
+    calls = []
+    bus = _bus(calls)
+    image = np.zeros((10, 40, 3), dtype=np.uint8)
+    _tick(bus, image)
+    bus.invalidate(kHwnd, "left")
+    assert _tick(bus, image) == ["left"]
+    # 同名订阅替换后重新执行一次
+    bus.subscribe(kHwnd, "right", kRight, lambda frame, bbox: calls.append(("new", bbox)))
+    assert _tick(bus, image) == ["right"] and calls[-1] == ("new", kRight)
+    bus.unsubscribe(kHwnd, "left")
+    bus.invalidate(kHwnd)
+    assert _tick(bus, image) == ["right"]
+    bus.unsubscribe(kHwnd)
+    assert _tick(bus, image) == []
+
+def test_failed_callback_is_retried():
+    attempts = []
+    def flaky(frame, bbox):
+        attempts.append(frame.seq)
+        if len(attempts) == 1:
+            raise RuntimeError("失败一次")
+    bus = RegionBus()
+    bus.subscribe(kHwnd, "flaky", kLeft, flaky)
+    image = np.zeros((10, 40, 3), dtype=np.uint8)
+    assert _tick(bus, image) == []
+    assert _tick(bus, image) == ["flaky"]
+    assert _tick(bus, image) == [] and len(attempts) == 2
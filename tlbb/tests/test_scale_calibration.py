@@ -0,0 +1,60 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 窗口缩放系数：离线标定比例不同的模板在同一窗口上各按自己的比例搜索，先命中的模板不改变其他模板的比例
+"""
+import dataclasses
+import numpy as np
+import template_pack
+from frame_source import Frame
+from game_param import ImagePath
+from template_pack import getTemplate
+from img_match import ImageMatch, kScaleCalibration
+
+kHwnd = 9001
+
+def _scaledEntry(image_path: str, name: str, scale: float):
+    entry = dataclasses.replace(getTemplate(image_path), name=name, scale=scale, roi=None)
+    template_pack._template_cache[name] = entry
+    return entry
+
+def _paste(image: np.ndarray, entry, left: int, top: int):
+    """把模板按自身比例缩放后（不透明像素）贴在 (left, top)"""
+    pixels = kScaleCalibration.scaledTemplate(entry, entry.scale)
+    mask = kScaleCalibration.scaledMask(entry, entry.scale)
+    height, width = pixels.shape[:2]
+    mask = mask if mask is not None else np.full((height, width), 255, np.uint8)
+    patch = image[top:top + height, left:left + width]
+    patch[mask > 0] = pixels[..., ::-1][mask > 0]
+
+def test_templates_keep_their_own_scale():
+    small = _scaledEntry(ImagePath.auto_return.chu_qiao, "test.small", 0.8)
+    large = _scaledEntry(ImagePath.auto_return.si_xiang, "test.large", 1.25)
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(400, 600, 3), dtype=np.uint8)
+    _paste(image, small, 40, 30)
+    _paste(image, large, 300, 200)
+    kScaleCalibration.clear(kHwnd)
+    image_match = ImageMatch(kHwnd)
+    with Frame(image, kHwnd, (0, 0, 600, 400)) as frame:
+        first = image_match.matchInFrame(frame, "test.small")
+        assert first.score >= small.confidence and (first.bbox.left, first.bbox.top) == (40, 30)
+        # 按自身比例命中，窗口系数为1
+        assert kScaleCalibration.get((kHwnd, 600, 400)) == 1.0
+        second = image_match.matchInFrame(frame, "test.large")
+        assert second.score >= large.confidence and (second.bbox.left, second.bbox.top) == (300, 200)
+    kScaleCalibration.clear(kHwnd)
+
+def test_window_factor_applies_on_top_of_template_scale():
+    entry = _scaledEntry(ImagePath.auto_return.chu_qiao, "test.resized", 0.8)
+    # 窗口整体放大到1.25倍：模板以 0.8*1.25=1.0 出现
+    resized = dataclasses.replace(entry, scale=1.0)
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, size=(400, 600, 3), dtype=np.uint8)
+    _paste(image, resized, 100, 60)
+    kScaleCalibration.clear(kHwnd)
+    with Frame(image, kHwnd, (0, 0, 600, 400)) as frame:
+        result = ImageMatch(kHwnd).matchInFrame(frame, "test.resized")
+    assert result.score >= entry.confidence and (result.bbox.left, result.bbox.top) == (100, 60)
+    assert kScaleCalibration.get((kHwnd, 600, 400)) == 1.25
+    kScaleCalibration.clear(kHwnd)
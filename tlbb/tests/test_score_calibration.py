@@ -0,0 +1,67 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 匹配分数记录的写入/读取/统计，以及离线置信度标定选出的比例、置信度和写回的元数据
+"""
+import dataclasses
+import numpy as np
+import template_pack
+from game_param import ImagePath, kMatchConfig
+from img_match import kScaleCalibration
+from score_log import ScoreLog, loadScoreLog, summarizeScores
+from template_pack import getTemplate, loadTemplateMeta
+from confidence_calibrator import Calibration, calibrateTemplate, chooseConfidence, writeTemplateMeta
+
+def test_score_log_round_trip(tmp_path, monkeypatch):
+    path = str(tmp_path / "scores.bin")
+    log = ScoreLog(path, buffer_size=2)
+    monkeypatch.setattr(kMatchConfig, "score_log", False)
+    log.record(1.0, "a", 0.9, 0.8, 1.0)
+    log.flush()
+    assert len(loadScoreLog(path)) == 0
+
+    monkeypatch.setattr(kMatchConfig, "score_log", True)
+    log.record(1.0, "a", 0.9, 0.8, 1.0)
+    log.record(2.0, "a", 0.7, 0.8, 1.0)     # 缓冲区满，自动写入
+    assert len(loadScoreLog(path)) == 2
+    log.record(3.0, "b", 0.1, 0.8, 1.25)
+    log.flush()
+    records = loadScoreLog(path)
+    assert records["template"].tolist() == [b"a", b"a", b"b"]
+    summary = summarizeScores(records)
+    assert summary["a"]["count"] == 2 and summary["a"]["hit_rate"] == 0.5 and summary["a"]["near_misses"] == 1
+    assert abs(summary["a"]["min_hit"] - 0.9) < 1e-6 and abs(summary["a"]["max_miss"] - 0.7) < 1e-6
+    assert summary["b"]["hit_rate"] == 0.0 and summary["b"]["near_misses"] == 0
+
+def test_choose_confidence():
+    # 可分：取正反例中间
+    assert chooseConfidence(np.array([0.95, 0.9]), np.array([0.5, 0.6])) == 0.75
+    # 不低于下限
+    assert chooseConfidence(np.array([0.7]), np.array([0.1])) == 0.6
+    # 分数重叠：取不产生误检的最低置信度
+    assert chooseConfidence(np.array([0.7, 0.95]), np.array([0.8])) == 0.85
+
+def test_calibrate_template_picks_scale(monkeypatch):
+    entry = dataclasses.replace(getTemplate(ImagePath.auto_return.chu_qiao), name="test.calibrate", roi=None, scale=None)
+    monkeypatch.setitem(template_pack._template_cache, "test.calibrate", entry)
+    rng = np.random.default_rng(0)
+    pixels = kScaleCalibration.scaledTemplate(entry, 1.25)
+    height, width = pixels.shape[:2]
+    positives, negatives = [], []
+    for i in range(3):
+        frame = rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+        negatives.append(frame.copy())
+        frame[40 + i:40 + i + height, 30:30 + width] = pixels
+        positives.append(frame)
+    result = calibrateTemplate("test.calibrate", positives, negatives)
+    assert result.scale == 1.25 and result.false_negatives == 0
+    assert (result.positives, result.negatives) == (3, 3)
+
+def test_write_template_meta_keeps_header_and_others(tmp_path):
+    path = tmp_path / "template_meta.yaml"
+    path.write_text("# 注释\nother:\n  confidence: 0.7\n  roi: [1, 2, 3, 4]\n", encoding="utf-8")
+    writeTemplateMeta([Calibration("new", 1.1, 0.82, 0, 3, 3)], str(path))
+    assert path.read_text(encoding="utf-8").startswith("# 注释\n")
+    meta = loadTemplateMeta(str(path))
+    assert meta["other"] == {"confidence": 0.7, "roi": [1, 2, 3, 4]}
+    assert meta["new"] == {"confidence": 0.82, "roi": None, "scale": 1.1}
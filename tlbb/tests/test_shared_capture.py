@@ -0,0 +1,64 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 共享采集：窗口最小化后丢弃其最新帧、立即返回None，不再占住共享缓冲区
+"""
+import time
+import numpy as np
+from capture_pipeline import SharedCaptureThread, kMinimizedPos
+from frame_source import ReplayFrameSource
+
+class _MinimizableSource(ReplayFrameSource):
+    """回放帧来源，窗口 hwnd 位于 (hwnd*100, 0)，最小化时返回最小化位置"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.minimized = set()
+
+    def getWindowRect(self, hwnd: int):
+        if hwnd in self.minimized:
+            return (kMinimizedPos, kMinimizedPos, kMinimizedPos + 160, kMinimizedPos + 28)
+        return (hwnd * 100, 0, hwnd * 100 + 100, 80)
+
+def _source(tmp_path) -> _MinimizableSource:
+    path = str(tmp_path / "frames.npy")
+    np.save(path, np.zeros((1, 120, 400, 3), dtype=np.uint8))
+    return _MinimizableSource(path)
+
+def test_minimized_window_returns_none_immediately(tmp_path):
+    source = _source(tmp_path)
+    thread = SharedCaptureThread(source, fps=10)
+    thread.add(1)
+    thread.add(2)
+    thread._capture()
+    with thread.latestFrame(1) as frame:
+        assert frame.window_rect == (100, 0, 200, 80)
+
+    source.minimized.add(1)
+    thread._capture()
+    start_time = time.time()
+    assert thread.latestFrame(1, timeout=1.0) is None
+    assert time.time() - start_time < 0.5
+    # 另一个窗口照常采集
+    with thread.latestFrame(2) as frame:
+        assert frame.window_rect == (200, 0, 300, 80)
+
+    # 恢复后重新采集
+    source.minimized.clear()
+    thread._capture()
+    with thread.latestFrame(1) as frame:
+        assert frame.window_rect == (100, 0, 200, 80)
+
+def test_minimized_window_releases_shared_buffer(tmp_path):
+    source = _source(tmp_path)
+    thread = SharedCaptureThread(source, fps=10)
+    thread.add(1)
+    thread._capture()
+    allocations = source.frame_pool.allocations
+    source.minimized.add(1)
+    thread._capture()
+    source.minimized.clear()
+    # 旧帧已丢弃，整块缓冲区回到池中，同尺寸再次采集不需要新分配
+    for _ in range(5):
+        thread._capture()
+    assert source.frame_pool.allocations == allocations
@@ -0,0 +1,40 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 状态索引：参考区域按窗口缩放系数换算后，放大的窗口仍识别为同一状态
+"""
+import cv2
+import numpy as np
+from frame_source import Frame
+from state_index import StateIndex, perceptualHash
+
+kRegion = (40, 30, 200, 150)
+
+def _screens():
+    rng = np.random.default_rng(0)
+    return {label: cv2.GaussianBlur(rng.integers(0, 256, size=(240, 320, 3), dtype=np.uint8), (15, 15), 0)
+            for label in ("map", "dialog")}
+
+def _index(screens) -> StateIndex:
+    left, top, right, bottom = kRegion
+    labels = list(screens)
+    hashes = [perceptualHash(screens[label][top:bottom, left:right]) for label in labels]
+    return StateIndex(labels, np.array([kRegion] * len(labels)), np.array(hashes, dtype=np.uint64))
+
+def test_scaled_window_matches_with_scale():
+    screens = _screens()
+    index = _index(screens)
+    for label, image in screens.items():
+        resized = cv2.resize(image, (400, 300), interpolation=cv2.INTER_LINEAR)
+        with Frame(resized, 0, (0, 0, 400, 300)) as frame:
+            match = index.classify(frame, scale=1.25)
+            assert match.label == label and not match.ambiguous, match
+            # 不换算时比较的是错位的像素
+            assert index.classify(frame).distance > match.distance
+
+def test_reference_size_unchanged():
+    screens = _screens()
+    index = _index(screens)
+    with Frame(screens["dialog"].copy(), 0, (0, 0, 320, 240)) as frame:
+        match = index.classify(frame, ["map", "dialog"])
+    assert match.label == "dialog" and match.distance == 0
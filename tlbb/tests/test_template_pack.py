@@ -0,0 +1,27 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 模板包：生成后内存映射读出的每个模板与直接解码PNG的结果一致
+"""
+import numpy as np
+from template_pack import TemplatePack, buildTemplatePack, decodeTemplate, iterImagePaths, loadTemplateMeta
+
+def test_pack_round_trip(tmp_path):
+    path = str(tmp_path / "templates.pack")
+    buildTemplatePack(path)
+    pack = TemplatePack(path)
+    meta = loadTemplateMeta()
+    templates = iterImagePaths()
+    assert sorted(pack.names()) == sorted(name for name, _ in templates)
+    for name, image_path in templates:
+        expected = decodeTemplate(name, image_path, meta.get(name))
+        entry = pack.get(name)
+        assert np.array_equal(entry.image, expected.image), name
+        if expected.mask is None:
+            assert entry.mask is None, name
+        else:
+            assert np.array_equal(entry.mask, expected.mask), name
+        assert np.allclose(entry.mean, expected.mean) and np.allclose(entry.std, expected.std), name
+        assert (entry.path, entry.roi, entry.confidence, entry.scale) == \
+               (expected.path, expected.roi, expected.confidence, expected.scale), name
+        assert pack.getByPath(image_path) is entry
@@ -0,0 +1,68 @@
+"""
+@author: Hu Yunhao
+@time: 2026/10/18
+@desc: 识别进程：共享内存帧槽位的 seqlock 读写往返，批次内的分类和血条比例都用传入的同一帧
+"""
+import uuid
+import numpy as np
+from color_detector import ColorDetector
+from frame_source import Frame, FramePool, FrameSource
+from game_param import Bbox, ImagePath
+from img_match import ImageMatch
+from vision_service import SharedFrameSlot
+
+def _slot(capacity: int) -> SharedFrameSlot:
+    return SharedFrameSlot.create(f"tlbb_test_{uuid.uuid4().hex[:8]}", capacity)
+
+def test_slot_write_read_round_trip():
+    image = np.random.default_rng(0).integers(0, 256, size=(30, 40, 3), dtype=np.uint8)
+    writer = _slot(image.size)
+    reader = SharedFrameSlot.attach(writer.name)
+    pool = FramePool()
+    try:
+        assert reader.read(pool) is None and reader.windowRect() is None
+        with Frame(image.copy(), 1, (100, 50, 140, 80), timestamp=123.5) as frame:
+            writer.write(frame)
+        pixels, rect, timestamp, seq = reader.read(pool)
+        assert np.array_equal(pixels, image) and rect == (100, 50, 140, 80) and timestamp == 123.5
+        # 写入前后各加1，完整的一帧序号为偶数
+        assert seq == 2
+        pool.release(pixels)
+        assert np.array_equal(reader.readRegion(Bbox(5, 6, 15, 16)), image[6:16, 5:15])
+        assert reader.windowRect() == (100, 50, 140, 80)
+        assert not reader.stale
+        writer.markStale()
+        assert reader.stale
+    finally:
+        reader.close()
+        writer.close()
+
+def test_slot_read_gives_up_while_writing():
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    writer = _slot(image.size)
+    reader = SharedFrameSlot.attach(writer.name)
+    try:
+        with Frame(image.copy(), 1, (0, 0, 4, 4)) as frame:
+            writer.write(frame)
+        # 模拟写入进行到一半：序号为奇数时读取方不返回撕裂的帧
+        writer._header["seq"] += 1
+        assert reader.read(FramePool()) is None
+        assert reader.readRegion(None) is None
+    finally:
+        reader.close()
+        writer.close()
+
+class _NoGrabSource(FrameSource):
+    """批次内不应再次截图"""
+
+    def grabInto(self, hwnd, out, bbox=None):
+        raise AssertionError("不应重新截图")
+
+def test_in_frame_variants_do_not_grab():
+    source = _NoGrabSource()
+    image = np.zeros((400, 300, 3), dtype=np.uint8)
+    with Frame(image, 1, (0, 0, 300, 400)) as frame:
+        result = ImageMatch(1, source).classifySceneInFrame(frame, {"地府": ImagePath.auto_return.di_fu})
+        assert result.scene is None and set(result.scores) == {"地府"}
+        ratios = ColorDetector(source).getPartyHPRatioInFrame(frame)
+        assert ratios.shape == (7,) and not ratios.any()